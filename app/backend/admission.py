@@ -0,0 +1,136 @@
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable
+
+from opentelemetry import metrics, trace
+
+from settings.chat_bot_settings import ChatbotSettings
+
+meter = metrics.get_meter("chatbot.admission")
+queue_wait_time = meter.create_histogram(
+    "chatbot.admission.queue_wait_time",
+    unit="ms",
+    description="Time questions waited in the queue before their chain started",
+)
+rejections = meter.create_counter(
+    "chatbot.admission.rejections",
+    description="Questions turned away because the wait queue was full",
+)
+in_flight_chains = meter.create_up_down_counter(
+    "chatbot.admission.in_flight",
+    description="Chains running in this worker",
+)
+queued_questions = meter.create_up_down_counter(
+    "chatbot.admission.queued",
+    description="Questions waiting for a chain in this worker",
+)
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class Waiter:
+    def __init__(self):
+        self.admitted = False
+        self.changed = asyncio.Event()
+
+
+class AdmissionController:
+    """
+    Limits the chains running at once in a worker. Questions beyond the limit wait
+    in a first come first served queue and are told their position each time it
+    changes, and every update interval while it does not. Once the queue is full
+    further questions are rejected straight away rather than piling more calls
+    onto an upstream that is already saturated.
+    """
+
+    def __init__(self, settings: ChatbotSettings):
+        self.max_in_flight = settings.max_concurrent_chains
+        self.max_queued = settings.max_queued_chains
+        self.update_interval = settings.queue_update_interval
+        self.in_flight = 0
+        self.waiters: deque[Waiter] = deque()
+
+    @asynccontextmanager
+    async def admit(
+        self, on_position: Callable[[int], Awaitable[None]]
+    ) -> AsyncIterator[None]:
+        await self._acquire(on_position)
+        try:
+            yield
+        finally:
+            self._release()
+
+    async def _acquire(self, on_position: Callable[[int], Awaitable[None]]):
+        current_span = trace.get_current_span()
+        if self.in_flight < self.max_in_flight and not self.waiters:
+            self._start()
+            queue_wait_time.record(0)
+            return
+        if len(self.waiters) >= self.max_queued:
+            rejections.add(1)
+            current_span.add_event("chatbot.admission.rejected")
+            raise QueueFullError(
+                f"{len(self.waiters)} questions are already waiting for a chain"
+            )
+
+        waiter = Waiter()
+        self.waiters.append(waiter)
+        queued_questions.add(1)
+        queued = time.perf_counter()
+        current_span.add_event(
+            "chatbot.admission.queued", {"position": len(self.waiters)}
+        )
+        loop = asyncio.get_running_loop()
+        try:
+            told, told_at = None, 0.0
+            while not waiter.admitted:
+                position = self.waiters.index(waiter) + 1
+                # Repeat an unchanged position so the client knows it is still queued
+                if position != told or loop.time() - told_at >= self.update_interval:
+                    told, told_at = position, loop.time()
+                    await on_position(position)
+                    continue
+                # Not wait_for, which can swallow a cancellation that races the event
+                reminder = loop.call_later(self.update_interval, waiter.changed.set)
+                try:
+                    await waiter.changed.wait()
+                finally:
+                    reminder.cancel()
+                waiter.changed.clear()
+        except BaseException:
+            if waiter.admitted:
+                self._release()
+            else:
+                self._leave(waiter)
+            raise
+        wait = time.perf_counter() - queued
+        queue_wait_time.record(wait * 1000)
+        current_span.set_attribute("chatbot.admission.queue_wait_ms", wait * 1000)
+
+    def _start(self):
+        self.in_flight += 1
+        in_flight_chains.add(1)
+
+    def _release(self):
+        self.in_flight -= 1
+        in_flight_chains.add(-1)
+        if self.waiters and self.in_flight < self.max_in_flight:
+            waiter = self.waiters.popleft()
+            queued_questions.add(-1)
+            waiter.admitted = True
+            self._start()
+            waiter.changed.set()
+            self._notify()
+
+    def _leave(self, waiter: Waiter):
+        self.waiters.remove(waiter)
+        queued_questions.add(-1)
+        self._notify()
+
+    def _notify(self):
+        for waiter in self.waiters:
+            waiter.changed.set()
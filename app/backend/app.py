@@ -1,70 +1,257 @@
+import asyncio
+import gc
+import importlib
+import logging
 import os
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
 import boto3
-import botocore.exceptions
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
-from fastapi.staticfiles import StaticFiles
 import uvicorn
 from opentelemetry import trace
-from query.question_handler import QuestionHandler
-from settings.chat_bot_settings import ChatbotSettings
-from messageData import MessageData
-from query.llm_chain_factory import LLMChainFactory
-from observability import start_opentelemetry
 from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
-from websockets.exceptions import ConnectionClosed, ConnectionClosedOK
 
-start_opentelemetry.startup()
-tracer = trace.get_tracer("chatbot.app")
+from app_factory import Services, create_app
+from document_store.loading import (
+    get_store_cache,
+    load_document_store,
+    serving_directory,
+)
+from document_store.store_cache import CachedStore, StoreCache
+from settings.chat_bot_settings import ChatbotSettings
+from startup import Startup
 
-botocore.session.get_session()
-with tracer.start_as_current_span("app.startup") as span:
-    settings_filepath = os.getenv("SETTINGS_FILEPATH", "./settings/test_settings.yaml")
-    settings = ChatbotSettings.from_yaml(settings_filepath)
+if TYPE_CHECKING:
+    from document_store.bm25 import BM25Index
+    from document_store.vector_index import MmapVectorStore
 
-    app = FastAPI()
+settings_filepath = os.getenv("SETTINGS_FILEPATH", "./settings/test_settings.yaml")
+settings = ChatbotSettings.from_yaml(settings_filepath)
 
-    vector_store = LLMChainFactory.get_vector_store(settings)
+# Set by gunicorn.conf.py when this module is imported once by the master process,
+# which then forks the workers
+preloading = os.getenv("PRELOAD_APP") == "true"
 
-    messageDataTable = MessageData(
-        boto3.resource("dynamodb", region_name=settings.database_region).Table(
-            settings.database_name_message
-        ),
-        settings,
+# Only what the server needs to start accepting connections is imported above,
+# langchain and chromadb are imported by the startup phases
+startup = Startup(
+    [
+        "import.langchain",
+        "import.chromadb",
+        "import.chain",
+        "document_store",
+        "indexes",
+        "templates",
+        "telemetry",
+        "clients",
+        "vector_store",
+        "chain",
+        "message_writer",
+    ]
+)
+
+LANGCHAIN_MODULES = [
+    "langchain.chains",
+    "langchain.chat_models",
+    "langchain.llms",
+    "langchain.embeddings",
+]
+CHAIN_MODULES = [
+    "captcha",
+    "admission",
+    "sessions",
+    "messageData",
+    "message_writer",
+    "conversation_store",
+    "query.llm_chain_factory",
+    "query.question_handler",
+]
+
+
+@dataclass
+class Preloaded:
+    """What every worker can share, loaded before the clients each one needs."""
+
+    document_store: CachedStore
+    newer_store: dict | None
+    vector_index: "MmapVectorStore | None"
+    lexical_index: "BM25Index | None"
+
+
+def start_telemetry():
+    # pylint: disable-next=import-outside-toplevel
+    from observability import start_opentelemetry
+
+    start_opentelemetry.startup(settings)
+
+
+def import_all(modules: list[str]):
+    for module in modules:
+        importlib.import_module(module)
+
+
+def fetch_document_store() -> tuple[CachedStore, dict | None]:
+    document_store, newer_store = load_document_store(
+        settings, get_store_cache(settings)
     )
+    span = trace.get_current_span()
+    span.set_attribute("chatbot.document_store.version", document_store.version)
+    span.set_attribute("chatbot.document_store.stale", newer_store is not None)
+    return document_store, newer_store
 
-    question_handler = QuestionHandler(vector_store, settings, messageDataTable)
 
+def load_indexes(document_store: CachedStore):
+    # pylint: disable-next=import-outside-toplevel
+    from query.llm_chain_factory import LLMChainFactory
+
+    lexical_index = LLMChainFactory.get_lexical_index(
+        settings, document_store.directory
+    )
+    if lexical_index is not None:
+        lexical_index.load()
+    return (
+        LLMChainFactory.preload_vector_index(settings, document_store.directory),
+        lexical_index,
+    )
 
-@tracer.start_as_current_span("app.chat")
-@app.websocket("/chat")
-async def websocket_endpoint(websocket: WebSocket):
-    await websocket.accept()
+
+def warm_templates():
+    # pylint: disable=import-outside-toplevel
+    import tiktoken
+
+    from query.llm_chain_factory import LLMChainFactory
+
+    LLMChainFactory.get_chat_prompt_template(settings)
     try:
-        task = question_handler.handle_question(websocket)
-        await task
-    except (WebSocketDisconnect, ConnectionClosed, ConnectionClosedOK) as e:
-        current_span = trace.get_current_span()
-        current_span.add_event(
-            "websocket closed by client", {"reason": e.reason, "code": e.code}
+        tiktoken.encoding_for_model(settings.model_name)
+    except Exception as e:  # pylint: disable=broad-exception-caught
+        # The context packer loads it on first use instead
+        trace.get_current_span().record_exception(e)
+        logging.getLogger().warning("Couldn't load the token encoding: %s", e)
+
+
+def preload() -> Preloaded:
+    """
+    Load everything the workers can share in the master process, before gunicorn
+    forks them, so they share one copy of the pages copy on write rather than
+    each importing langchain, fetching the document store and loading the indexes.
+    Nothing that holds a connection or a thread is made here.
+    """
+    with startup.phase("import.langchain"):
+        import_all(LANGCHAIN_MODULES)
+    with startup.phase("import.chromadb"):
+        import_all(["chromadb"])
+    with startup.phase("import.chain"):
+        import_all(CHAIN_MODULES)
+    with startup.phase("document_store"):
+        document_store, newer_store = fetch_document_store()
+    with startup.phase("indexes"):
+        vector_index, lexical_index = load_indexes(document_store)
+    with startup.phase("templates"):
+        warm_templates()
+    # Keep the garbage collector from writing to, and so copying, every page of
+    # objects made so far each time it runs in a worker
+    gc.freeze()
+    return Preloaded(document_store, newer_store, vector_index, lexical_index)
+
+
+async def load_shared() -> Preloaded:
+    """What preload loads, when there is no master process to load it."""
+    if preloaded is not None:
+        return preloaded
+
+    async def import_modules():
+        await startup.run("import.langchain", import_all, LANGCHAIN_MODULES)
+        await startup.run("import.chromadb", import_all, ["chromadb"])
+        await startup.run("import.chain", import_all, CHAIN_MODULES)
+
+    # Importing is bound by the CPU and fetching the store by the network, so
+    # they overlap
+    _, (document_store, newer_store) = await asyncio.gather(
+        import_modules(), startup.run("document_store", fetch_document_store)
+    )
+    vector_index, lexical_index = await startup.run(
+        "indexes", load_indexes, document_store
+    )
+    await startup.run("templates", warm_templates)
+    return Preloaded(document_store, newer_store, vector_index, lexical_index)
+
+
+def connect_clients():
+    """The DynamoDB table and the S3 client used to fetch newer document stores."""
+    table = boto3.resource(
+        "dynamodb",
+        region_name=settings.database_region,
+        endpoint_url=settings.database_endpoint_url,
+    ).Table(settings.database_name_message)
+    return table, get_store_cache(settings)
+
+
+def open_vector_store(shared: Preloaded, store_cache: StoreCache):
+    # pylint: disable-next=import-outside-toplevel
+    from query.llm_chain_factory import LLMChainFactory
+
+    return LLMChainFactory.get_vector_store(
+        settings,
+        serving_directory(settings, store_cache, shared.document_store),
+        shared.vector_index,
+    )
+
+
+async def load_services(app_startup: Startup) -> Services:
+    # pylint: disable=import-outside-toplevel
+    # Telemetry's exporters run threads and hold connections, so each worker
+    # starts its own
+    with app_startup.phase("telemetry"):
+        start_telemetry()
+    app_startup.telemetry_started()
+
+    shared, (table, store_cache) = await asyncio.gather(
+        load_shared(), app_startup.run("clients", connect_clients)
+    )
+
+    from captcha import CaptchaVerifier
+    from messageData import MessageData
+    from message_writer import MessageWriter
+    from query.llm_chain_factory import LLMChainFactory
+    from query.question_handler import QuestionHandler
+
+    vector_store = await app_startup.run(
+        "vector_store", open_vector_store, shared, store_cache
+    )
+
+    with app_startup.phase("chain"):
+        message_writer = MessageWriter(MessageData(table, settings), settings)
+        captcha_verifier = CaptchaVerifier(settings)
+        llm_chain_factory = await asyncio.to_thread(
+            LLMChainFactory,
+            message_writer,
+            vector_store,
+            settings,
+            shared.document_store.version,
+            lexical_index=shared.lexical_index,
         )
-    except Exception as e:
-        current_span = trace.get_current_span()
-        current_span.record_exception(e)
-        resp = {
-            "sender": "bot",
-            "message": "Sorry, something went wrong. Try again.",
-            "type": "error",
-        }
-        await websocket.send_json(resp)
-    finally:
-        task.close()
-        await websocket.close()
-
-
-app.mount(
-    "/", StaticFiles(directory=settings.build_directory, html=True), name="static"
-)
+        question_handler = QuestionHandler.create(
+            settings, llm_chain_factory, captcha_verifier
+        )
+
+    return Services(
+        question_handler,
+        message_writer,
+        captcha_verifier,
+        store_cache,
+        shared.newer_store,
+    )
+
+
+preloaded = None
+if preloading:
+    preloaded = preload()
+    # The clients made while preloading share the default session, give each
+    # worker its own rather than connection pools copied from the master
+    os.register_at_fork(after_in_child=boto3.setup_default_session)
 
+app = create_app(settings, load_services, startup)
 FastAPIInstrumentor.instrument_app(app)
 
 if __name__ == "__main__":
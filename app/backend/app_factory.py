@@ -0,0 +1,165 @@
+import asyncio
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Awaitable, Callable
+
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse
+from fastapi.staticfiles import StaticFiles
+from starlette.websockets import WebSocketState
+from opentelemetry import trace
+from websockets.exceptions import ConnectionClosed, ConnectionClosedOK
+
+from settings.chat_bot_settings import ChatbotSettings
+from startup import Startup
+
+# Only imported for type checking, importing them loads langchain which is the
+# slowest part of startup and is left to the startup phases
+if TYPE_CHECKING:
+    from captcha import CaptchaVerifier
+    from document_store.store_cache import StoreCache
+    from message_writer import MessageWriter
+    from query.question_handler import QuestionHandler
+
+tracer = trace.get_tracer("chatbot.app")
+
+
+@dataclass
+class Services:
+    question_handler: "QuestionHandler"
+    message_writer: "MessageWriter"
+    captcha_verifier: "CaptchaVerifier"
+    store_cache: "StoreCache | None" = None
+    newer_store: dict | None = None
+
+
+async def swap_document_store(
+    settings: ChatbotSettings, services: Services, manifest: dict
+):
+    """Fetch a newer document store and start answering questions from it."""
+    # pylint: disable=import-outside-toplevel
+    from document_store.loading import serving_directory
+    from query.llm_chain_factory import LLMChainFactory
+
+    with tracer.start_as_current_span("app.swap_document_store") as span:
+        try:
+            store = await asyncio.to_thread(services.store_cache.fetch, manifest)
+            directory = await asyncio.to_thread(
+                serving_directory, settings, services.store_cache, store
+            )
+            new_vector_store = await asyncio.to_thread(
+                LLMChainFactory.get_vector_store, settings, directory
+            )
+            services.question_handler.swap_vector_store(
+                new_vector_store,
+                store.version,
+                LLMChainFactory.get_lexical_index(settings, store.directory),
+            )
+            span.set_attribute("chatbot.document_store.version", store.version)
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            span.record_exception(e)
+
+
+def add_health_routes(app: FastAPI, startup: Startup):
+    @app.get("/healthz")
+    async def healthz():
+        """Alive unless a startup phase has failed."""
+        report = startup.report()
+        return JSONResponse(report, 503 if report["status"] == "failed" else 200)
+
+    @app.get("/readyz")
+    async def readyz():
+        """Ready once every startup phase has finished."""
+        report = startup.report()
+        return JSONResponse(report, 200 if report["status"] == "ready" else 503)
+
+
+def create_app(
+    settings: ChatbotSettings,
+    load_services: Callable[[Startup], Awaitable[Services]],
+    startup: Startup | None = None,
+    serve_frontend: bool = True,
+) -> FastAPI:
+    """
+    Build the FastAPI app around dependencies built by load_services, so the same
+    app can be served with the production services or with fakes under load
+    tests. They are built in the background once the server has started, chats
+    wait until they are ready and /healthz and /readyz report the progress.
+    """
+    app = FastAPI()
+    startup = startup or Startup(["services", "message_writer"])
+    background_tasks = set()
+    services: Services | None = None
+
+    def run_in_background(coroutine: Awaitable):
+        task = asyncio.create_task(coroutine)
+        background_tasks.add(task)
+        task.add_done_callback(background_tasks.discard)
+
+    async def start():
+        nonlocal services
+        try:
+            services = await load_services(startup)
+            with startup.phase("message_writer"):
+                await services.message_writer.start()
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            # /healthz reports it so the worker can be replaced
+            startup.fail(e)
+            return
+        startup.finish()
+        if services.newer_store is not None:
+            run_in_background(
+                swap_document_store(settings, services, services.newer_store)
+            )
+
+    @app.on_event("startup")
+    async def start_services():
+        run_in_background(start())
+
+    @app.on_event("shutdown")
+    async def stop_services():
+        for task in list(background_tasks):
+            task.cancel()
+        if services is not None:
+            await services.message_writer.stop()
+            await services.captcha_verifier.aclose()
+
+    add_health_routes(app, startup)
+
+    @tracer.start_as_current_span("app.chat")
+    @app.websocket("/chat")
+    async def websocket_endpoint(websocket: WebSocket):
+        await websocket.accept()
+        task = None
+        try:
+            if not await startup.wait_until_ready():
+                raise RuntimeError("the app failed to start")
+            task = services.question_handler.handle_question(websocket)
+            await task
+        except (WebSocketDisconnect, ConnectionClosed, ConnectionClosedOK) as e:
+            current_span = trace.get_current_span()
+            current_span.add_event(
+                "websocket closed by client", {"reason": e.reason, "code": e.code}
+            )
+        except Exception as e:
+            current_span = trace.get_current_span()
+            current_span.record_exception(e)
+            resp = {
+                "sender": "bot",
+                "message": "Sorry, something went wrong. Try again.",
+                "type": "error",
+            }
+            await websocket.send_json(resp)
+        finally:
+            if task is not None:
+                task.close()
+            # A session ends when the client closes the socket
+            if websocket.client_state == WebSocketState.CONNECTED:
+                await websocket.close()
+
+    if serve_frontend:
+        app.mount(
+            "/",
+            StaticFiles(directory=settings.build_directory, html=True),
+            name="static",
+        )
+    return app
@@ -0,0 +1,76 @@
+"""
+Measure the latency CaptchaVerifier adds on top of the verify endpoint under
+concurrent connections, using a local stub of the reCAPTCHA siteverify API.
+
+    python -m benchmarks.captcha_latency --connections 200 --delay-ms 50
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import uvicorn
+from fastapi import FastAPI
+from fastapi.datastructures import Address
+
+from captcha import CaptchaVerifier
+from settings.chat_bot_settings import ChatbotSettings
+
+
+def make_stub(delay: float) -> FastAPI:
+    stub = FastAPI()
+
+    @stub.post("/siteverify")
+    async def siteverify():
+        await asyncio.sleep(delay)
+        return {"success": True, "hostname": "localhost"}
+
+    return stub
+
+
+async def timed_verify(verifier: CaptchaVerifier) -> float:
+    start = time.perf_counter()
+    await verifier.verify("token", Address("127.0.0.1", 0))
+    return time.perf_counter() - start
+
+
+async def main(connections: int, delay: float, port: int, settings_file: str):
+    server = uvicorn.Server(
+        uvicorn.Config(make_stub(delay), port=port, log_level="warning")
+    )
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+
+    settings = ChatbotSettings.from_yaml(settings_file)
+    settings.captcha_verify_url = f"http://127.0.0.1:{port}/siteverify"
+    verifier = CaptchaVerifier(settings, "secret")
+
+    await timed_verify(verifier)
+    start = time.perf_counter()
+    latencies = await asyncio.gather(
+        *[timed_verify(verifier) for _ in range(connections)]
+    )
+    elapsed = time.perf_counter() - start
+
+    await verifier.aclose()
+    server.should_exit = True
+    await server_task
+
+    latencies = sorted(latency - delay for latency in latencies)
+    print(f"connections:       {connections}")
+    print(f"stub delay:        {delay * 1000:.1f} ms")
+    print(f"wall clock:        {elapsed * 1000:.1f} ms")
+    print(f"added latency p50: {statistics.median(latencies) * 1000:.1f} ms")
+    print(f"added latency p95: {latencies[int(len(latencies) * 0.95)] * 1000:.1f} ms")
+    print(f"added latency max: {latencies[-1] * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--connections", type=int, default=100)
+    parser.add_argument("--delay-ms", type=float, default=50)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--settings", default="./settings/test_settings.yaml")
+    args = parser.parse_args()
+    asyncio.run(main(args.connections, args.delay_ms / 1000, args.port, args.settings))
@@ -0,0 +1,48 @@
+"""
+Compare the per question setup cost of building a new chain for every question
+with attaching run level callbacks to the chain built once at startup.
+
+    python -m benchmarks.chain_setup --iterations 200
+"""
+import argparse
+import os
+import timeit
+
+from langchain.embeddings import FakeEmbeddings
+from langchain.vectorstores.chroma import Chroma
+
+from query.llm_chain_factory import LLMChainFactory
+from settings.chat_bot_settings import ChatbotSettings
+
+
+def main(iterations: int, settings_file: str):
+    os.environ.setdefault("OPENAI_API_KEY", "FAKE_API_KEY")
+    settings = ChatbotSettings.from_yaml(settings_file)
+    vector_store = Chroma(
+        collection_name="benchmark", embedding_function=FakeEmbeddings(size=8)
+    )
+    factory = LLMChainFactory(None, vector_store, settings)
+
+    def per_question_chain():
+        LLMChainFactory.get_chat_prompt_template(settings)
+        factory.build_chain()
+        factory.make_callbacks(None, None)
+
+    def shared_chain():
+        factory.make_callbacks(None, None)
+
+    before = timeit.timeit(per_question_chain, number=iterations) / iterations
+    after = timeit.timeit(shared_chain, number=iterations) / iterations
+
+    print(f"iterations:                  {iterations}")
+    print(f"chain built per question:    {before * 1e6:10.1f} us/question")
+    print(f"shared chain, run callbacks: {after * 1e6:10.1f} us/question")
+    print(f"speed up:                    {before / after:10.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--settings", default="./settings/test_settings.yaml")
+    args = parser.parse_args()
+    main(args.iterations, args.settings)
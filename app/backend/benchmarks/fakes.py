@@ -0,0 +1,326 @@
+"""
+Offline stand ins for the services the chat app depends on, used to serve the
+real app under load without OpenAI, DynamoDB, reCAPTCHA or a document store.
+"""
+import asyncio
+import dataclasses
+import random
+import re
+import time
+import uuid
+import zlib
+from types import SimpleNamespace
+from typing import Any, List, Optional
+
+import chromadb.config
+import httpx
+from fastapi import FastAPI
+from langchain.callbacks.manager import (
+    AsyncCallbackManagerForLLMRun,
+    CallbackManagerForLLMRun,
+)
+from langchain.chat_models.base import BaseChatModel
+from langchain.embeddings import DeterministicFakeEmbedding
+from langchain.llms.base import LLM
+from langchain.schema import AIMessage, BaseMessage, ChatGeneration, ChatResult
+
+from app_factory import Services, create_app
+from captcha import CaptchaVerifier
+from document_store.chroma_store import MmrChroma
+from messageData import MessageData
+from message_writer import MessageWriter
+from query.context_packer import ContextPacker
+from query.llm_chain_factory import LLMChainFactory
+from query.question_handler import QuestionHandler
+from settings.chat_bot_settings import ChatbotSettings
+from startup import Startup
+
+WORDS = (
+    "lighthouse fleet membership portal website party local members data export "
+    "campaign canvassing login password reset permissions report volunteers"
+).split()
+
+
+@dataclasses.dataclass
+class FakeServices:  # pylint: disable=too-many-instance-attributes
+    """Latencies and sizes of the fake services, in seconds where timed."""
+
+    first_token_latency: float = 0.3
+    tokens_per_second: float = 50
+    answer_tokens: int = 150
+    condense_latency: float = 0.2
+    embed_latency: float = 0.02
+    captcha_latency: float = 0.1
+    documents: int = 2000
+    dimensions: int = 256
+
+
+class FakeStreamingChatModel(BaseChatModel):
+    """Streams a fixed answer at a steady rate after a first token latency."""
+
+    answer: str
+    first_token_latency: float
+    tokens_per_second: float
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-streaming-chat"
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        raise NotImplementedError("FakeStreamingChatModel only runs asynchronously")
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        await asyncio.sleep(self.first_token_latency)
+        for token in re.findall(r"\s*\S+", self.answer):
+            if run_manager is not None:
+                await run_manager.on_llm_new_token(token)
+            await asyncio.sleep(1 / self.tokens_per_second)
+        return ChatResult(
+            generations=[ChatGeneration(message=AIMessage(content=self.answer))]
+        )
+
+
+class FakeCondenseLLM(LLM):
+    """
+    Returns the follow up question from the condense prompt, or a fixed summary
+    for the conversation summary prompt, after a delay.
+    """
+
+    latency: float
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-condense"
+
+    @staticmethod
+    def respond(prompt: str) -> str:
+        if prompt.rstrip().endswith("New summary:"):
+            return "The human asks how to use lighthouse."
+        return prompt.split("Follow Up Input:")[-1].split("Standalone question:")[0]
+
+    def _call(self, prompt: str, stop=None, run_manager=None, **kwargs) -> str:
+        time.sleep(self.latency)
+        return self.respond(prompt).strip()
+
+    async def _acall(self, prompt: str, stop=None, run_manager=None, **kwargs) -> str:
+        await asyncio.sleep(self.latency)
+        return self.respond(prompt).strip()
+
+
+class SlowFakeEmbedding(DeterministicFakeEmbedding):
+    """Deterministic embeddings that take as long as a call to the API would."""
+
+    latency: float = 0.0
+
+    def embed_query(self, text: str) -> List[float]:
+        time.sleep(self.latency)
+        return super().embed_query(text)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        await asyncio.sleep(self.latency)
+        return super().embed_query(text)
+
+
+class WhitespaceEncoding:
+    """Counts words as tokens so the context packer needs no tiktoken download."""
+
+    def encode(self, text: str) -> List[str]:
+        return text.split()
+
+    def decode(self, tokens: List[str]) -> str:
+        return " ".join(tokens)
+
+
+class InMemoryDynamoClient:
+    def __init__(self):
+        self.items: dict[str, dict] = {}
+
+    def batch_write_item(self, RequestItems: dict):  # pylint: disable=invalid-name
+        for requests in RequestItems.values():
+            for request in requests:
+                item = request["PutRequest"]["Item"]
+                self.items[item["messageId"]] = item
+        return {"UnprocessedItems": {}}
+
+
+def make_table(name: str):
+    client = InMemoryDynamoClient()
+
+    def put_item(Item: dict):  # pylint: disable=invalid-name
+        client.items[Item["messageId"]] = Item
+
+    def get_item(Key: dict):  # pylint: disable=invalid-name
+        item = client.items.get(Key["messageId"])
+        return {} if item is None else {"Item": item}
+
+    def scan(  # pylint: disable=invalid-name
+        Segment: int = 0,
+        TotalSegments: int = 1,
+        ExclusiveStartKey: dict | None = None,
+        Limit: int = 100,
+        **kwargs,
+    ):
+        keys = sorted(
+            key
+            for key in client.items
+            if zlib.crc32(key.encode()) % TotalSegments == Segment
+        )
+        start = 0
+        if ExclusiveStartKey is not None:
+            start = keys.index(ExclusiveStartKey["messageId"]) + 1
+        page = keys[start : start + Limit]
+        response = {"Items": [client.items[key] for key in page]}
+        if start + Limit < len(keys):
+            response["LastEvaluatedKey"] = {"messageId": page[-1]}
+        return response
+
+    return SimpleNamespace(
+        name=name,
+        meta=SimpleNamespace(client=client),
+        put_item=put_item,
+        get_item=get_item,
+        scan=scan,
+    )
+
+
+FREQUENT_QUESTIONS = [
+    "How do I export members from Lighthouse?",
+    "How do I reset my Lighthouse password?",
+    "How do I add a new page to my Fleet website?",
+    "Who can give me access to Lighthouse?",
+    "How do I change the logo on our Fleet site?",
+    "How do I download a canvassing list?",
+    "Why can't I log in to Lighthouse?",
+    "How do I add a volunteer to Lighthouse?",
+    "How do I publish a news story on Fleet?",
+    "How do I see who has renewed their membership?",
+]
+
+
+def seed_question_history(table, conversations: int, seed: int = 0):
+    """
+    Write conversations whose first questions follow a long tail like real
+    traffic, a few frequent questions asked in slightly different ways and many
+    asked once.
+    """
+    rng = random.Random(seed)
+    now = int(time.time() * 1000)
+    for number in range(conversations):
+        rank = min(int(rng.paretovariate(1.0)) - 1, len(FREQUENT_QUESTIONS) * 3)
+        if rank < len(FREQUENT_QUESTIONS):
+            text = FREQUENT_QUESTIONS[rank]
+            text = rng.choice([text, text.lower(), text.rstrip("?")])
+        else:
+            text = f"Something rarely asked number {number}?"
+        previous = "null"
+        for turn in range(rng.randint(1, 3)):
+            question_id, answer_id = str(uuid.uuid4()), str(uuid.uuid4())
+            content = text if turn == 0 else f"And a follow up {turn}?"
+            for item in (
+                {
+                    "messageId": question_id,
+                    "userId": f"user-{number}",
+                    "message": content,
+                    "previousMessageId": previous,
+                },
+                {
+                    "messageId": answer_id,
+                    "userId": "AI",
+                    "message": "An answer.",
+                    "previousMessageId": question_id,
+                },
+            ):
+                table.put_item(Item={**item, "sources": [], "time": now + number})
+            previous = answer_id
+
+
+def make_vector_store(services: FakeServices) -> MmrChroma:
+    embedding = SlowFakeEmbedding(
+        size=services.dimensions, latency=services.embed_latency
+    )
+    vector_store = MmrChroma(
+        collection_name=f"load-test-{uuid.uuid4().hex[:8]}",
+        embedding_function=embedding,
+        # Keeps Chroma's telemetry from reaching for the network during a run
+        client_settings=chromadb.config.Settings(anonymized_telemetry=False),
+    )
+    texts = [
+        " ".join(WORDS[(i * 7 + j) % len(WORDS)] for j in range(40)) + f" page {i}"
+        for i in range(services.documents)
+    ]
+    vectors = DeterministicFakeEmbedding(size=services.dimensions).embed_documents(
+        texts
+    )
+    metadatas = [
+        {"name": f"page {i}", "tokens": len(text.split())}
+        for i, text in enumerate(texts)
+    ]
+    # pylint: disable-next=protected-access
+    collection = vector_store._collection
+    for start in range(0, len(texts), 1000):
+        end = start + 1000
+        collection.add(
+            ids=[str(i) for i in range(start, min(end, len(texts)))],
+            embeddings=vectors[start:end],
+            documents=texts[start:end],
+            metadatas=metadatas[start:end],
+        )
+    return vector_store
+
+
+def make_chain_factory(
+    settings: ChatbotSettings,
+    services: FakeServices,
+    message_writer: MessageWriter | None = None,
+) -> LLMChainFactory:
+    answer = " ".join(WORDS[i % len(WORDS)] for i in range(services.answer_tokens))
+    return LLMChainFactory(
+        message_writer,
+        make_vector_store(services),
+        settings,
+        "load-test",
+        question_llm=FakeCondenseLLM(latency=services.condense_latency),
+        answer_llm=FakeStreamingChatModel(
+            answer=answer,
+            first_token_latency=services.first_token_latency,
+            tokens_per_second=services.tokens_per_second,
+        ),
+        context_packer=ContextPacker(settings, WhitespaceEncoding()),
+    )
+
+
+def create_fake_app(settings: ChatbotSettings, services: FakeServices) -> FastAPI:
+    """The chat app wired to fake services."""
+    message_writer = MessageWriter(
+        MessageData(make_table(settings.database_name_message), settings), settings
+    )
+
+    async def verify_captcha(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(services.captcha_latency)
+        return httpx.Response(200, json={"success": True})
+
+    captcha_verifier = CaptchaVerifier(
+        settings, "secret", transport=httpx.MockTransport(verify_captcha)
+    )
+    llm_chain_factory = make_chain_factory(settings, services, message_writer)
+    question_handler = QuestionHandler.create(
+        settings, llm_chain_factory, captcha_verifier
+    )
+
+    async def load_services(startup: Startup) -> Services:
+        with startup.phase("services"):
+            return Services(question_handler, message_writer, captcha_verifier)
+
+    return create_app(settings, load_services, serve_frontend=False)
@@ -0,0 +1,304 @@
+"""
+Serve the chat app wired to fake services, see benchmarks.fakes, in a separate
+process and hold conversations with it from many concurrent websocket clients.
+Reports time to first token, answer latency, throughput and the server's event
+loop lag. Runs offline. Pass any of the --max/--min limits to exit non zero when
+a run is slower, so it can gate changes. With --sessions each client asks its
+questions as turns of one session on a single socket rather than connecting and
+passing the captcha for every question.
+
+    python -m benchmarks.load_test --clients 50 --conversations 4
+    python -m benchmarks.load_test --clients 50 --conversations 4 --sessions
+    python -m benchmarks.load_test --max-ttft-p95-ms 800 --json results.json
+"""
+import argparse
+import asyncio
+import dataclasses
+import json
+import multiprocessing
+import socket
+import statistics
+import sys
+import time
+import uuid
+
+import uvicorn
+import websockets
+
+from benchmarks.fakes import FakeServices, create_fake_app
+from benchmarks.stream_load import monitor_lag
+from settings.chat_bot_settings import ChatbotSettings
+
+
+@dataclasses.dataclass
+class Conversation:
+    time_to_first_token: float | None = None
+    latency: float | None = None
+    frames: int = 0
+    error: str | None = None
+
+
+def serve(settings, services, port: int, lags_queue: multiprocessing.Queue):
+    app = create_fake_app(settings, services)
+    lags: list[float] = []
+    monitor = []
+
+    @app.on_event("startup")
+    async def start_lag_monitor():
+        monitor.append(asyncio.create_task(monitor_lag(lags)))
+
+    @app.on_event("shutdown")
+    async def report_lag():
+        monitor[0].cancel()
+        lags_queue.put(lags)
+
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning")
+
+
+def wait_for_port(port: int, timeout: float = 120):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        with socket.socket() as sock:
+            if sock.connect_ex(("127.0.0.1", port)) == 0:
+                return
+        time.sleep(0.1)
+    raise TimeoutError(f"server did not start on port {port}")
+
+
+def question_payload(number: int, follow_up: bool) -> dict:
+    now = int(time.time() * 1000)
+    first_id = str(uuid.uuid4())
+    messages = [
+        {
+            "type": "human",
+            "content": f"How do I export members from lighthouse? ({number})",
+            "messageId": first_id,
+            "previousMessageId": "null",
+            "userId": "load-test",
+            "time": now,
+        }
+    ]
+    if follow_up:
+        answer_id = str(uuid.uuid4())
+        messages += [
+            {
+                "type": "ai",
+                "content": "Use the export button on the members page.",
+                "messageId": answer_id,
+                "previousMessageId": first_id,
+                "userId": "AI",
+                "time": now,
+            },
+            {
+                "type": "human",
+                "content": f"And how do I reset a password? ({number})",
+                "messageId": str(uuid.uuid4()),
+                "previousMessageId": answer_id,
+                "userId": "load-test",
+                "time": now,
+            },
+        ]
+    return {"captcha": "load-test", "messages": messages}
+
+
+async def receive_answer(websocket, conversation: Conversation, start: float):
+    async for raw in websocket:
+        frame = json.loads(raw)
+        conversation.frames += 1
+        if frame["type"] == "stream" and conversation.time_to_first_token is None:
+            conversation.time_to_first_token = time.perf_counter() - start
+        elif frame["type"] == "end":
+            conversation.latency = time.perf_counter() - start
+            return
+        elif frame["type"] == "error":
+            conversation.error = frame["message"]
+            return
+
+
+async def converse(url: str, number: int, follow_up: bool) -> Conversation:
+    conversation = Conversation()
+    start = time.perf_counter()
+    try:
+        async with websockets.connect(url, max_queue=None) as websocket:
+            await websocket.send(json.dumps(question_payload(number, follow_up)))
+            await receive_answer(websocket, conversation, start)
+    except (OSError, websockets.WebSocketException) as e:
+        conversation.error = repr(e)
+    return conversation
+
+
+async def converse_in_session(url: str, number: int, turns: int) -> list[Conversation]:
+    """Ask each question as a turn of one session, sending only the new message."""
+    conversations = [Conversation() for _ in range(turns)]
+    # The first turn includes connecting, as every turn does without a session
+    start = time.perf_counter()
+    try:
+        async with websockets.connect(url, max_queue=None) as websocket:
+            for turn, conversation in enumerate(conversations):
+                payload = question_payload(number * turns + turn, False)
+                if turn == 0:
+                    payload["session"] = True
+                else:
+                    del payload["captcha"]
+                await websocket.send(json.dumps(payload))
+                await receive_answer(websocket, conversation, start)
+                start = time.perf_counter()
+    except (OSError, websockets.WebSocketException) as e:
+        for conversation in conversations:
+            if conversation.latency is None and conversation.error is None:
+                conversation.error = repr(e)
+    return conversations
+
+
+async def drive(
+    url: str, clients: int, conversations: int, follow_ups: float, sessions: bool
+):
+    counter = iter(range(clients if sessions else clients * conversations))
+    results: list[Conversation] = []
+
+    async def client():
+        for number in counter:
+            if sessions:
+                results.extend(await converse_in_session(url, number, conversations))
+                continue
+            follow_up = (number % 100) < follow_ups * 100
+            results.append(await converse(url, number, follow_up))
+
+    start = time.perf_counter()
+    await asyncio.gather(*[client() for _ in range(clients)])
+    return results, time.perf_counter() - start
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def summarise(results: list[Conversation], elapsed: float, lags: list[float]) -> dict:
+    answered = [result for result in results if result.latency is not None]
+    ttfts = [r.time_to_first_token for r in answered if r.time_to_first_token]
+    latencies = [result.latency for result in answered]
+    summary = {
+        "conversations": len(results),
+        "errors": len(results) - len(answered),
+        "throughput_per_second": len(answered) / elapsed,
+        "frames_per_answer": statistics.mean(r.frames for r in answered)
+        if answered
+        else 0,
+    }
+    for name, values in (("ttft", ttfts), ("latency", latencies), ("lag", lags)):
+        if values:
+            summary[f"{name}_p50_ms"] = percentile(values, 0.5) * 1000
+            summary[f"{name}_p95_ms"] = percentile(values, 0.95) * 1000
+            summary[f"{name}_p99_ms"] = percentile(values, 0.99) * 1000
+            summary[f"{name}_max_ms"] = max(values) * 1000
+    return summary
+
+
+def failed_gates(summary: dict, args) -> list[str]:
+    gates = [
+        ("ttft_p95_ms", args.max_ttft_p95_ms, max),
+        ("latency_p95_ms", args.max_latency_p95_ms, max),
+        ("lag_p99_ms", args.max_lag_p99_ms, max),
+        ("throughput_per_second", args.min_throughput, min),
+        ("errors", args.max_errors, max),
+    ]
+    failures = []
+    for key, limit, kind in gates:
+        if limit is None:
+            continue
+        value = summary.get(key, float("inf"))
+        if (kind is max and value > limit) or (kind is min and value < limit):
+            failures.append(f"{key} {value:.1f} is beyond the limit of {limit}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--conversations", type=int, default=4)
+    parser.add_argument(
+        "--follow-ups", type=float, default=0.5, help="share of follow up questions"
+    )
+    parser.add_argument("--first-token-ms", type=float, default=300)
+    parser.add_argument("--tokens-per-second", type=float, default=50)
+    parser.add_argument("--answer-tokens", type=int, default=150)
+    parser.add_argument("--condense-ms", type=float, default=200)
+    parser.add_argument("--embed-ms", type=float, default=20)
+    parser.add_argument("--captcha-ms", type=float, default=100)
+    parser.add_argument(
+        "--sessions",
+        action="store_true",
+        help="ask each client's conversations as turns of one session",
+    )
+    parser.add_argument("--documents", type=int, default=2000)
+    parser.add_argument("--semantic-cache", action="store_true")
+    parser.add_argument("--max-concurrent-chains", type=int, default=20)
+    parser.add_argument("--max-queued-chains", type=int, default=100)
+    parser.add_argument("--port", type=int, default=8767)
+    parser.add_argument("--settings", default="./settings/test_settings.yaml")
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--max-ttft-p95-ms", type=float)
+    parser.add_argument("--max-latency-p95-ms", type=float)
+    parser.add_argument("--max-lag-p99-ms", type=float)
+    parser.add_argument("--min-throughput", type=float)
+    parser.add_argument("--max-errors", type=int)
+    args = parser.parse_args()
+
+    settings = dataclasses.replace(
+        ChatbotSettings.from_yaml(args.settings),
+        semantic_cache_enabled=args.semantic_cache,
+        max_concurrent_chains=args.max_concurrent_chains,
+        max_queued_chains=args.max_queued_chains,
+        telemetry_profile="off",
+    )
+    services = FakeServices(
+        first_token_latency=args.first_token_ms / 1000,
+        tokens_per_second=args.tokens_per_second,
+        answer_tokens=args.answer_tokens,
+        condense_latency=args.condense_ms / 1000,
+        embed_latency=args.embed_ms / 1000,
+        captcha_latency=args.captcha_ms / 1000,
+        documents=args.documents,
+    )
+
+    lags_queue = multiprocessing.Queue()
+    server = multiprocessing.Process(
+        target=serve, args=(settings, services, args.port, lags_queue)
+    )
+    server.start()
+    try:
+        wait_for_port(args.port)
+        results, elapsed = asyncio.run(
+            drive(
+                f"ws://127.0.0.1:{args.port}/chat",
+                args.clients,
+                args.conversations,
+                args.follow_ups,
+                args.sessions,
+            )
+        )
+    finally:
+        server.terminate()
+    lags = lags_queue.get(timeout=30)
+    server.join()
+
+    summary = summarise(results, elapsed, lags)
+    for key, value in summary.items():
+        print(
+            f"{key:>24}: {value:.1f}"
+            if isinstance(value, float)
+            else f"{key:>24}: {value}"
+        )
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as json_file:
+            json.dump(summary, json_file, indent=2)
+
+    failures = failed_gates(summary, args)
+    for failure in failures:
+        print(f"FAILED {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
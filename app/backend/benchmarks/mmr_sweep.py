@@ -0,0 +1,70 @@
+"""
+Sweep fetch_k and k over a synthetic corpus the size of the news archive and
+time MMR retrieval, candidate selection followed by diversity selection, with
+the generic langchain implementation and with document_store.mmr.
+
+    python -m benchmarks.mmr_sweep --documents 30000 --queries 20
+"""
+import argparse
+import time
+
+import numpy as np
+from langchain.vectorstores.utils import (
+    maximal_marginal_relevance as generic_maximal_marginal_relevance,
+)
+from store_format.vector_index import normalise
+
+from document_store.mmr import maximal_marginal_relevance, top_k
+
+
+def generic(vectors, query, k, fetch_k):
+    candidates = vectors[top_k(vectors @ query, fetch_k)]
+    return generic_maximal_marginal_relevance(query, candidates, k=k)
+
+
+def vectorised(vectors, query, k, fetch_k):
+    candidates = vectors[top_k(vectors @ query, fetch_k)]
+    return maximal_marginal_relevance(query, candidates, k)
+
+
+def time_queries(search, vectors, queries, k, fetch_k) -> float:
+    start = time.perf_counter()
+    for query in queries:
+        search(vectors, query, k, fetch_k)
+    return (time.perf_counter() - start) / len(queries)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--documents", type=int, default=30000)
+    parser.add_argument("--dimensions", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--fetch-k", type=int, nargs="+", default=[20, 100, 500, 2000])
+    parser.add_argument("--k", type=int, nargs="+", default=[4, 8, 16])
+    parser.add_argument(
+        "--generic-limit",
+        type=int,
+        default=500,
+        help="skip the generic implementation above this fetch_k, it is quadratic",
+    )
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors = normalise(rng.standard_normal((args.documents, args.dimensions)))
+    queries = normalise(rng.standard_normal((args.queries, args.dimensions)))
+
+    print(f"documents {args.documents} dimensions {args.dimensions}")
+    print(f"{'fetch_k':>8} {'k':>4} {'generic ms':>12} {'vectorised ms':>14}")
+    for fetch_k in args.fetch_k:
+        for k in args.k:
+            ours = time_queries(vectorised, vectors, queries, k, fetch_k)
+            theirs = (
+                f"{time_queries(generic, vectors, queries, k, fetch_k) * 1e3:12.2f}"
+                if fetch_k <= args.generic_limit
+                else f"{'skipped':>12}"
+            )
+            print(f"{fetch_k:>8} {k:>4} {theirs} {ours * 1e3:14.2f}")
+
+
+if __name__ == "__main__":
+    main()
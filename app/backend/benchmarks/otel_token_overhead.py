@@ -0,0 +1,101 @@
+"""
+Time OpentelemetryCallback per streamed token with a real tracer and meter
+provider, comparing a span event per token, as the callback used to add, with the
+aggregated measurements and with sampled token events.
+
+    python -m benchmarks.otel_token_overhead --answers 200 --tokens 300
+"""
+import argparse
+import asyncio
+import time
+from uuid import uuid4
+
+from langchain.schema.output import LLMResult
+from opentelemetry import metrics
+from opentelemetry.sdk.metrics import MeterProvider
+from opentelemetry.sdk.metrics.export import InMemoryMetricReader
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, SpanExporter
+from opentelemetry.sdk.trace.export import SpanExportResult
+from opentelemetry.trace import get_current_span
+
+from query.callbacks.otel_callback import OpentelemetryCallback
+
+
+class PerTokenEventCallback(OpentelemetryCallback):
+    """The callback as it was, with an event on the span for every token."""
+
+    async def on_llm_new_token(self, token, *, run_id, parent_run_id=None, **kwargs):
+        get_current_span().add_event(
+            "on_llm_new_token",
+            attributes={
+                "chatbot.llms.run_id": str(run_id),
+                "chatbot.llms.parent_run_id": str(parent_run_id),
+            },
+        )
+
+
+class MeasuringExporter(SpanExporter):
+    """Discards spans, counting their events and serialised size."""
+
+    def __init__(self):
+        self.events = 0
+        self.bytes = 0
+
+    def export(self, spans):
+        for span in spans:
+            self.events += len(span.events)
+            self.bytes += len(span.to_json())
+        return SpanExportResult.SUCCESS
+
+
+async def answer(tracer, callback: OpentelemetryCallback, tokens: int) -> float:
+    run_id = uuid4()
+    with tracer.start_as_current_span("app.chat"):
+        await callback.on_chat_model_start({"id": ["ChatOpenAI"]}, [[]], run_id=run_id)
+        start = time.perf_counter()
+        for _ in range(tokens):
+            await callback.on_llm_new_token(" token", run_id=run_id)
+        elapsed = time.perf_counter() - start
+        await callback.on_llm_end(LLMResult(generations=[]), run_id=run_id)
+    return elapsed
+
+
+def measure(name: str, callback: OpentelemetryCallback, answers: int, tokens: int):
+    exporter = MeasuringExporter()
+    provider = TracerProvider()
+    provider.add_span_processor(BatchSpanProcessor(exporter))
+    tracer = provider.get_tracer("benchmark")
+
+    async def run():
+        return sum([await answer(tracer, callback, tokens) for _ in range(answers)])
+
+    elapsed = asyncio.run(run())
+    provider.shutdown()
+    print(
+        f"{name:>22} {elapsed / (answers * tokens) * 1e6:10.2f}"
+        f" {exporter.events / answers:10.0f} {exporter.bytes / answers / 1024:10.1f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--answers", type=int, default=200)
+    parser.add_argument("--tokens", type=int, default=300)
+    parser.add_argument("--sample-interval", type=int, default=50)
+    args = parser.parse_args()
+
+    metrics.set_meter_provider(MeterProvider(metric_readers=[InMemoryMetricReader()]))
+    print(f"{'':>22} {'us/token':>10} {'events':>10} {'span KiB':>10}")
+    measure("event per token", PerTokenEventCallback(), args.answers, args.tokens)
+    measure("aggregated", OpentelemetryCallback(), args.answers, args.tokens)
+    measure(
+        f"sampled every {args.sample_interval}",
+        OpentelemetryCallback(args.sample_interval),
+        args.answers,
+        args.tokens,
+    )
+
+
+if __name__ == "__main__":
+    main()
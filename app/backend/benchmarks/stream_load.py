@@ -0,0 +1,117 @@
+"""
+Stream a fake answer to many concurrent websocket clients, once sending a frame
+per token as StreamingCallback used to and once through StreamWriter, and report
+frames per second and the event loop lag seen by the server.
+
+    python -m benchmarks.stream_load --clients 200 --tokens 300 --token-ms 10
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import uvicorn
+import websockets
+from fastapi import FastAPI, WebSocket
+
+from settings.chat_bot_settings import ChatbotSettings
+from stream_writer import StreamWriter
+
+WORDS = "Lighthouse is the membership portal , it lets local parties manage members .".split()
+
+
+def make_app(settings: ChatbotSettings, coalesce: bool, tokens: int, delay: float):
+    app = FastAPI()
+
+    @app.websocket("/chat")
+    async def chat(websocket: WebSocket):
+        await websocket.accept()
+        writer = StreamWriter(websocket, settings)
+        for i in range(tokens):
+            token = f" {WORDS[i % len(WORDS)]}"
+            if coalesce:
+                await writer.write(token)
+            else:
+                await websocket.send_json(
+                    {"sender": "bot", "message": token, "type": "stream"}
+                )
+            await asyncio.sleep(delay)
+        await writer.flush()
+        await websocket.send_json({"sender": "bot", "message": "", "type": "end"})
+        await websocket.close()
+
+    return app
+
+
+async def monitor_lag(lags: list[float], interval: float = 0.01):
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        lags.append(loop.time() - start - interval)
+
+
+async def client(url: str) -> int:
+    frames = 0
+    async with websockets.connect(url, max_queue=None) as websocket:
+        async for _ in websocket:
+            frames += 1
+    return frames
+
+
+async def run(settings, coalesce: bool, *, clients: int, tokens: int, delay, port):
+    server = uvicorn.Server(
+        uvicorn.Config(
+            make_app(settings, coalesce, tokens, delay),
+            port=port,
+            log_level="warning",
+            ws_max_queue=clients,
+        )
+    )
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+
+    lags: list[float] = []
+    monitor = asyncio.create_task(monitor_lag(lags))
+    start = time.perf_counter()
+    frames = await asyncio.gather(
+        *[client(f"ws://127.0.0.1:{port}/chat") for _ in range(clients)]
+    )
+    elapsed = time.perf_counter() - start
+    monitor.cancel()
+    server.should_exit = True
+    await server_task
+
+    lags.sort()
+    name = "coalesced" if coalesce else "per token"
+    print(f"{name}")
+    print(f"  frames:        {sum(frames)}")
+    print(f"  frames/s:      {sum(frames) / elapsed:.0f}")
+    print(f"  wall clock:    {elapsed * 1000:.0f} ms")
+    print(f"  loop lag p50:  {statistics.median(lags) * 1000:.1f} ms")
+    print(f"  loop lag p99:  {lags[int(len(lags) * 0.99)] * 1000:.1f} ms")
+    print(f"  loop lag max:  {lags[-1] * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=100)
+    parser.add_argument("--tokens", type=int, default=200)
+    parser.add_argument("--token-ms", type=float, default=10)
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--settings", default="./settings/test_settings.yaml")
+    args = parser.parse_args()
+
+    chatbot_settings = ChatbotSettings.from_yaml(args.settings)
+    for coalesced in (False, True):
+        asyncio.run(
+            run(
+                chatbot_settings,
+                coalesced,
+                clients=args.clients,
+                tokens=args.tokens,
+                delay=args.token_ms / 1000,
+                port=args.port,
+            )
+        )
@@ -0,0 +1,104 @@
+"""
+Measure request throughput of an instrumented FastAPI app under each telemetry
+profile. Spans are serialised as the console exporter does and logs formatted,
+both written to /dev/null, so the cost of producing telemetry is included but
+not the network.
+
+    python -m benchmarks.telemetry_throughput --requests 5000 --concurrency 50
+"""
+import argparse
+import asyncio
+import dataclasses
+import logging
+import os
+import time
+
+import httpx
+from fastapi import FastAPI
+from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
+from opentelemetry.sdk.trace.export import ConsoleSpanExporter
+
+from observability.start_opentelemetry import make_tracer_provider
+from settings.chat_bot_settings import ChatbotSettings
+
+logger = logging.getLogger("benchmark")
+
+PROFILES = [
+    ("off", "off", "INFO"),
+    ("ratio 10%", "ratio", "INFO"),
+    ("tail 10%", "tail", "INFO"),
+    ("full", "full", "INFO"),
+    ("full, debug logs", "full", "DEBUG"),
+]
+
+
+def make_app(tracer_provider) -> FastAPI:
+    app = FastAPI()
+    tracer = tracer_provider.get_tracer("benchmark")
+
+    @app.get("/question/{number}")
+    async def question(number: int):
+        # Roughly the spans and log lines of retrieving documents for a question
+        with tracer.start_as_current_span("chatbot.question") as span:
+            span.set_attribute("chatbot.question.number", number)
+            for step in ("condense", "embed", "retrieve", "pack"):
+                with tracer.start_as_current_span(f"chatbot.{step}") as step_span:
+                    step_span.set_attribute("chatbot.step", step)
+                    logger.debug("finished %s for question %s", step, number)
+            if number % 100 == 0:
+                span.record_exception(ValueError("no documents found"))
+            logger.info("answered question %s", number)
+        return {"answer": "Lighthouse is the membership portal"}
+
+    return app
+
+
+async def measure(app: FastAPI, requests: int, concurrency: int) -> float:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://bench"
+    ) as client:
+        counter = iter(range(requests))
+
+        async def worker():
+            for number in counter:
+                response = await client.get(f"/question/{number}")
+                response.raise_for_status()
+
+        start = time.perf_counter()
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+        return requests / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--settings", default="./settings/test_settings.yaml")
+    args = parser.parse_args()
+
+    base_settings = ChatbotSettings.from_yaml(args.settings)
+    with open(os.devnull, "w", encoding="utf-8") as devnull:
+        handler = logging.StreamHandler(devnull)
+        handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+        logging.getLogger().addHandler(handler)
+
+        print(f"{'profile':>18} {'requests/s':>12}")
+        for name, profile, log_level in PROFILES:
+            settings = dataclasses.replace(
+                base_settings, telemetry_profile=profile, log_level=log_level
+            )
+            logging.getLogger().setLevel(settings.log_level)
+            tracer_provider = make_tracer_provider(
+                settings, ConsoleSpanExporter(out=devnull)
+            )
+            app = make_app(tracer_provider)
+            FastAPIInstrumentor.instrument_app(app, tracer_provider=tracer_provider)
+            throughput = asyncio.run(measure(app, args.requests, args.concurrency))
+            tracer_provider.shutdown()
+            print(f"{name:>18} {throughput:12.0f}")
+        logging.getLogger().removeHandler(handler)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+Compare memory per worker and MMR query latency between every worker opening
+its own Chroma client and every worker mapping the exported read only index.
+Workers are started together and measured while they are all alive, so the
+proportional set size (PSS) shows how much of the index is shared.
+
+    python -m benchmarks.vector_store_memory --documents 20000 --workers 4
+"""
+import argparse
+import multiprocessing
+import os
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+from langchain.schema.embeddings import Embeddings
+from langchain.vectorstores.chroma import Chroma
+from store_format.vector_index import export_vector_index
+
+from document_store.vector_index import MmapVectorStore
+
+COLLECTION_NAME = "benchmark"
+
+
+class RandomEmbeddings(Embeddings):
+    """Stands in for the provider, queries are random unit vectors."""
+
+    def __init__(self, dimensions: int, seed: int):
+        self.dimensions = dimensions
+        self.rng = np.random.default_rng(seed)
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        vector = self.rng.standard_normal(self.dimensions)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+
+def memory_kib(pid: int | str = "self") -> tuple[int, int]:
+    """Resident and proportional set size of a process, this one by default."""
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup", "r") as smaps:
+        for line in smaps:
+            name, _, rest = line.partition(":")
+            if name in ("Rss", "Pss"):
+                values[name] = int(rest.split()[0])
+    return values["Rss"], values["Pss"]
+
+
+def build_store(directory: Path, documents: int, dimensions: int):
+    rng = np.random.default_rng(0)
+    chroma = Chroma(
+        collection_name=COLLECTION_NAME,
+        embedding_function=RandomEmbeddings(dimensions, 0),
+        persist_directory=str(directory),
+    )
+    batch_size = 5000
+    for start in range(0, documents, batch_size):
+        count = min(batch_size, documents - start)
+        # pylint: disable-next=protected-access
+        chroma._collection.add(
+            ids=[f"chunk-{start + i}" for i in range(count)],
+            embeddings=rng.standard_normal((count, dimensions)).tolist(),
+            documents=[f"news article {start + i} " * 40 for i in range(count)],
+            metadatas=[{"chunk": start + i, "date": "2023"} for i in range(count)],
+        )
+    chroma.persist()
+    # pylint: disable-next=protected-access
+    export_vector_index(chroma._collection, directory / "vector_index")
+
+
+# Run as a process target, which passes its arguments positionally
+# pylint: disable-next=too-many-positional-arguments
+def worker(mode, directory, dimensions, queries, seed, barrier, results):
+    embeddings = RandomEmbeddings(dimensions, seed)
+    if mode == "mmap":
+        store = MmapVectorStore(Path(directory) / "vector_index", embeddings)
+    else:
+        store = Chroma(
+            collection_name=COLLECTION_NAME,
+            embedding_function=embeddings,
+            persist_directory=directory,
+        )
+
+    latencies = []
+    for _ in range(queries):
+        start = time.perf_counter()
+        store.max_marginal_relevance_search("question", k=4, fetch_k=20)
+        latencies.append(time.perf_counter() - start)
+
+    barrier.wait()
+    rss, pss = memory_kib()
+    results.put((rss, pss, latencies))
+    barrier.wait()
+
+
+def run(mode: str, directory: str, dimensions: int, workers: int, queries: int):
+    context = multiprocessing.get_context("spawn")
+    barrier = context.Barrier(workers)
+    results = context.Queue()
+    processes = [
+        context.Process(
+            target=worker,
+            args=(mode, directory, dimensions, queries, seed, barrier, results),
+        )
+        for seed in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    measurements = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    latencies = sorted(
+        l for _, _, worker_latencies in measurements for l in worker_latencies
+    )
+    print(
+        f"{mode:<7}"
+        f" rss/worker {statistics.mean(m[0] for m in measurements) / 1024:8.1f} MiB"
+        f" pss/worker {statistics.mean(m[1] for m in measurements) / 1024:8.1f} MiB"
+        f" p50 {latencies[len(latencies) // 2] * 1e3:7.2f} ms"
+        f" p95 {latencies[int(len(latencies) * 0.95)] * 1e3:7.2f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--documents", type=int, default=20000)
+    parser.add_argument("--dimensions", type=int, default=1536)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--queries", type=int, default=50)
+    args = parser.parse_args()
+    os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+
+    with tempfile.TemporaryDirectory() as directory:
+        build_store(Path(directory), args.documents, args.dimensions)
+        print(f"documents {args.documents} dimensions {args.dimensions}")
+        for mode in ("chroma", "mmap"):
+            run(mode, directory, args.dimensions, args.workers, args.queries)
+
+
+if __name__ == "__main__":
+    main()
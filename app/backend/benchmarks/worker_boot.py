@@ -0,0 +1,186 @@
+"""
+Boot the app under gunicorn with different numbers of workers, with and without
+preloading, and report how long it takes for every worker to be ready and the
+memory of the master and its workers together. The proportional set size (PSS)
+counts pages shared copy on write once, the resident set size (RSS) once per
+process. Runs offline: the app serves a generated store put in its store cache,
+the bucket it would check for a newer one is unreachable and no model is asked.
+
+    python -m benchmarks.worker_boot --documents 20000 --workers 1 2 4
+"""
+import argparse
+import json
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+import yaml
+from store_format.bm25 import BM25_INDEX_DIRECTORY, build_bm25_index
+from store_format.manifest import build_manifest
+
+from benchmarks.vector_store_memory import COLLECTION_NAME, build_store, memory_kib
+from document_store.store_cache import StoreCache
+
+UNREACHABLE = "http://127.0.0.1:9"
+
+
+def install_store(
+    directory: Path, cache_directory: Path, documents: int, dimensions: int
+):
+    """Build a store and put it in the cache as if it had been fetched."""
+    store = directory / "store"
+    build_store(store, documents, dimensions)
+    build_bm25_index(
+        ((f"chunk-{i}", f"news article {i} " * 40) for i in range(documents)),
+        store / BM25_INDEX_DIRECTORY,
+    )
+    manifest = build_manifest(store) | {"version": "benchmark", "published": 0}
+    shutil.copytree(store, cache_directory / "benchmark")
+    (cache_directory / "benchmark" / StoreCache.MANIFEST_FILE).write_text(
+        json.dumps(manifest)
+    )
+
+
+def write_settings(directory: Path, cache_directory: Path) -> Path:
+    with open("./settings/test_settings.yaml", "r", encoding="utf-8") as file:
+        settings = yaml.safe_load(file)
+    (directory / "dist").mkdir()
+    (directory / "dist" / "index.html").write_text("")
+    settings.update(
+        collection_name=COLLECTION_NAME,
+        vector_store_mode="mmap",
+        hybrid_retrieval=True,
+        store_cache_directory=str(cache_directory),
+        document_store_endpoint_url=UNREACHABLE,
+        database_endpoint_url=UNREACHABLE,
+        build_directory=str(directory / "dist"),
+        telemetry_exporter="none",
+        log_level="WARNING",
+    )
+    path = directory / "settings.yaml"
+    path.write_text(yaml.safe_dump(settings))
+    return path
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def children(pid: int) -> list[int]:
+    with open(f"/proc/{pid}/task/{pid}/children", "r") as file:
+        return [int(child) for child in file.read().split()]
+
+
+def wait_until_ready(port: int, workers: int, timeout: float) -> set[int]:
+    """Poll /readyz until every worker has answered that it is ready."""
+    ready: set[int] = set()
+    deadline = time.monotonic() + timeout
+    while len(ready) < workers:
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"only {len(ready)} of {workers} workers were ready")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/readyz") as response:
+                ready.add(json.loads(response.read())["process"])
+        except urllib.error.HTTPError as e:
+            report = json.loads(e.read())
+            if report["status"] == "failed":
+                raise RuntimeError(f"the app failed to start: {report}") from e
+        except OSError:
+            pass
+        time.sleep(0.02)
+    return ready
+
+
+def boot(settings_path: Path, workers: int, preload: bool, timeout: float) -> dict:
+    port = free_port()
+    env = os.environ | {
+        "SETTINGS_FILEPATH": str(settings_path),
+        "PRELOAD_APP": "true" if preload else "false",
+        "WEB_CONCURRENCY": str(workers),
+        "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY", "not-used"),
+        "AWS_ACCESS_KEY_ID": "not-used",
+        "AWS_SECRET_ACCESS_KEY": "not-used",
+        "AWS_MAX_ATTEMPTS": "1",
+        "ANONYMIZED_TELEMETRY": "False",
+    }
+    start = time.perf_counter()
+    with subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "gunicorn",
+            "--config",
+            "gunicorn.conf.py",
+            "--bind",
+            f"127.0.0.1:{port}",
+            "--log-level",
+            "warning",
+            "app:app",
+        ],
+        env=env,
+        stdout=subprocess.DEVNULL,
+    ) as server:
+        try:
+            wait_until_ready(port, workers, timeout)
+            boot_seconds = time.perf_counter() - start
+            # Let the workers settle before measuring
+            time.sleep(1)
+            processes = [server.pid, *children(server.pid)]
+            memory = [memory_kib(pid) for pid in processes]
+        finally:
+            server.send_signal(signal.SIGTERM)
+            server.wait(timeout=30)
+    return {
+        "workers": workers,
+        "preload": preload,
+        "boot_seconds": boot_seconds,
+        "rss_mib": sum(rss for rss, _ in memory) / 1024,
+        "pss_mib": sum(pss for _, pss in memory) / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--documents", type=int, default=20000)
+    parser.add_argument("--dimensions", type=int, default=1536)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+    os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        directory = Path(directory)
+        cache_directory = directory / "store_cache"
+        install_store(directory, cache_directory, args.documents, args.dimensions)
+        settings_path = write_settings(directory, cache_directory)
+        print(f"documents {args.documents} dimensions {args.dimensions}")
+        for workers in args.workers:
+            for preload in (False, True):
+                result = boot(settings_path, workers, preload, args.timeout)
+                results.append(result)
+                print(
+                    f"workers {workers}"
+                    f" preload {'yes' if preload else 'no ':<3}"
+                    f" boot {result['boot_seconds']:6.2f} s"
+                    f" rss {result['rss_mib']:8.1f} MiB"
+                    f" pss {result['pss_mib']:8.1f} MiB"
+                )
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
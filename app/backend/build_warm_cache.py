@@ -0,0 +1,270 @@
+"""
+Build the warm cache from the questions people have already asked. The messages
+table is scanned in parallel segments, the first questions of conversations are
+grouped with others that mean the same thing and the most frequent groups are
+answered with the real chain. The answers are written with a report of how much
+of the scanned traffic they would have served to the file set as
+warm_cache_file, which the app pins into its semantic cache at startup.
+
+Set database_endpoint_url in the settings to scan a local DynamoDB, or pass
+--offline to run against an in memory table of made up traffic and fake models.
+
+    python -m build_warm_cache --settings ./settings/live_settings/x.yaml --top 100
+    python -m build_warm_cache --offline --conversations 5000 --output /tmp/warm.json
+"""
+import argparse
+import asyncio
+import dataclasses
+import json
+import logging
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+import boto3
+import numpy as np
+from langchain.schema.embeddings import Embeddings
+from store_format.vector_index import normalise
+
+from document_store.loading import (
+    get_store_cache,
+    load_document_store,
+    serving_directory,
+)
+from query.cached_retrieval_chain import CachedConversationalRetrievalChain
+from query.llm_chain_factory import LLMChainFactory
+from query.semantic_cache import normalise_question
+from query.warm_cache import WarmAnswer, WarmCache
+from settings.chat_bot_settings import ChatbotSettings
+
+logger = logging.getLogger("build_warm_cache")
+
+
+@dataclasses.dataclass
+class QuestionCluster:
+    question: str
+    variants: list[str]
+    count: int
+    embedding: list[float]
+
+
+def scan_segment(make_table: Callable, segment: int, total_segments: int):
+    """The questions in one segment of the table and whether each began a conversation."""
+    # boto3 resources are not thread safe, each segment gets its own table
+    table = make_table()
+    questions: list[tuple[str, bool]] = []
+    scan = {
+        "Segment": segment,
+        "TotalSegments": total_segments,
+        "ProjectionExpression": "#message, #user, #previous",
+        "ExpressionAttributeNames": {
+            "#message": "message",
+            "#user": "userId",
+            "#previous": "previousMessageId",
+        },
+    }
+    while True:
+        response = table.scan(**scan)
+        for item in response["Items"]:
+            if item.get("userId") != "AI" and item.get("message"):
+                questions.append(
+                    (item["message"], item.get("previousMessageId") == "null")
+                )
+        if "LastEvaluatedKey" not in response:
+            return questions
+        scan["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+
+def scan_questions(make_table: Callable, segments: int) -> tuple[list[str], int]:
+    """Every first question in the table and the number of questions of any turn."""
+    with ThreadPoolExecutor(segments) as executor:
+        results = executor.map(
+            lambda segment: scan_segment(make_table, segment, segments),
+            range(segments),
+        )
+        questions = [question for result in results for question in result]
+    first_questions = [text for text, first in questions if first]
+    return first_questions, len(questions)
+
+
+def cluster_questions(
+    questions: list[str], embeddings: Embeddings, threshold: float
+) -> list[QuestionCluster]:
+    """
+    Group questions that are the same once case and punctuation are ignored, then
+    greedily merge groups whose embeddings are as similar as the semantic cache
+    needs for a hit, most frequent first. Each cluster is named after its most
+    frequent question.
+    """
+    if not questions:
+        return []
+    by_text: dict[str, Counter] = {}
+    for question in questions:
+        by_text.setdefault(normalise_question(question), Counter())[question] += 1
+    groups = sorted(by_text.values(), key=lambda group: -sum(group.values()))
+    representatives = [group.most_common(1)[0][0] for group in groups]
+    vectors = normalise(embeddings.embed_documents(representatives))
+
+    clusters: list[QuestionCluster] = []
+    centres = np.zeros((len(groups), vectors.shape[1]), dtype=np.float32)
+    for group, representative, vector in zip(groups, representatives, vectors):
+        scores = centres[: len(clusters)] @ vector
+        if clusters and scores.max() >= threshold:
+            cluster = clusters[int(np.argmax(scores))]
+            cluster.variants += list(group)
+            cluster.count += sum(group.values())
+            continue
+        centres[len(clusters)] = vector
+        clusters.append(
+            QuestionCluster(
+                representative,
+                [question for question in group if question != representative],
+                sum(group.values()),
+                vector.tolist(),
+            )
+        )
+    return sorted(clusters, key=lambda cluster: -cluster.count)
+
+
+def coverage_report(
+    clusters: list[QuestionCluster], top: int, first_questions: int, questions: int
+) -> dict:
+    served = sum(cluster.count for cluster in clusters[:top])
+    return {
+        "questions": questions,
+        "first_questions": first_questions,
+        "distinct_first_questions": sum(len(c.variants) + 1 for c in clusters),
+        "clusters": len(clusters),
+        "cached_clusters": min(top, len(clusters)),
+        "first_question_coverage": served / first_questions if first_questions else 0,
+        "traffic_coverage": served / questions if questions else 0,
+    }
+
+
+async def answer_clusters(
+    chain: CachedConversationalRetrievalChain,
+    clusters: list[QuestionCluster],
+    concurrency: int,
+) -> list[WarmAnswer]:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def answer(cluster: QuestionCluster) -> WarmAnswer:
+        async with semaphore:
+            output = await chain.acall(
+                {"question": cluster.question, "chat_history": []}
+            )
+        return WarmAnswer(
+            cluster.question,
+            cluster.variants,
+            cluster.count,
+            cluster.embedding,
+            output["answer"],
+            output.get("source_documents", []),
+        )
+
+    return await asyncio.gather(*[answer(cluster) for cluster in clusters])
+
+
+def production_services(settings: ChatbotSettings):
+    def make_table():
+        return (
+            boto3.session.Session()
+            .resource(
+                "dynamodb",
+                region_name=settings.database_region,
+                endpoint_url=settings.database_endpoint_url,
+            )
+            .Table(settings.database_name_message)
+        )
+
+    store_cache = get_store_cache(settings)
+    document_store, _ = load_document_store(settings, store_cache)
+    vector_store = LLMChainFactory.get_vector_store(
+        settings, serving_directory(settings, store_cache, document_store)
+    )
+    factory = LLMChainFactory(
+        None,
+        vector_store,
+        settings,
+        document_store.version,
+        lexical_index=LLMChainFactory.get_lexical_index(
+            settings, document_store.directory
+        ),
+    )
+    return make_table, factory, document_store.version
+
+
+def offline_services(settings: ChatbotSettings, conversations: int):
+    # pylint: disable-next=import-outside-toplevel
+    from benchmarks.fakes import (
+        FakeServices,
+        make_chain_factory,
+        make_table,
+        seed_question_history,
+    )
+
+    table = make_table(settings.database_name_message)
+    seed_question_history(table, conversations)
+    services = FakeServices(
+        first_token_latency=0, tokens_per_second=10000, embed_latency=0
+    )
+    return lambda: table, make_chain_factory(settings, services), "load-test"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--settings", default="./settings/test_settings.yaml")
+    parser.add_argument("--top", type=int, help="defaults to warm_cache_size")
+    parser.add_argument("--segments", type=int, help="defaults to the settings")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--output", help="defaults to warm_cache_file")
+    parser.add_argument("--report-only", action="store_true")
+    parser.add_argument("--offline", action="store_true")
+    parser.add_argument(
+        "--conversations", type=int, default=5000, help="made up when offline"
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    # Answers are built without the cache so one group can't be answered by another
+    settings = dataclasses.replace(
+        ChatbotSettings.from_yaml(args.settings), semantic_cache_enabled=False
+    )
+    top = args.top or settings.warm_cache_size
+    segments = args.segments or settings.warm_cache_scan_segments
+    output = args.output or settings.warm_cache_file
+    if output is None and not args.report_only:
+        parser.error("set warm_cache_file in the settings or pass --output")
+
+    if args.offline:
+        make_table, factory, store_version = offline_services(
+            settings, args.conversations
+        )
+    else:
+        make_table, factory, store_version = production_services(settings)
+
+    start = time.perf_counter()
+    first_questions, questions = scan_questions(make_table, segments)
+    logger.info("Scanned %s questions in %.1fs", questions, time.perf_counter() - start)
+    clusters = cluster_questions(
+        first_questions,
+        factory.vector_store.embeddings,
+        settings.semantic_cache_threshold,
+    )
+    report = coverage_report(clusters, top, len(first_questions), questions)
+    print(json.dumps(report, indent=2))
+    if not clusters:
+        logger.warning("No first questions were found, the warm cache will be empty")
+    if args.report_only:
+        return
+
+    answers = asyncio.run(
+        answer_clusters(factory.chain, clusters[:top], args.concurrency)
+    )
+    WarmCache(store_version, settings.persona, answers, report).save(output)
+    logger.info("Wrote %s answers for %s to %s", len(answers), settings.persona, output)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,50 +1,86 @@
+import asyncio
 import os
+import httpx
 from fastapi import HTTPException
 from fastapi.datastructures import Address
-from requests import post
 from opentelemetry import trace
+from settings.chat_bot_settings import ChatbotSettings
 
 site_secret_default = os.getenv("RECHAPTCHA_SITE_SECRET")
 
+tracer = trace.get_tracer("chatbot.captcha")
+
 
 class QuestionTooLongError(Exception):
     pass
 
 
-def captcha_check(
-    captcha_token: str,
-    remote_ip: Address,
-    site_secret: str = site_secret_default,
-    raise_on_fail=True,
-) -> bool:
-    response = post(
-        "https://www.google.com/recaptcha/api/siteverify",
-        data={
-            "secret": site_secret,
-            "response": captcha_token,
-            "remoteip": remote_ip.host,
-        },
-        timeout=10,
-    ).json()
-
-    success = response.get("success")
-
-    if not success:
-        current_span = trace.get_current_span()
-        current_span.add_event(
-            "failed_captcha",
-            attributes={
-                "chatbot.captcha.status": str(success),
-                "chatbot.captcha.challenge_ts": str(response.get("challenge_ts")),
-                "chatbot.captcha.hostname": str(response.get("hostname")),
-                "chatbot.captcha.error-codes": ",".join(response.get("error-codes")),
-            },
+class CaptchaVerifier:
+    """Verifies reCAPTCHA tokens using one pooled HTTP client shared by every request."""
+
+    def __init__(
+        self,
+        settings: ChatbotSettings,
+        site_secret: str = site_secret_default,
+        transport: httpx.AsyncBaseTransport | None = None,
+    ):
+        self.verify_url = settings.captcha_verify_url
+        self.site_secret = site_secret
+        self.semaphore = asyncio.Semaphore(settings.captcha_max_concurrency)
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(
+                settings.captcha_timeout, connect=settings.captcha_connect_timeout
+            ),
+            limits=httpx.Limits(
+                max_connections=settings.captcha_max_connections,
+                max_keepalive_connections=settings.captcha_max_connections,
+            ),
+            transport=transport,
         )
 
-        if raise_on_fail:
-            raise HTTPException(429, "error captcha check failed")
+    async def aclose(self):
+        await self.client.aclose()
+
+    async def verify(
+        self,
+        captcha_token: str,
+        remote_ip: Address,
+        raise_on_fail=True,
+    ) -> bool:
+        with tracer.start_as_current_span(
+            "chatbot.CaptchaVerifier.verify", kind=trace.SpanKind.CLIENT
+        ):
+            async with self.semaphore:
+                response = await self.client.post(
+                    self.verify_url,
+                    data={
+                        "secret": self.site_secret,
+                        "response": captcha_token,
+                        "remoteip": remote_ip.host,
+                    },
+                )
+            response = response.json()
+
+        success = response.get("success")
+
+        if not success:
+            current_span = trace.get_current_span()
+            current_span.add_event(
+                "failed_captcha",
+                attributes={
+                    "chatbot.captcha.status": str(success),
+                    "chatbot.captcha.challenge_ts": str(response.get("challenge_ts")),
+                    "chatbot.captcha.hostname": str(response.get("hostname")),
+                    "chatbot.captcha.error-codes": ",".join(
+                        response.get("error-codes", [])
+                    ),
+                },
+            )
+
+            if raise_on_fail:
+                raise HTTPException(429, "error captcha check failed")
 
-    return success is False
+        return bool(success)
 
 
 def throw_on_long_question(question: dict):
@@ -0,0 +1,186 @@
+import asyncio
+import logging
+from collections import OrderedDict, deque
+
+from langchain.chains.llm import LLMChain
+from langchain.schema import BaseMessage, SystemMessage, get_buffer_string
+from opentelemetry import metrics, trace
+
+from messageData import MessageData
+from schema.message import Message
+from settings.chat_bot_settings import ChatbotSettings
+
+tracer = trace.get_tracer("chatbot.conversation_store")
+meter = metrics.get_meter("chatbot.conversation_store")
+rebuilt_conversations = meter.create_counter(
+    "chatbot.conversations.rebuilt",
+    description="Conversations that were not in memory and had to be rebuilt",
+)
+summaries = meter.create_counter(
+    "chatbot.conversations.summaries",
+    description="Times older messages were folded into a conversation's summary",
+)
+history_messages = meter.create_histogram(
+    "chatbot.conversations.history_messages",
+    description="Messages sent with each question as its chat history",
+)
+
+
+class Conversation:
+    """
+    The latest messages of a conversation and a summary of everything before them.
+    Messages that leave the window wait as pending, still sent in full, until they
+    are folded into the summary so no part of the conversation is ever missing.
+    """
+
+    def __init__(self, window_size: int, max_pending: int):
+        self.window: deque[Message] = deque()
+        self.window_size = window_size
+        self.max_pending = max_pending
+        self.pending: list[Message] = []
+        self.summary = ""
+        self.summarising: asyncio.Task | None = None
+        self.key: str | None = None
+
+    @property
+    def last_message(self) -> Message:
+        return self.window[-1]
+
+    def add(self, message: Message):
+        self.window.append(message)
+        while len(self.window) > self.window_size:
+            self.pending.append(self.window.popleft())
+        # Only reached if summarising keeps failing, the oldest are let go
+        if len(self.pending) > self.max_pending:
+            del self.pending[: len(self.pending) - self.max_pending]
+
+    def chat_history(self) -> list[BaseMessage]:
+        """Everything before the latest message, the oldest part summarised."""
+        history: list[BaseMessage] = []
+        if self.summary:
+            history.append(
+                SystemMessage(
+                    content=f"Summary of the conversation so far: {self.summary}"
+                )
+            )
+        history += [message.message for message in self.pending]
+        history += [message.message for message in list(self.window)[:-1]]
+        return history
+
+    async def summarise(self, summary_chain: LLMChain):
+        with tracer.start_as_current_span("chatbot.Conversation.summarise") as span:
+            lines = self.pending[:]
+            span.set_attribute("chatbot.conversation.summarised_messages", len(lines))
+            summary = await summary_chain.apredict(
+                summary=self.summary,
+                new_lines=get_buffer_string([message.message for message in lines]),
+            )
+            # More may have left the window meanwhile, only remove those summarised
+            summarised = {id(message) for message in lines}
+            self.pending = [
+                message for message in self.pending if id(message) not in summarised
+            ]
+            self.summary = summary.strip()
+            summaries.add(1)
+
+
+class ConversationStore:  # pylint: disable=too-many-instance-attributes
+    """
+    Keeps recent conversations in memory, least recently used first out, indexed by
+    the id of their last message so a question finds its conversation through its
+    previousMessageId whichever way it arrived. A conversation that is not in
+    memory is rebuilt from the messages the client sent or, when it only sent the
+    new question, by following previousMessageId back through DynamoDB.
+
+    Each question is sent with a bounded window of the latest messages and the
+    summary of older ones, which is brought up to date in batches in the
+    background so summarising never delays an answer.
+    """
+
+    def __init__(
+        self,
+        settings: ChatbotSettings,
+        summary_chain: LLMChain | None = None,
+        message_data: MessageData | None = None,
+    ):
+        self.summary_chain = summary_chain
+        self.message_data = message_data
+        self.max_conversations = settings.conversation_max_conversations
+        self.window_size = settings.conversation_window_messages
+        self.summary_batch = settings.conversation_summary_batch
+        self.rebuild_limit = settings.conversation_rebuild_messages
+        self.conversations: OrderedDict[str, Conversation] = OrderedDict()
+        self.background_tasks: set[asyncio.Task] = set()
+        self.logger = logging.getLogger()
+
+    def parse(self, messages: list[dict]) -> list[Message]:
+        """The client's latest message and those before it a rebuild would use."""
+        return [
+            Message.from_dict(message)
+            for message in messages[-1 - self.rebuild_limit :]
+        ]
+
+    async def continue_with(self, messages: list[Message]) -> Conversation:
+        """The conversation with the client's latest message added to it."""
+        question = messages[-1]
+        conversation = self.conversations.pop(question.previousMessageId, None)
+        if conversation is None:
+            conversation = await self.rebuild(messages)
+        conversation.add(question)
+        self.save(conversation)
+        history_messages.record(len(conversation.chat_history()))
+        return conversation
+
+    async def rebuild(self, messages: list[Message]) -> Conversation:
+        conversation = Conversation(self.window_size, self.rebuild_limit)
+        previous_message_id = messages[-1].previousMessageId
+        earlier: list[Message] = []
+        source = "new"
+        if len(messages) > 1:
+            source = "client"
+            earlier = messages[-1 - self.rebuild_limit : -1]
+        elif self.message_data is not None and previous_message_id not in (
+            None,
+            "null",
+        ):
+            source = "database"
+            earlier = await asyncio.to_thread(
+                self.message_data.get_conversation,
+                previous_message_id,
+                self.rebuild_limit,
+            )
+        rebuilt_conversations.add(1, {"chatbot.conversation.source": source})
+        for message in earlier:
+            conversation.add(message)
+        return conversation
+
+    def save(self, conversation: Conversation):
+        """
+        Index the conversation under its latest message, once its answer has been
+        added as well, and start summarising if enough has left the window.
+        """
+        if conversation.key is not None:
+            self.conversations.pop(conversation.key, None)
+        conversation.key = conversation.last_message.messageId
+        self.conversations[conversation.key] = conversation
+        self.conversations.move_to_end(conversation.key)
+        while len(self.conversations) > self.max_conversations:
+            self.conversations.popitem(last=False)
+
+        if self.summary_chain is None:
+            conversation.pending.clear()
+        elif (
+            len(conversation.pending) >= self.summary_batch
+            and conversation.summarising is None
+        ):
+            task = asyncio.create_task(conversation.summarise(self.summary_chain))
+            conversation.summarising = task
+            self.background_tasks.add(task)
+            task.add_done_callback(lambda task: self._summarised(conversation, task))
+
+    def _summarised(self, conversation: Conversation, task: asyncio.Task):
+        conversation.summarising = None
+        self.background_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            # Pending messages stay in full and are tried again next time
+            self.logger.error("Couldn't summarise conversation: %s", task.exception())
@@ -0,0 +1,78 @@
+import json
+import math
+import threading
+from pathlib import Path
+from typing import List, Tuple
+
+import numpy as np
+from store_format.bm25 import (
+    FREQUENCIES_FILE,
+    IDS_FILE,
+    INDEX_FILE,
+    LENGTHS_FILE,
+    OFFSETS_FILE,
+    ROWS_FILE,
+    TERMS_FILE,
+    tokenise,
+)
+
+from document_store.mmr import top_k
+
+
+class BM25Index:  # pylint: disable=too-many-instance-attributes
+    """
+    Okapi BM25 over an index written by build_bm25_index. Nothing is read until the
+    first search so one instance can be created at startup and shared by every
+    request, the arrays are memory mapped so they are also shared between workers.
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.loaded = False
+
+    def load(self):
+        with self.lock:
+            if self.loaded:
+                return
+            info = json.loads((self.directory / INDEX_FILE).read_text())
+            self.count = info["count"]
+            self.k1 = info["k1"]
+            self.b = info["b"]
+            self.average_length = info["average_length"] or 1.0
+            self.terms = {
+                term: index
+                for index, term in enumerate(
+                    json.loads((self.directory / TERMS_FILE).read_text())
+                )
+            }
+            self.ids = json.loads((self.directory / IDS_FILE).read_text())
+            self.offsets = np.load(self.directory / OFFSETS_FILE, mmap_mode="r")
+            self.rows = np.load(self.directory / ROWS_FILE, mmap_mode="r")
+            self.frequencies = np.load(self.directory / FREQUENCIES_FILE, mmap_mode="r")
+            lengths = np.load(self.directory / LENGTHS_FILE)
+            self.length_norms = self.k1 * (
+                1 - self.b + self.b * lengths / self.average_length
+            )
+            self.loaded = True
+
+    def search(self, query: str, k: int) -> List[Tuple[str, float]]:
+        """Ids and scores of the k best matching chunks, best first."""
+        self.load()
+        scores = np.zeros(self.count, dtype=np.float32)
+        for term in set(tokenise(query)):
+            index = self.terms.get(term)
+            if index is None:
+                continue
+            start, end = self.offsets[index], self.offsets[index + 1]
+            rows = self.rows[start:end]
+            frequencies = self.frequencies[start:end].astype(np.float32)
+            idf = math.log(1 + (self.count - len(rows) + 0.5) / (len(rows) + 0.5))
+            scores[rows] += (
+                idf
+                * frequencies
+                * (self.k1 + 1)
+                / (frequencies + self.length_norms[rows])
+            )
+        best = [row for row in top_k(scores, k) if scores[row] > 0]
+        return [(self.ids[row], float(scores[row])) for row in best]
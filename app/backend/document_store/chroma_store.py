@@ -0,0 +1,82 @@
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain.schema import Document
+from langchain.vectorstores.chroma import Chroma
+from store_format.vector_index import normalise
+
+from document_store.mmr import maximal_marginal_relevance
+
+
+class MmrChroma(Chroma):
+    """
+    Chroma with MMR selection done by document_store.mmr, which scales to a much
+    larger fetch_k than the generic implementation, and returns the documents in
+    the order they were picked so the most relevant comes first.
+    """
+
+    # The signature is Chroma's
+    # pylint: disable-next=too-many-positional-arguments
+    def max_marginal_relevance_search_by_vector(
+        self,
+        embedding: List[float],
+        k: int = 4,
+        fetch_k: int = 20,
+        lambda_mult: float = 0.5,
+        filter: Optional[Dict[str, str]] = None,  # pylint: disable=redefined-builtin
+        where_document: Optional[Dict[str, str]] = None,
+        **kwargs: Any,
+    ) -> List[Document]:
+        count = self._collection.count()
+        if count == 0:
+            return []
+        results = self._collection.query(
+            query_embeddings=[embedding],
+            n_results=min(fetch_k, count),
+            where=filter,
+            where_document=where_document,
+            include=["metadatas", "documents", "embeddings"],
+        )
+        selected = maximal_marginal_relevance(
+            normalise(embedding),
+            normalise(results["embeddings"][0]),
+            k,
+            lambda_mult,
+        )
+        return [
+            Document(
+                page_content=results["documents"][0][index],
+                metadata=results["metadatas"][0][index] or {},
+            )
+            for index in selected
+        ]
+
+    def candidate_ids(self, embedding: List[float], k: int) -> List[str]:
+        """Ids of the k nearest chunks, nearest first."""
+        count = self._collection.count()
+        if count == 0:
+            return []
+        results = self._collection.query(
+            query_embeddings=[embedding], n_results=min(k, count), include=[]
+        )
+        return results["ids"][0]
+
+    def documents_with_embeddings(
+        self, ids: List[str]
+    ) -> Tuple[List[Document], np.ndarray]:
+        """The documents and normalised embeddings of chunks, in the order given."""
+        if not ids:
+            return [], np.zeros((0, 0), dtype=np.float32)
+        results = self._collection.get(
+            ids=ids, include=["metadatas", "documents", "embeddings"]
+        )
+        index = {chunk_id: i for i, chunk_id in enumerate(results["ids"])}
+        order = [index[chunk_id] for chunk_id in ids]
+        documents = [
+            Document(
+                page_content=results["documents"][i],
+                metadata=results["metadatas"][i] or {},
+            )
+            for i in order
+        ]
+        return documents, normalise([results["embeddings"][i] for i in order])
@@ -0,0 +1,84 @@
+from pathlib import Path
+
+import boto3
+from botocore.exceptions import BotoCoreError, ClientError
+from opentelemetry import trace
+from store_format.archive import StoreArchive
+
+from document_store.s3_sync import S3Sync
+from document_store.store_cache import CachedStore, StoreCache
+from settings.chat_bot_settings import ChatbotSettings
+
+tracer = trace.get_tracer("chatbot.document_store")
+
+
+def get_store_cache(settings: ChatbotSettings) -> StoreCache:
+    client = boto3.client("s3", endpoint_url=settings.document_store_endpoint_url)
+    return StoreCache(
+        StoreArchive(client, settings.document_store_bucket),
+        Path(settings.store_cache_directory),
+    )
+
+
+@tracer.start_as_current_span("chatbot.VortexQuery.load_document_store")
+def load_document_store(
+    settings: ChatbotSettings, store_cache: StoreCache
+) -> tuple[CachedStore, dict | None]:
+    """
+    Find the document store to serve from straight away. A valid cached version
+    is preferred even when a newer one has been published, in which case the
+    newer manifest is returned too so it can be fetched in the background.
+    """
+    span = trace.get_current_span()
+    cached = store_cache.latest_valid()
+    try:
+        published = store_cache.archive.read_manifest()
+    except (BotoCoreError, ClientError) as e:
+        if cached is None:
+            raise
+        span.record_exception(e)
+        published = None
+
+    if published is None:
+        if cached is not None:
+            span.set_attribute("chatbot.document_store.source", "cache")
+            return cached, None
+        # The bucket predates store archives, mirror it file by file
+        download_data(settings)
+        span.set_attribute("chatbot.document_store.source", "bucket")
+        return (
+            CachedStore("unversioned", Path(settings.persist_directory), {}),
+            None,
+        )
+
+    if cached is None:
+        span.set_attribute("chatbot.document_store.source", "archive")
+        return store_cache.fetch(published), None
+    span.set_attribute("chatbot.document_store.source", "cache")
+    if cached.version == published["version"]:
+        return cached, None
+    return cached, published
+
+
+def serving_directory(
+    settings: ChatbotSettings, store_cache: StoreCache, store: CachedStore
+) -> Path:
+    """
+    Where to open the vector store from. The memory mapped index is only ever
+    read so it is served from the cache, Chroma writes to its files so it is
+    given a copy of a cached version.
+    """
+    if settings.vector_store_mode == "mmap" or not store.manifest:
+        return store.directory
+    return store_cache.working_copy(store)
+
+
+@tracer.start_as_current_span("chatbot.VortexQuery.download_data")
+def download_data(settings: ChatbotSettings):
+    """Bring the local copy of the document store up to date with the bucket."""
+    client = boto3.client("s3", endpoint_url=settings.document_store_endpoint_url)
+    S3Sync(
+        client,
+        settings.document_store_bucket,
+        max_workers=settings.document_store_transfer_concurrency,
+    ).download(Path(settings.persist_directory))
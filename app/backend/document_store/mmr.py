@@ -0,0 +1,44 @@
+from typing import List
+
+import numpy as np
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores, highest first, without a full sort."""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    indices = np.argpartition(-scores, k - 1)[:k]
+    return indices[np.argsort(-scores[indices], kind="stable")]
+
+
+def maximal_marginal_relevance(
+    query: np.ndarray,
+    candidates: np.ndarray,
+    k: int = 4,
+    lambda_mult: float = 0.5,
+) -> List[int]:
+    """
+    Pick k candidates balancing similarity to the query against similarity to the
+    candidates already picked. Query and candidates must already be normalised.
+
+    Rather than recomputing every pairwise similarity on each step this keeps,
+    for every candidate, its highest similarity to anything picked so far and
+    updates it with one matrix-vector product per pick, so a step costs
+    O(fetch_k x dimensions) however many documents have been picked.
+    """
+    count = min(k, len(candidates))
+    if count <= 0:
+        return []
+    similarity_to_query = candidates @ query
+    redundancy = np.full(len(candidates), -np.inf, dtype=np.float32)
+    available = np.ones(len(candidates), dtype=bool)
+
+    picked = [int(np.argmax(similarity_to_query))]
+    for _ in range(count - 1):
+        available[picked[-1]] = False
+        np.maximum(redundancy, candidates @ candidates[picked[-1]], out=redundancy)
+        scores = lambda_mult * similarity_to_query - (1 - lambda_mult) * redundancy
+        scores[~available] = -np.inf
+        picked.append(int(np.argmax(scores)))
+    return picked
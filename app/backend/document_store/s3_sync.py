@@ -0,0 +1,138 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import md5
+from pathlib import Path
+
+from boto3.s3.transfer import TransferConfig
+from opentelemetry import trace
+
+tracer = trace.get_tracer("chatbot.document_store")
+
+
+class S3Sync:
+    """
+    Brings a local directory up to date with a bucket the document store was
+    published to file by file, before it was published as an archive, only
+    downloading the files that differ.
+
+    Such a store may be described by `manifest.json`, which maps each file to the
+    key holding its contents along with its size and ETag. Buckets without one
+    are mirrored key for key.
+    """
+
+    MANIFEST_KEY = "manifest.json"
+
+    def __init__(
+        self,
+        client,
+        bucket: str,
+        prefix: str = "",
+        max_workers: int = 8,
+        transfer_config: TransferConfig | None = None,
+    ):
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix
+        self.max_workers = max_workers
+        self.transfer_config = transfer_config or TransferConfig(
+            max_concurrency=max_workers
+        )
+
+    @tracer.start_as_current_span("chatbot.S3Sync.download")
+    def download(self, local_directory: Path) -> str | None:
+        """
+        Bring the directory up to date with the published version, returning the
+        version. Buckets without a manifest are mirrored key for key.
+        """
+        span = trace.get_current_span()
+        manifest = self.read_manifest()
+        if manifest is None:
+            files = {
+                key[len(self.prefix) :]: {"key": key, **remote}
+                for key, remote in self.list_remote().items()
+                if not key.endswith("/")
+            }
+        else:
+            files = manifest["files"]
+
+        downloads = []
+        for name, entry in files.items():
+            target = local_directory / name
+            if not self.local_matches(target, entry):
+                downloads.append((entry["key"], target))
+
+        with ThreadPoolExecutor(self.max_workers) as pool:
+            list(pool.map(lambda download: self.download_file(*download), downloads))
+
+        stale = [
+            path
+            for path in self.list_local(local_directory)
+            if path.relative_to(local_directory).as_posix() not in files
+        ]
+        for path in stale:
+            path.unlink()
+
+        version = None if manifest is None else manifest["version"]
+        span.set_attribute("chatbot.document_store.version", version or "unversioned")
+        span.set_attribute("chatbot.document_store.downloaded_files", len(downloads))
+        span.set_attribute("chatbot.document_store.deleted_files", len(stale))
+        return version
+
+    def read_manifest(self) -> dict | None:
+        try:
+            response = self.client.get_object(
+                Bucket=self.bucket, Key=self.prefix + self.MANIFEST_KEY
+            )
+        except self.client.exceptions.NoSuchKey:
+            return None
+        return json.loads(response["Body"].read())
+
+    def list_remote(self) -> dict[str, dict]:
+        """Size and ETag of every object under the prefix, keyed by object key."""
+        remote = {}
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix):
+            for item in page.get("Contents", []):
+                remote[item["Key"]] = {
+                    "size": item["Size"],
+                    "etag": item["ETag"].strip('"'),
+                }
+        return remote
+
+    @staticmethod
+    def list_local(local_directory: Path) -> list[Path]:
+        if not local_directory.exists():
+            return []
+        return sorted(path for path in local_directory.rglob("*") if path.is_file())
+
+    def download_file(self, key: str, target: Path):
+        target.parent.mkdir(parents=True, exist_ok=True)
+        temporary_path = target.with_name(f".{target.name}.download")
+        self.client.download_file(
+            self.bucket, key, str(temporary_path), Config=self.transfer_config
+        )
+        os.replace(temporary_path, target)
+
+    def local_matches(self, path: Path, entry: dict) -> bool:
+        if not path.exists() or path.stat().st_size != entry["size"]:
+            return False
+        return self.local_etag(path) == entry["etag"]
+
+    def local_etag(self, path: Path) -> str:
+        """
+        The ETag S3 gives a file uploaded with this transfer config, the MD5 of the
+        file or for multipart uploads the MD5 of the part MD5s and the part count.
+        """
+        threshold = self.transfer_config.multipart_threshold
+        part_size = self.transfer_config.multipart_chunksize
+        part_digests = []
+        with open(path, "rb") as file:
+            if path.stat().st_size < threshold:
+                digest = md5()
+                for block in iter(lambda: file.read(1 << 20), b""):
+                    digest.update(block)
+                return digest.hexdigest()
+            for part in iter(lambda: file.read(part_size), b""):
+                part_digests.append(md5(part).digest())
+        return f"{md5(b''.join(part_digests)).hexdigest()}-{len(part_digests)}"
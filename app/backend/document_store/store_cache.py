@@ -0,0 +1,174 @@
+import fcntl
+import json
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator
+
+from opentelemetry import trace
+from store_format.archive import StoreArchive
+from store_format.manifest import hash_file
+
+tracer = trace.get_tracer("chatbot.document_store")
+
+
+@dataclass
+class CachedStore:
+    version: str
+    directory: Path
+    manifest: dict
+
+
+class StoreCache:
+    """
+    Local cache of published document store versions, one directory per version.
+    A version is only moved into place once every file matches the manifest, and
+    is validated against it again before it is reused.
+    """
+
+    MANIFEST_FILE = "store.json"
+    LOCK_FILE = ".lock"
+    WORKING_DIRECTORY = ".working"
+
+    def __init__(self, archive: StoreArchive, cache_directory: Path, keep: int = 2):
+        self.archive = archive
+        self.cache_directory = cache_directory
+        self.keep = keep
+
+    @staticmethod
+    def is_valid(directory: Path, manifest: dict) -> bool:
+        for name, expected in manifest["files"].items():
+            path = directory / name
+            if not path.is_file() or path.stat().st_size != expected["size"]:
+                return False
+            if hash_file(path) != expected["sha256"]:
+                return False
+        return True
+
+    def versions(self) -> list[CachedStore]:
+        """Cached versions, newest first."""
+        stores = []
+        if not self.cache_directory.exists():
+            return stores
+        for directory in self.cache_directory.iterdir():
+            manifest_path = directory / self.MANIFEST_FILE
+            if directory.name.startswith(".") or not manifest_path.exists():
+                continue
+            manifest = json.loads(manifest_path.read_text())
+            stores.append(CachedStore(manifest["version"], directory, manifest))
+        return sorted(
+            stores, key=lambda store: store.manifest["published"], reverse=True
+        )
+
+    @tracer.start_as_current_span("chatbot.StoreCache.latest_valid")
+    def latest_valid(self) -> CachedStore | None:
+        for store in self.versions():
+            if self.is_valid(store.directory, store.manifest):
+                return store
+            with self.lock():
+                # Another process may have put a good copy there since
+                if self.is_valid(store.directory, store.manifest):
+                    return store
+                self.discard(store.directory)
+        return None
+
+    @tracer.start_as_current_span("chatbot.StoreCache.fetch")
+    def fetch(self, manifest: dict) -> CachedStore:
+        """
+        Download a version into the cache. Every process extracts into a directory
+        of its own and the move into place is made under a lock on the cache, so
+        workers fetching the same version at once don't trip over each other and a
+        valid copy another process has already put in place is used as it is.
+        """
+        span = trace.get_current_span()
+        span.set_attribute("chatbot.document_store.version", manifest["version"])
+        directory = self.cache_directory / manifest["version"]
+        self.cache_directory.mkdir(parents=True, exist_ok=True)
+        partial = Path(
+            tempfile.mkdtemp(
+                prefix=f".{manifest['version']}.",
+                suffix=".partial",
+                dir=self.cache_directory,
+            )
+        )
+        try:
+            self.archive.extract(manifest, partial)
+            if not self.is_valid(partial, manifest):
+                raise ValueError(f"store {manifest['version']} failed its checksums")
+            (partial / self.MANIFEST_FILE).write_text(json.dumps(manifest))
+            with self.lock():
+                if self.is_valid(directory, manifest):
+                    span.set_attribute("chatbot.document_store.already_cached", True)
+                else:
+                    self.discard(directory)
+                    os.replace(partial, directory)
+                self.prune(keep_version=manifest["version"])
+        finally:
+            shutil.rmtree(partial, ignore_errors=True)
+        return CachedStore(manifest["version"], directory, manifest)
+
+    @tracer.start_as_current_span("chatbot.StoreCache.working_copy")
+    def working_copy(self, store: CachedStore) -> Path:
+        """
+        A copy of a cached version for this process alone. Chroma writes to its
+        sqlite file even when it is only queried, so serving from the cached
+        version itself would leave it failing its checksums and have the next
+        process to start discard it. Copies left by processes that have since
+        exited are removed.
+        """
+        working = self.cache_directory / self.WORKING_DIRECTORY
+        working.mkdir(parents=True, exist_ok=True)
+        copy = Path(
+            tempfile.mkdtemp(prefix=f"{store.version}.{os.getpid()}.", dir=working)
+        )
+        # Held so the version isn't discarded or pruned while it is copied
+        with self.lock():
+            self.remove_orphaned_copies(working)
+            shutil.copytree(
+                store.directory,
+                copy,
+                ignore=shutil.ignore_patterns(self.MANIFEST_FILE),
+                dirs_exist_ok=True,
+            )
+        return copy
+
+    @staticmethod
+    def remove_orphaned_copies(working: Path):
+        for directory in working.iterdir():
+            pid = int(directory.name.split(".")[-2])
+            try:
+                os.kill(pid, 0)
+            except ProcessLookupError:
+                shutil.rmtree(directory, ignore_errors=True)
+            except PermissionError:
+                pass
+
+    @contextmanager
+    def lock(self) -> Iterator[None]:
+        """Exclusive lock on the cache, held across processes."""
+        with open(self.cache_directory / self.LOCK_FILE, "a", encoding="utf-8") as file:
+            fcntl.flock(file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(file, fcntl.LOCK_UN)
+
+    def discard(self, directory: Path):
+        """
+        Move a directory out of the cache before removing it, so nothing looking
+        it up by version finds it half deleted.
+        """
+        if not directory.exists():
+            return
+        trash = Path(tempfile.mkdtemp(prefix=".discarded.", dir=self.cache_directory))
+        os.replace(directory, trash / directory.name)
+        shutil.rmtree(trash, ignore_errors=True)
+
+    def prune(self, keep_version: str):
+        """Remove all but the newest cached versions, never the one just fetched."""
+        for store in self.versions()[self.keep :]:
+            if store.version != keep_version:
+                self.discard(store.directory)
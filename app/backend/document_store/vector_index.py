@@ -0,0 +1,170 @@
+import copy
+import json
+import threading
+from pathlib import Path
+from typing import Any, Iterable, List, Optional, Tuple
+
+import numpy as np
+from langchain.schema import Document
+from langchain.schema.embeddings import Embeddings
+from langchain.vectorstores.base import VectorStore
+from store_format.vector_index import (
+    DOCUMENTS_FILE,
+    IDS_FILE,
+    INDEX_FILE,
+    OFFSETS_FILE,
+    VECTORS_FILE,
+    normalise,
+)
+
+from document_store.mmr import maximal_marginal_relevance, top_k
+
+
+class MmapVectorStore(VectorStore):  # pylint: disable=too-many-instance-attributes
+    """
+    Read only vector store over an index written by store_format's
+    export_vector_index. The files are memory mapped so every worker process on a
+    machine shares one copy of the index in the page cache rather than each
+    loading its own.
+    """
+
+    SCORE_BLOCK_ROWS = 16384
+
+    def __init__(self, directory: Path, embedding: Embeddings | None):
+        self.directory = directory
+        self.embedding = embedding
+        self.info = json.loads((directory / INDEX_FILE).read_text())
+        self.vectors = np.load(directory / VECTORS_FILE, mmap_mode="r")
+        self.offsets = np.load(directory / OFFSETS_FILE, mmap_mode="r")
+        self.records = (
+            np.memmap(directory / DOCUMENTS_FILE, dtype=np.uint8, mode="r")
+            if self.offsets[-1]
+            else np.zeros(0, dtype=np.uint8)
+        )
+        self.lock = threading.Lock()
+        self.ids: List[str] | None = None
+        self.rows_by_id: dict[str, int] | None = None
+
+    def __len__(self) -> int:
+        return self.info["count"]
+
+    def with_embedding(self, embedding: Embeddings) -> "MmapVectorStore":
+        """The same index with another embeddings provider, sharing what is loaded."""
+        store = copy.copy(self)
+        store.embedding = embedding
+        return store
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self.embedding
+
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: Optional[List[dict]] = None,
+        **kwargs: Any,
+    ) -> List[str]:
+        raise NotImplementedError("MmapVectorStore is read only, re-run the ingester")
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, **kwargs):
+        raise NotImplementedError("Build the index with export_vector_index")
+
+    def document(self, row: int) -> Document:
+        start, end = int(self.offsets[row]), int(self.offsets[row + 1])
+        record = json.loads(self.records[start:end].tobytes())
+        return Document(
+            page_content=record["page_content"], metadata=record["metadata"] or {}
+        )
+
+    def load_ids(self):
+        with self.lock:
+            if self.ids is None:
+                self.ids = json.loads((self.directory / IDS_FILE).read_text())
+                self.rows_by_id = {
+                    chunk_id: row for row, chunk_id in enumerate(self.ids)
+                }
+
+    def candidate_ids(self, embedding: List[float], k: int) -> List[str]:
+        """Ids of the k nearest chunks, nearest first."""
+        self.load_ids()
+        rows, _ = self.top_rows(embedding, k)
+        return [self.ids[row] for row in rows]
+
+    def documents_with_embeddings(
+        self, ids: List[str]
+    ) -> Tuple[List[Document], np.ndarray]:
+        """The documents and normalised embeddings of chunks, in the order given."""
+        self.load_ids()
+        rows = [self.rows_by_id[chunk_id] for chunk_id in ids]
+        vectors = np.asarray(self.vectors[rows], dtype=np.float32)
+        return [self.document(row) for row in rows], vectors
+
+    def scores(self, embedding: List[float]) -> np.ndarray:
+        """Cosine similarity of the embedding with every row, a block at a time."""
+        query = normalise(embedding)
+        scores = np.empty(len(self), dtype=np.float32)
+        for start in range(0, len(self), self.SCORE_BLOCK_ROWS):
+            block = np.asarray(
+                self.vectors[start : start + self.SCORE_BLOCK_ROWS], dtype=np.float32
+            )
+            scores[start : start + len(block)] = block @ query
+        return scores
+
+    def top_rows(self, embedding: List[float], k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """The k most similar rows, best first, and their similarities."""
+        scores = self.scores(embedding)
+        rows = top_k(scores, k)
+        return rows, scores[rows]
+
+    def similarity_search(
+        self, query: str, k: int = 4, **kwargs: Any
+    ) -> List[Document]:
+        return self.similarity_search_by_vector(self.embedding.embed_query(query), k)
+
+    def similarity_search_by_vector(
+        self, embedding: List[float], k: int = 4, **kwargs: Any
+    ) -> List[Document]:
+        rows, _ = self.top_rows(embedding, k)
+        return [self.document(row) for row in rows]
+
+    def similarity_search_with_score(
+        self, query: str, k: int = 4, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        """Documents with their cosine similarity to the query, higher is closer."""
+        rows, scores = self.top_rows(self.embedding.embed_query(query), k)
+        return [(self.document(row), float(score)) for row, score in zip(rows, scores)]
+
+    def _similarity_search_with_relevance_scores(
+        self, query: str, k: int = 4, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        return self.similarity_search_with_score(query, k)
+
+    def max_marginal_relevance_search(
+        self,
+        query: str,
+        k: int = 4,
+        fetch_k: int = 20,
+        lambda_mult: float = 0.5,
+        **kwargs: Any,
+    ) -> List[Document]:
+        return self.max_marginal_relevance_search_by_vector(
+            self.embedding.embed_query(query), k, fetch_k, lambda_mult
+        )
+
+    def max_marginal_relevance_search_by_vector(
+        self,
+        embedding: List[float],
+        k: int = 4,
+        fetch_k: int = 20,
+        lambda_mult: float = 0.5,
+        **kwargs: Any,
+    ) -> List[Document]:
+        rows, _ = self.top_rows(embedding, fetch_k)
+        # Read candidates in file order so the page cache is walked forwards
+        rows = np.sort(rows)
+        candidates = np.asarray(self.vectors[rows], dtype=np.float32)
+        selected = maximal_marginal_relevance(
+            normalise(embedding), candidates, k, lambda_mult
+        )
+        return [self.document(rows[index]) for index in selected]
@@ -0,0 +1,20 @@
+"""
+Gunicorn settings for serving the app. From the app directory:
+
+    gunicorn --config ./backend/gunicorn.conf.py app:app
+
+The master process imports the app and preloads what the workers can share, the
+installed packages, the document store and its indexes, before forking them, so
+booting more workers costs little more time or memory than booting one. Each
+worker then makes its own telemetry exporters, AWS and HTTP clients. Set
+PRELOAD_APP=false to have every worker load everything itself. The number of
+workers is set by WEB_CONCURRENCY, which Heroku sets for the dyno size.
+"""
+import os
+
+chdir = os.path.dirname(os.path.abspath(__file__))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = os.getenv("PRELOAD_APP", "true") == "true"
+
+# Tells app.py, imported after this, whether it is being preloaded
+os.environ["PRELOAD_APP"] = "true" if preload_app else "false"
@@ -12,6 +12,8 @@ tracer = trace.get_tracer("chatbot.messageData")
 class MessageData:
     """Encapsulates an Amazon DynamoDB table of movie data."""
 
+    MAX_BATCH_SIZE = 25
+
     def __init__(self, table, settings: ChatbotSettings):
         """
         :param dyn_resource: A Boto3 DynamoDB resource.
@@ -20,32 +22,101 @@ class MessageData:
         self.logger = logging.getLogger()
         self.settings = settings
 
-    def add_message(self, question: Message):
+    @staticmethod
+    def to_item(question: Message) -> dict:
+        return {
+            "messageId": question.messageId,
+            "userId": question.user,
+            "message": question.message.content,
+            "sources": question.sources,
+            "time": question.time,
+            "previousMessageId": question.previousMessageId,
+        }
+
+    @staticmethod
+    def from_item(item: dict) -> Message:
+        return Message.from_dict(
+            {
+                "content": item.get("message"),
+                "type": "ai" if item.get("userId") == "AI" else "human",
+                "messageId": item.get("messageId"),
+                "previousMessageId": item.get("previousMessageId"),
+                "sources": item.get("sources"),
+                "userId": item.get("userId"),
+                "time": int(item.get("time", 0)),
+            }
+        )
+
+    def get_conversation(self, message_id: str, limit: int) -> list[Message]:
+        """
+        Follow previousMessageId back from a message, returning up to limit
+        messages oldest first. Stops early at the start of the conversation or a
+        message that has not been written yet.
+        """
+        with tracer.start_as_current_span(
+            "chatbot.MessageData.get_conversation",
+            attributes={
+                "db.system": "dynamodb",
+                "db.name": self.settings.database_name_message,
+                "db.operation": "GetItem",
+            },
+            kind=trace.SpanKind.CLIENT,
+        ) as span:
+            messages: list[Message] = []
+            while message_id not in (None, "null") and len(messages) < limit:
+                try:
+                    item = self.table.get_item(Key={"messageId": message_id}).get(
+                        "Item"
+                    )
+                except ClientError as err:
+                    self.logger.error(
+                        "Couldn't get message %s from table %s. Here's why: %s: %s",
+                        message_id,
+                        self.table.name,
+                        err.response["Error"]["Code"],
+                        err.response["Error"]["Message"],
+                    )
+                    raise
+                if item is None:
+                    break
+                messages.append(MessageData.from_item(item))
+                message_id = item.get("previousMessageId")
+            span.set_attribute("chatbot.messages.found", len(messages))
+            return messages[::-1]
+
+    def write_batch(self, items: list[dict]) -> list[dict]:
+        """
+        Write up to MAX_BATCH_SIZE items with a single BatchWriteItem call.
+
+        :return: The items DynamoDB left unprocessed, these should be retried.
+        """
         with tracer.start_as_current_span(
-            "chatbot.MessageData.add_message",
+            "chatbot.MessageData.write_batch",
             attributes={
                 "db.system": "dynamodb",
                 "db.name": self.settings.database_name_message,
+                "db.operation": "BatchWriteItem",
+                "chatbot.messages.batch_size": len(items),
             },
             kind=trace.SpanKind.CLIENT,
         ):
             try:
-                self.table.put_item(
-                    Item={
-                        "messageId": question.messageId,
-                        "userId": question.user,
-                        "message": question.message.content,
-                        "sources": question.sources,
-                        "time": question.time,
-                        "previousMessageId": question.previousMessageId,
+                response = self.table.meta.client.batch_write_item(
+                    RequestItems={
+                        self.table.name: [
+                            {"PutRequest": {"Item": item}} for item in items
+                        ]
                     }
                 )
             except ClientError as err:
                 self.logger.error(
-                    "Couldn't add canvass %s to table %s. Here's why: %s: %s",
-                    question.user,
+                    "Couldn't write batch of %s messages to table %s. Here's why: %s: %s",
+                    len(items),
                     self.table.name,
                     err.response["Error"]["Code"],
                     err.response["Error"]["Message"],
                 )
                 raise
+
+            unprocessed = response.get("UnprocessedItems", {}).get(self.table.name, [])
+            return [request["PutRequest"]["Item"] for request in unprocessed]
@@ -0,0 +1,168 @@
+import asyncio
+import logging
+import time
+import weakref
+
+from botocore.exceptions import ClientError, HTTPClientError
+from botocore.exceptions import ConnectionError as BotoConnectionError
+from opentelemetry import metrics, trace
+from opentelemetry.metrics import CallbackOptions, Observation
+
+from messageData import MessageData
+from schema.message import Message
+from settings.chat_bot_settings import ChatbotSettings
+
+tracer = trace.get_tracer("chatbot.message_writer")
+meter = metrics.get_meter("chatbot.message_writer")
+
+_STOP = object()
+# Errors DynamoDB expects a batch to be retried after, anything else drops it
+RETRYABLE_ERROR_CODES = frozenset(
+    {
+        "InternalServerError",
+        "ProvisionedThroughputExceededException",
+        "RequestLimitExceeded",
+        "ServiceUnavailable",
+        "ThrottlingException",
+    }
+)
+_running_writers: "weakref.WeakSet[MessageWriter]" = weakref.WeakSet()
+
+
+def _observe_queue_depth(_: CallbackOptions):
+    yield Observation(sum(writer.queue_depth for writer in _running_writers))
+
+
+meter.create_observable_gauge(
+    "chatbot.message_writer.queue_depth",
+    callbacks=[_observe_queue_depth],
+    description="Messages waiting to be written to DynamoDB",
+)
+flush_duration = meter.create_histogram(
+    "chatbot.message_writer.flush_duration",
+    unit="ms",
+    description="Time taken to write a batch of messages including retries",
+)
+written_messages = meter.create_counter(
+    "chatbot.message_writer.written",
+    description="Messages written to DynamoDB",
+)
+failed_messages = meter.create_counter(
+    "chatbot.message_writer.failed",
+    description="Messages dropped after exhausting all write attempts",
+)
+
+
+class MessageWriter:
+    """
+    Persists messages from a background task so that the event loop never waits
+    on DynamoDB. Messages are queued, grouped into batches of up to 25 and written
+    whenever a batch fills up or the flush interval passes.
+    """
+
+    def __init__(self, message_data: MessageData, settings: ChatbotSettings):
+        self.message_data = message_data
+        self.batch_size = min(settings.message_batch_size, MessageData.MAX_BATCH_SIZE)
+        self.flush_interval = settings.message_flush_interval
+        self.write_attempts = settings.message_write_attempts
+        self.queue: asyncio.Queue = asyncio.Queue(settings.message_queue_size)
+        self.task: asyncio.Task | None = None
+        self.logger = logging.getLogger()
+
+    @property
+    def queue_depth(self) -> int:
+        return self.queue.qsize()
+
+    async def start(self):
+        if self.task is None:
+            self.task = asyncio.get_running_loop().create_task(self._run())
+            _running_writers.add(self)
+
+    async def stop(self):
+        """Write everything already queued then stop the background task."""
+        if self.task is None:
+            return
+        await self.queue.put(_STOP)
+        await self.task
+        self.task = None
+        _running_writers.discard(self)
+
+    async def add_message(self, message: Message):
+        if self.task is None:
+            await asyncio.to_thread(self.flush, [message])
+        else:
+            await self.queue.put(message)
+
+    async def _run(self):
+        stopping = False
+        while not stopping:
+            batch, stopping = await self._next_batch()
+            if batch:
+                await asyncio.to_thread(self.flush, batch)
+
+    async def _next_batch(self) -> tuple[list[Message], bool]:
+        loop = asyncio.get_running_loop()
+        first = await self.queue.get()
+        if first is _STOP:
+            return [], True
+
+        batch = [first]
+        deadline = loop.time() + self.flush_interval
+        while len(batch) < self.batch_size:
+            try:
+                message = self.queue.get_nowait()
+            except asyncio.QueueEmpty:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    message = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+            if message is _STOP:
+                return batch, True
+            batch.append(message)
+        return batch, False
+
+    def flush(self, messages: list[Message]):
+        """
+        Write messages to the table, retrying any DynamoDB left unprocessed and
+        the whole batch after throttling or a dropped connection. Only what is
+        still unwritten after the last attempt is dropped.
+        """
+        with tracer.start_as_current_span(
+            "chatbot.MessageWriter.flush",
+            attributes={"chatbot.messages.batch_size": len(messages)},
+        ) as span:
+            start = time.perf_counter()
+            pending = [MessageData.to_item(message) for message in messages]
+            attempts = 0
+            while pending and attempts < self.write_attempts:
+                if attempts:
+                    time.sleep(min(0.05 * 2**attempts, 2.0))
+                attempts += 1
+                try:
+                    pending = self.message_data.write_batch(pending)
+                except Exception as err:  # pylint: disable=broad-exception-caught
+                    span.record_exception(err)
+                    if not self.is_retryable(err):
+                        break
+
+            flush_duration.record((time.perf_counter() - start) * 1000)
+            written_messages.add(len(messages) - len(pending))
+            span.set_attribute("chatbot.messages.attempts", attempts)
+
+            if pending:
+                failed_messages.add(len(pending))
+                self.logger.error(
+                    "Dropped %s messages after %s attempts to write them to %s",
+                    len(pending),
+                    attempts,
+                    self.message_data.settings.database_name_message,
+                )
+
+    @staticmethod
+    def is_retryable(error: Exception) -> bool:
+        if isinstance(error, ClientError):
+            return error.response["Error"]["Code"] in RETRYABLE_ERROR_CODES
+        return isinstance(error, (BotoConnectionError, HTTPClientError))
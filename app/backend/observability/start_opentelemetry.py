@@ -1,5 +1,15 @@
 from opentelemetry.sdk.trace import TracerProvider
-from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+from opentelemetry.sdk.trace.export import (
+    BatchSpanProcessor,
+    ConsoleSpanExporter,
+    SpanExporter,
+)
+from opentelemetry.sdk.trace.sampling import (
+    ALWAYS_OFF,
+    ALWAYS_ON,
+    ParentBased,
+    TraceIdRatioBased,
+)
 from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
 from opentelemetry import _logs
 from opentelemetry.sdk._logs import LoggerProvider, LoggingHandler
@@ -13,29 +23,100 @@ from opentelemetry import trace
 import logging
 
 from observability.heroku_detector import HerokuResourceDetector
+from observability.tail_sampling import TailSamplingSpanProcessor
+from settings.chat_bot_settings import ChatbotSettings
 
+PROFILES = ("full", "tail", "ratio", "off")
 
-def startup() -> None:
-    otel_resource_attributes = HerokuResourceDetector()
-    tracer_provider = TracerProvider(resource=otel_resource_attributes.detect())
 
-    if HerokuResourceDetector.on_heroku():
-        tracer_provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
-    else:
-        tracer_provider.add_span_processor(BatchSpanProcessor(ConsoleSpanExporter()))
+def get_exporter_name(settings: ChatbotSettings) -> str:
+    if settings.telemetry_exporter is not None:
+        return settings.telemetry_exporter
+    return "otlp" if HerokuResourceDetector.on_heroku() else "console"
+
+
+def get_span_exporter(settings: ChatbotSettings) -> SpanExporter | None:
+    exporter = get_exporter_name(settings)
+    if exporter == "otlp":
+        return OTLPSpanExporter()
+    if exporter == "console":
+        return ConsoleSpanExporter()
+    return None
+
+
+def make_tracer_provider(
+    settings: ChatbotSettings, exporter: SpanExporter | None = None
+) -> TracerProvider:
+    """
+    Build the tracer provider for the telemetry profile:
+    "full" records and exports every span,
+    "tail" records every span but only exports traces sampled by the ratio, with
+    an error or slower than the slow request threshold,
+    "ratio" decides at the root span, following the caller's decision if there is
+    one, so unsampled requests record nothing,
+    "off" records nothing.
+    """
+    profile = settings.telemetry_profile
+    if profile not in PROFILES:
+        raise ValueError(f"telemetry_profile must be one of {PROFILES} not {profile}")
+
+    sampler = ALWAYS_ON
+    if profile == "ratio":
+        sampler = ParentBased(TraceIdRatioBased(settings.trace_sample_ratio))
+    elif profile == "off":
+        sampler = ALWAYS_OFF
+    tracer_provider = TracerProvider(
+        resource=HerokuResourceDetector().detect(), sampler=sampler
+    )
+
+    exporter = exporter or get_span_exporter(settings)
+    if exporter is None or profile == "off":
+        return tracer_provider
+    processor = BatchSpanProcessor(
+        exporter,
+        max_queue_size=settings.telemetry_max_queue_size,
+        max_export_batch_size=settings.telemetry_max_export_batch_size,
+        schedule_delay_millis=settings.telemetry_export_delay_ms,
+    )
+    if profile == "tail":
+        processor = TailSamplingSpanProcessor(
+            processor,
+            settings.trace_sample_ratio,
+            settings.trace_slow_request_ms / 1000,
+            settings.telemetry_max_queue_size,
+        )
+    tracer_provider.add_span_processor(processor)
+    return tracer_provider
 
-    trace.set_tracer_provider(tracer_provider)
 
+def startup(settings: ChatbotSettings) -> None:
+    otel_resource_attributes = HerokuResourceDetector()
+    trace.set_tracer_provider(make_tracer_provider(settings))
+
+    exporting = get_exporter_name(settings) == "otlp"
     metrics.set_meter_provider(
         MeterProvider(
             resource=otel_resource_attributes.detect(),
-            metric_readers=[PeriodicExportingMetricReader(OTLPMetricExporter())],
+            metric_readers=(
+                [PeriodicExportingMetricReader(OTLPMetricExporter())]
+                if exporting
+                else []
+            ),
         )
     )
 
-    logging.basicConfig(level=logging.DEBUG)
+    logging.basicConfig(level=settings.log_level)
+    if not exporting or settings.telemetry_profile == "off":
+        return
     logger_provider = LoggerProvider(resource=otel_resource_attributes.detect())
-    logger_provider.add_log_record_processor(BatchLogRecordProcessor(OTLPLogExporter()))
+    logger_provider.add_log_record_processor(
+        BatchLogRecordProcessor(
+            OTLPLogExporter(),
+            max_queue_size=settings.telemetry_max_queue_size,
+            max_export_batch_size=settings.telemetry_max_export_batch_size,
+            schedule_delay_millis=settings.telemetry_export_delay_ms,
+        )
+    )
 
     _logs.set_logger_provider(logger_provider)
 
@@ -0,0 +1,84 @@
+import threading
+from collections import OrderedDict
+from typing import List, Optional
+
+from opentelemetry.context import Context
+from opentelemetry.sdk.trace import ReadableSpan, Span, SpanProcessor
+from opentelemetry.trace import StatusCode
+
+TRACE_ID_LIMIT = 1 << 64
+
+
+class TailSamplingSpanProcessor(
+    SpanProcessor
+):  # pylint: disable=too-many-instance-attributes
+    """
+    Holds the spans of each trace until its local root span ends, then passes the
+    whole trace on to the wrapped processor if the trace id falls within the ratio,
+    any span recorded an error or the root span took longer than the slow
+    threshold. Everything else is dropped before it is serialised or exported.
+
+    At most max_traces traces are held, the oldest is dropped to make room so a
+    root span that never ends cannot grow the buffer.
+    """
+
+    def __init__(
+        self,
+        processor: SpanProcessor,
+        ratio: float,
+        slow_seconds: float,
+        max_traces: int = 2048,
+    ):
+        self.processor = processor
+        self.bound = round(ratio * TRACE_ID_LIMIT)
+        self.slow_nanoseconds = slow_seconds * 1e9
+        self.max_traces = max_traces
+        self.lock = threading.Lock()
+        self.traces: OrderedDict[int, List[ReadableSpan]] = OrderedDict()
+        self.errors: set[int] = set()
+        self.kept = 0
+        self.dropped = 0
+
+    def on_start(self, span: Span, parent_context: Optional[Context] = None):
+        self.processor.on_start(span, parent_context)
+
+    def on_end(self, span: ReadableSpan):
+        trace_id = span.context.trace_id
+        is_root = span.parent is None or span.parent.is_remote
+        with self.lock:
+            spans = self.traces.pop(trace_id, [])
+            spans.append(span)
+            if self.has_error(span):
+                self.errors.add(trace_id)
+            if not is_root:
+                self.traces[trace_id] = spans
+                while len(self.traces) > self.max_traces:
+                    evicted, evicted_spans = self.traces.popitem(last=False)
+                    self.errors.discard(evicted)
+                    self.dropped += len(evicted_spans)
+                return
+            keep = (
+                trace_id & (TRACE_ID_LIMIT - 1) < self.bound
+                or trace_id in self.errors
+                or span.end_time - span.start_time > self.slow_nanoseconds
+            )
+            self.errors.discard(trace_id)
+            if keep:
+                self.kept += len(spans)
+            else:
+                self.dropped += len(spans)
+        if keep:
+            for kept_span in spans:
+                self.processor.on_end(kept_span)
+
+    @staticmethod
+    def has_error(span: ReadableSpan) -> bool:
+        return span.status.status_code == StatusCode.ERROR or any(
+            event.name == "exception" for event in span.events
+        )
+
+    def shutdown(self):
+        self.processor.shutdown()
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        return self.processor.force_flush(timeout_millis)
@@ -0,0 +1,211 @@
+import asyncio
+import re
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from langchain.callbacks.manager import AsyncCallbackManagerForChainRun
+from langchain.chains import ConversationalRetrievalChain
+from langchain.chains.conversational_retrieval.base import _get_chat_history
+from langchain.schema import Document, Generation, LLMResult
+from langchain.schema.embeddings import Embeddings
+from opentelemetry import trace
+
+from query.context_packer import ContextPacker
+from query.semantic_cache import CachedAnswer, SemanticCache
+
+# What replayed answers are reported as to the callbacks
+SEMANTIC_CACHE_LLM_NAME = "SemanticCache"
+# Input holding a lookup already made for a first turn, so it is not made again
+SEMANTIC_CACHE_LOOKUP_KEY = "semantic_cache_lookup"
+
+
+@dataclass
+class CacheLookup:
+    """The cached answer found for a question, and its embedding if it was needed"""
+
+    cached: CachedAnswer | None
+    embedding: list[float] | None = None
+
+
+class CachedConversationalRetrievalChain(ConversationalRetrievalChain):
+    """
+    ConversationalRetrievalChain that checks a semantic cache once the standalone
+    question is known. Cached answers are replayed through the same callbacks as a
+    streamed answer so the websocket sees the usual start, stream and end frames.
+
+    First turns skip the condense question LLM call, follow ups can optionally
+    retrieve documents for the raw question while it is being condensed.
+    """
+
+    semantic_cache: Optional[SemanticCache] = None
+    embeddings: Optional[Embeddings] = None
+    speculative_retrieval: bool = False
+    """Retrieve documents for the raw follow up question while it is condensed."""
+    context_packer: Optional[ContextPacker] = None
+    """Fit the retrieved documents into a token budget before answering."""
+
+    async def _acall(
+        self,
+        inputs: Dict[str, Any],
+        run_manager: Optional[AsyncCallbackManagerForChainRun] = None,
+    ) -> Dict[str, Any]:
+        _run_manager = run_manager or AsyncCallbackManagerForChainRun.get_noop_manager()
+        current_span = trace.get_current_span()
+        get_chat_history = self.get_chat_history or _get_chat_history
+        chat_history_str = get_chat_history(inputs["chat_history"])
+        current_span.set_attribute("chatbot.question.condensed", bool(chat_history_str))
+
+        speculative_docs = None
+        if chat_history_str and self.speculative_retrieval:
+            speculative_docs = asyncio.create_task(
+                self._aget_docs(inputs["question"], inputs, run_manager=_run_manager)
+            )
+
+        try:
+            new_question = await self._generate_question(
+                inputs["question"], chat_history_str, _run_manager
+            )
+            docs = None
+            if speculative_docs is not None:
+                docs = await self._use_speculative_docs(
+                    inputs["question"], new_question, speculative_docs
+                )
+
+            if self.semantic_cache is None:
+                return await self._answer(
+                    new_question, inputs, chat_history_str, _run_manager, docs
+                )
+
+            lookup = None if chat_history_str else inputs.get(SEMANTIC_CACHE_LOOKUP_KEY)
+            if lookup is None:
+                lookup = await self.alookup(new_question)
+            if lookup.cached is not None:
+                await self._replay(new_question, lookup.cached.answer, _run_manager)
+                return self._output(
+                    lookup.cached.answer, lookup.cached.sources, new_question
+                )
+
+            output = await self._answer(
+                new_question, inputs, chat_history_str, _run_manager, docs
+            )
+        finally:
+            if speculative_docs is not None:
+                speculative_docs.cancel()
+
+        self.semantic_cache.add(
+            new_question,
+            lookup.embedding,
+            output[self.output_key],
+            output.get("source_documents", []),
+        )
+        return output
+
+    async def alookup(self, question: str) -> CacheLookup | None:
+        """
+        Look a standalone question up in the semantic cache, by its text if it is
+        pinned and otherwise by its embedding. None if there is no cache.
+        """
+        if self.semantic_cache is None:
+            return None
+        current_span = trace.get_current_span()
+        cached = self.semantic_cache.lookup_question(question)
+        current_span.set_attribute(
+            "chatbot.semantic_cache.pinned_hit", cached is not None
+        )
+        embedding = None
+        if cached is None:
+            embedding = await self.embeddings.aembed_query(question)
+            cached = self.semantic_cache.lookup(embedding)
+        current_span.set_attribute("chatbot.semantic_cache.hit", cached is not None)
+        if cached is not None:
+            current_span.set_attribute(
+                "chatbot.semantic_cache.matched_question", cached.question
+            )
+        return CacheLookup(cached, embedding)
+
+    async def _generate_question(
+        self,
+        question: str,
+        chat_history_str: str,
+        run_manager: AsyncCallbackManagerForChainRun,
+    ) -> str:
+        """Condense the chat history into a standalone question, first turns are
+        already standalone so skip the LLM call entirely."""
+        if not chat_history_str:
+            return question
+        return await self.question_generator.arun(
+            question=question,
+            chat_history=chat_history_str,
+            callbacks=run_manager.get_child(),
+        )
+
+    @staticmethod
+    async def _use_speculative_docs(
+        question: str, new_question: str, speculative_docs: asyncio.Task
+    ) -> List[Document] | None:
+        """
+        Documents retrieved for the raw question while it was being condensed are
+        only used if condensing left the question unchanged.
+        """
+        reused = " ".join(question.lower().split()) == " ".join(
+            new_question.lower().split()
+        )
+        trace.get_current_span().set_attribute(
+            "chatbot.speculative_retrieval.used", reused
+        )
+        if not reused:
+            speculative_docs.cancel()
+            return None
+        return await speculative_docs
+
+    async def _answer(
+        self,
+        new_question: str,
+        inputs: Dict[str, Any],
+        chat_history_str: str,
+        run_manager: AsyncCallbackManagerForChainRun,
+        docs: List[Document] | None = None,
+    ) -> Dict[str, Any]:
+        if docs is None:
+            docs = await self._aget_docs(new_question, inputs, run_manager=run_manager)
+
+        new_inputs = inputs.copy()
+        if self.rephrase_question:
+            new_inputs["question"] = new_question
+        new_inputs["chat_history"] = chat_history_str
+        if self.context_packer is not None:
+            docs = await asyncio.to_thread(
+                self.context_packer.pack, docs, new_inputs["question"]
+            )
+        answer = await self.combine_docs_chain.arun(
+            input_documents=docs, callbacks=run_manager.get_child(), **new_inputs
+        )
+        return self._output(answer, docs, new_question)
+
+    def _output(
+        self, answer: str, docs: List[Document], new_question: str
+    ) -> Dict[str, Any]:
+        output: Dict[str, Any] = {self.output_key: answer}
+        if self.return_source_documents:
+            output["source_documents"] = docs
+        if self.return_generated_question:
+            output["generated_question"] = new_question
+        return output
+
+    async def _replay(
+        self,
+        new_question: str,
+        answer: str,
+        run_manager: AsyncCallbackManagerForChainRun,
+    ):
+        llm_runs = await run_manager.get_child().on_llm_start(
+            {
+                "name": SEMANTIC_CACHE_LLM_NAME,
+                "id": ["chatbot", SEMANTIC_CACHE_LLM_NAME],
+            },
+            [new_question],
+        )
+        for llm_run in llm_runs:
+            for token in re.findall(r"\s*\S+", answer):
+                await llm_run.on_llm_new_token(token)
+            await llm_run.on_llm_end(LLMResult(generations=[[Generation(text=answer)]]))
@@ -3,23 +3,31 @@ from uuid import UUID, uuid4
 from langchain.callbacks.base import AsyncCallbackHandler
 from fastapi import WebSocket
 from typing import Any, Dict, List
-from messageData import MessageData
+from message_writer import MessageWriter
 
 from schema.message import Message
+from conversation_store import Conversation
 
 
 class FinalAnswerCallback(AsyncCallbackHandler):
-    """Callback handler for streaming LLM responses."""
+    """
+    Callback handler for streaming LLM responses. Passed as a run level callback
+    so it is inherited by every child chain, only the outermost chain's start and
+    end are reported.
+    """
 
     def __init__(
         self,
         websocket: WebSocket,
         previous_message: Message,
-        message_data_table: MessageData,
+        message_writer: MessageWriter,
+        conversation: Conversation | None = None,
     ):
         self.websocket = websocket
         self.previous_message = previous_message
-        self.messageDataTable = message_data_table
+        self.message_writer = message_writer
+        self.conversation = conversation
+        self.response_message_id = str(uuid4())
 
     async def on_chain_start(
         self,
@@ -32,17 +40,18 @@ class FinalAnswerCallback(AsyncCallbackHandler):
         metadata: Dict[str, Any] | None = None,
         **kwargs: Any
     ) -> None:
-        response_message_id = str(uuid4())
+        if parent_run_id is not None:
+            return
         response_message_time = int(time.time() * 1000)
         start_resp = {
             "sender": "bot",
-            "messageId": response_message_id,
+            "messageId": self.response_message_id,
             "previousMessageId": self.previous_message.messageId,
             "time": response_message_time,
             "type": "start",
         }
         await self.websocket.send_json(start_resp)
-        self.messageDataTable.add_message(self.previous_message)
+        await self.message_writer.add_message(self.previous_message)
 
     async def on_chain_end(
         self,
@@ -53,15 +62,18 @@ class FinalAnswerCallback(AsyncCallbackHandler):
         tags: List[str] | None = None,
         **kwargs: Any
     ) -> None:
-        response_message_id = str(uuid4())
+        if parent_run_id is not None:
+            return
         response_message_time = int(time.time() * 1000)
         output_message = Message.from_langchain_result(
             outputs.get("answer"),
             outputs.get("source_documents"),
             self.previous_message.messageId,
-            response_message_id,
+            self.response_message_id,
             response_message_time,
         )
+        if self.conversation is not None:
+            self.conversation.add(output_message)
 
         await self.websocket.send_json(
             {
@@ -74,4 +86,4 @@ class FinalAnswerCallback(AsyncCallbackHandler):
             }
         )
 
-        self.messageDataTable.add_message(output_message)
+        await self.message_writer.add_message(output_message)
@@ -4,14 +4,91 @@ from langchain.schema.document import Document
 from langchain.schema.messages import BaseMessage
 from langchain.schema.output import ChatGenerationChunk, GenerationChunk, LLMResult
 from tenacity import RetryCallState
-from opentelemetry import trace
+from opentelemetry import metrics, trace
+from query.cached_retrieval_chain import SEMANTIC_CACHE_LLM_NAME
 
-from typing import Any, Dict, List, Optional, Sequence, Union
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Sequence, Union
 from uuid import UUID
 
+meter = metrics.get_meter("chatbot.llm")
+time_to_first_token = meter.create_histogram(
+    "chatbot.llm.time_to_first_token",
+    unit="ms",
+    description="Time from an LLM run starting to its first streamed token",
+)
+inter_token_latency = meter.create_histogram(
+    "chatbot.llm.inter_token_latency",
+    unit="ms",
+    description="Time between consecutive streamed tokens",
+)
+tokens_per_second = meter.create_histogram(
+    "chatbot.llm.tokens_per_second",
+    unit="1/s",
+    description="Streamed tokens per second from the first token to the last",
+)
+streamed_tokens = meter.create_counter(
+    "chatbot.llm.tokens", description="Tokens streamed by LLM runs"
+)
+
+
+@dataclass
+class TokenStats:
+    """Timings of the tokens streamed by one LLM run."""
+
+    started: float
+    first_token: float | None = None
+    last_token: float | None = None
+    tokens: int = 0
+    max_gap: float = 0.0
+    parent_run_id: UUID | None = None
+    replayed: bool = False
+    """A cached answer replayed as if streamed, not timed as an LLM's tokens."""
+
 
 class OpentelemetryCallback(AsyncCallbackHandler):
-    """Callback handler to submit events to opentelemetry"""
+    """
+    Callback handler to submit events to opentelemetry. Streamed tokens are
+    summarised as metrics and span attributes when the LLM run ends rather than
+    added to the span one by one, setting token_event_interval adds an event for
+    every nth token of a run.
+
+    Answers replayed from the semantic cache are marked on the span and kept out
+    of the latency and throughput metrics.
+    """
+
+    # Runs cancelled along with their question never end, past this many the
+    # oldest are let go
+    MAX_RUNS = 1000
+
+    def __init__(
+        self,
+        token_event_interval: int = 0,
+        clock: Callable[[], float] = time.perf_counter,
+    ):
+        self.token_event_interval = token_event_interval
+        self.clock = clock
+        self.runs: OrderedDict[UUID, TokenStats] = OrderedDict()
+
+    def _start_run(
+        self, run_id: UUID, parent_run_id: UUID | None, replayed: bool = False
+    ) -> TokenStats:
+        stats = self.runs[run_id] = TokenStats(
+            self.clock(), parent_run_id=parent_run_id, replayed=replayed
+        )
+        while len(self.runs) > self.MAX_RUNS:
+            self.runs.popitem(last=False)
+        return stats
+
+    def _forget_children(self, run_id: UUID):
+        """Drop the runs of a chain that has finished, in case they never ended."""
+        children = [
+            child for child, stats in self.runs.items() if stats.parent_run_id == run_id
+        ]
+        for child in children:
+            del self.runs[child]
 
     async def on_llm_start(
         self,
@@ -25,6 +102,9 @@ class OpentelemetryCallback(AsyncCallbackHandler):
         **kwargs: Any,
     ) -> None:
         """Run when LLM starts running."""
+        self._start_run(
+            run_id, parent_run_id, serialized.get("name") == SEMANTIC_CACHE_LLM_NAME
+        )
         current_span = trace.get_current_span()
         current_span.add_event(
             "on_llm_start",
@@ -46,6 +126,7 @@ class OpentelemetryCallback(AsyncCallbackHandler):
         **kwargs: Any,
     ) -> Any:
         """Run when a chat model starts running."""
+        self._start_run(run_id, parent_run_id)
         current_span = trace.get_current_span()
         current_span.add_event(
             "on_chat_model_start",
@@ -67,14 +148,50 @@ class OpentelemetryCallback(AsyncCallbackHandler):
         **kwargs: Any,
     ) -> None:
         """Run on new LLM token. Only available when streaming is enabled."""
-        current_span = trace.get_current_span()
-        current_span.add_event(
-            "on_llm_new_token",
-            attributes={
-                "chatbot.llms.run_id": str(run_id),
-                "chatbot.llms.parent_run_id": str(parent_run_id),
-            },
-        )
+        stats = self.runs.get(run_id) or self._start_run(run_id, parent_run_id)
+        now = self.clock()
+        if stats.last_token is None:
+            stats.first_token = now
+        else:
+            gap = now - stats.last_token
+            inter_token_latency.record(gap * 1000)
+            stats.max_gap = max(stats.max_gap, gap)
+        stats.last_token = now
+        stats.tokens += 1
+
+        interval = self.token_event_interval
+        if interval and (stats.tokens - 1) % interval == 0:
+            trace.get_current_span().add_event(
+                "on_llm_new_token",
+                attributes={
+                    "chatbot.llms.run_id": str(run_id),
+                    "chatbot.llms.token_index": stats.tokens,
+                },
+            )
+
+    def record_token_stats(self, run_id: UUID, span: trace.Span):
+        stats = self.runs.pop(run_id, None)
+        if stats is None or stats.tokens == 0:
+            return
+        if stats.replayed:
+            span.set_attributes(
+                {"chatbot.llm.replayed": True, "chatbot.llm.tokens": stats.tokens}
+            )
+            return
+        first_token_ms = (stats.first_token - stats.started) * 1000
+        streaming_seconds = stats.last_token - stats.first_token
+        time_to_first_token.record(first_token_ms)
+        streamed_tokens.add(stats.tokens)
+        attributes = {
+            "chatbot.llm.tokens": stats.tokens,
+            "chatbot.llm.time_to_first_token_ms": first_token_ms,
+            "chatbot.llm.max_inter_token_latency_ms": stats.max_gap * 1000,
+        }
+        if stats.tokens > 1 and streaming_seconds > 0:
+            rate = (stats.tokens - 1) / streaming_seconds
+            tokens_per_second.record(rate)
+            attributes["chatbot.llm.tokens_per_second"] = rate
+        span.set_attributes(attributes)
 
     async def on_llm_end(
         self,
@@ -87,6 +204,7 @@ class OpentelemetryCallback(AsyncCallbackHandler):
     ) -> None:
         """Run when LLM ends running."""
         current_span = trace.get_current_span()
+        self.record_token_stats(run_id, current_span)
         current_span.add_event(
             "on_llm_end",
             attributes={
@@ -106,6 +224,7 @@ class OpentelemetryCallback(AsyncCallbackHandler):
     ) -> None:
         """Run when LLM errors."""
         current_span = trace.get_current_span()
+        self.record_token_stats(run_id, current_span)
         current_span.record_exception(
             error,
             attributes={
@@ -153,6 +272,7 @@ class OpentelemetryCallback(AsyncCallbackHandler):
         **kwargs: Any,
     ) -> None:
         """Run when chain ends running."""
+        self._forget_children(run_id)
         current_span = trace.get_current_span()
         current_span.add_event(
             "on_chain_end",
@@ -172,6 +292,7 @@ class OpentelemetryCallback(AsyncCallbackHandler):
         **kwargs: Any,
     ) -> None:
         """Run when chain errors."""
+        self._forget_children(run_id)
         current_span = trace.get_current_span()
         current_span.record_exception(
             error,
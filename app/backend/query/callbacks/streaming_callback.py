@@ -1,15 +1,50 @@
+import time
 from langchain.callbacks.base import AsyncCallbackHandler
-from fastapi import WebSocket
 from typing import Any
+from opentelemetry import metrics, trace
+from stream_writer import StreamWriter
+
+meter = metrics.get_meter("chatbot.streaming")
+time_to_first_token = meter.create_histogram(
+    "chatbot.chat.time_to_first_token",
+    unit="ms",
+    description="Time from receiving a question to streaming the first answer token",
+)
 
 
 class StreamingCallback(AsyncCallbackHandler):
     """Callback handler for streaming LLM responses."""
 
-    def __init__(self, websocket: WebSocket):
-        self.websocket = websocket
+    def __init__(
+        self,
+        stream_writer: StreamWriter,
+        question_received: float | None = None,
+        attributes: dict[str, Any] | None = None,
+    ):
+        self.stream_writer = stream_writer
+        self.question_received = question_received
+        self.attributes = attributes or {}
+        self.first_token_sent = False
         super().__init__()
 
     async def on_llm_new_token(self, token: str, **kwargs: Any) -> None:
-        resp = {"sender": "bot", "message": token, "type": "stream"}
-        await self.websocket.send_json(resp)
+        await self.stream_writer.write(token)
+        if not self.first_token_sent:
+            self.first_token_sent = True
+            self.record_time_to_first_token()
+
+    async def on_llm_end(self, response: Any, **kwargs: Any) -> None:
+        # The end frame must not overtake the last of the stream
+        await self.stream_writer.flush()
+
+    async def on_llm_error(self, error: BaseException, **kwargs: Any) -> None:
+        await self.stream_writer.flush()
+
+    def record_time_to_first_token(self):
+        if self.question_received is None:
+            return
+        elapsed = (time.perf_counter() - self.question_received) * 1000
+        time_to_first_token.record(elapsed, self.attributes)
+        trace.get_current_span().set_attribute(
+            "chatbot.chat.time_to_first_token_ms", elapsed
+        )
@@ -0,0 +1,153 @@
+from functools import lru_cache
+from typing import List
+
+import tiktoken
+from langchain.schema import Document
+from opentelemetry import trace
+
+from settings.chat_bot_settings import ChatbotSettings
+
+tracer = trace.get_tracer("chatbot.context_packer")
+
+# Token count the ingester stores in each chunk's metadata
+TOKENS_METADATA_KEY = "tokens"
+
+CONTEXT_WINDOWS = {
+    "gpt-3.5-turbo": 4096,
+    "gpt-3.5-turbo-16k": 16385,
+    "gpt-3.5-turbo-1106": 16385,
+    "gpt-4": 8192,
+    "gpt-4-32k": 32768,
+    "gpt-4-1106-preview": 128000,
+}
+DEFAULT_CONTEXT_WINDOW = 4096
+
+# Chat messages are framed with a few tokens each and the stuff chain joins
+# documents with a blank line
+MESSAGE_OVERHEAD_TOKENS = 16
+SEPARATOR_TOKENS = 1
+
+
+class ContextPacker:  # pylint: disable=too-many-instance-attributes
+    """
+    Chooses the documents the stuff chain puts into the prompt. Documents are taken
+    in the order they were retrieved until the token budget is used up, the budget
+    being the smaller of context_token_budget and whatever the model's window has
+    left after the prompt, the question and max_tokens for the answer.
+
+    Documents already contained in one that has been packed are dropped, text that
+    repeats the end of a packed document, as overlapping chunks do, is cut off and
+    the document that crosses the budget is truncated rather than left out.
+    """
+
+    def __init__(
+        self,
+        settings: ChatbotSettings,
+        encoding: tiktoken.Encoding | None = None,
+    ):
+        self.model_name = settings.model_name
+        self.token_budget = settings.context_token_budget
+        self.context_window = settings.context_window or CONTEXT_WINDOWS.get(
+            settings.model_name, DEFAULT_CONTEXT_WINDOW
+        )
+        self.max_tokens = settings.max_tokens
+        self.prompt = settings.system_prompt.replace("{context}", "")
+        self.min_document_tokens = settings.context_min_document_tokens
+        self.min_overlap_characters = settings.context_min_overlap_characters
+        self._encoding = encoding
+        self.count_tokens = lru_cache(maxsize=settings.context_token_cache_size)(
+            self._count_tokens
+        )
+
+    @property
+    def encoding(self) -> tiktoken.Encoding:
+        # Loaded on first use as tiktoken may need to download the encoding
+        if self._encoding is None:
+            self._encoding = tiktoken.encoding_for_model(self.model_name)
+        return self._encoding
+
+    def _count_tokens(self, text: str) -> int:
+        return len(self.encoding.encode(text))
+
+    def document_tokens(self, document: Document) -> int:
+        tokens = document.metadata.get(TOKENS_METADATA_KEY)
+        if tokens is None:
+            tokens = self.count_tokens(document.page_content)
+        return tokens
+
+    def budget(self, question: str) -> int:
+        available = (
+            self.context_window
+            - self.max_tokens
+            - self.count_tokens(self.prompt)
+            - self.count_tokens(question)
+            - MESSAGE_OVERHEAD_TOKENS
+        )
+        return max(0, min(self.token_budget, available))
+
+    def truncate(self, text: str, tokens: int) -> str:
+        return self.encoding.decode(self.encoding.encode(text)[:tokens])
+
+    def overlap(self, previous: str, text: str) -> int:
+        """Length of the longest start of text that previous ends with."""
+        head = text[: self.min_overlap_characters]
+        if len(head) < self.min_overlap_characters:
+            return 0
+        start = previous.find(head, max(0, len(previous) - len(text)))
+        while start != -1:
+            if text.startswith(previous[start:]):
+                return len(previous) - start
+            start = previous.find(head, start + 1)
+        return 0
+
+    def remove_overlap(self, text: str, packed: List[str]) -> str | None:
+        """The part of text not already packed, None if all of it has been."""
+        for previous in packed:
+            if text in previous:
+                return None
+            overlap = self.overlap(previous, text)
+            if overlap:
+                text = text[overlap:].lstrip()
+        return text
+
+    def pack(self, documents: List[Document], question: str) -> List[Document]:
+        with tracer.start_as_current_span("chatbot.ContextPacker.pack") as span:
+            budget = self.budget(question)
+            packed: List[Document] = []
+            used = retrieved = trimmed = 0
+
+            for document in documents:
+                tokens = self.document_tokens(document)
+                retrieved += tokens
+                text = self.remove_overlap(
+                    document.page_content, [doc.page_content for doc in packed]
+                )
+                if not text:
+                    continue
+                if text != document.page_content:
+                    tokens = self.count_tokens(text)
+
+                remaining = budget - used - SEPARATOR_TOKENS
+                if tokens > remaining:
+                    if remaining < self.min_document_tokens and packed:
+                        continue
+                    text = self.truncate(text, max(0, remaining))
+                    tokens = remaining
+                if not text:
+                    continue
+
+                if text != document.page_content:
+                    trimmed += 1
+                    metadata = dict(document.metadata)
+                    metadata.pop(TOKENS_METADATA_KEY, None)
+                    document = Document(page_content=text, metadata=metadata)
+                packed.append(document)
+                used += tokens + SEPARATOR_TOKENS
+
+            span.set_attribute("chatbot.context.budget_tokens", budget)
+            span.set_attribute("chatbot.context.retrieved_tokens", retrieved)
+            span.set_attribute("chatbot.context.packed_tokens", used)
+            span.set_attribute("chatbot.context.retrieved_documents", len(documents))
+            span.set_attribute("chatbot.context.packed_documents", len(packed))
+            span.set_attribute("chatbot.context.trimmed_documents", trimmed)
+            return packed
@@ -0,0 +1,81 @@
+import asyncio
+from typing import Any, List
+
+from langchain.callbacks.manager import (
+    AsyncCallbackManagerForRetrieverRun,
+    CallbackManagerForRetrieverRun,
+)
+from langchain.schema import BaseRetriever, Document
+from opentelemetry import trace
+from store_format.vector_index import normalise
+
+from document_store.bm25 import BM25Index
+from document_store.mmr import maximal_marginal_relevance
+
+tracer = trace.get_tracer("chatbot.hybrid_retriever")
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[str]:
+    """Merge rankings by summing 1 / (k + rank) for every ranking an id appears in."""
+    scores: dict[str, float] = {}
+    for ranking in rankings:
+        for rank, chunk_id in enumerate(ranking, start=1):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Retrieves candidates both by embedding similarity and by BM25 over the chunk
+    text, merges the two rankings with reciprocal rank fusion and picks the final
+    documents from the fused candidates with MMR. Exact product names and error
+    strings that embeddings rank poorly are found by the lexical side.
+
+    The vector store must provide candidate_ids and documents_with_embeddings, as
+    MmrChroma and MmapVectorStore do.
+    """
+
+    vector_store: Any
+    lexical_index: BM25Index
+    k: int = 4
+    fetch_k: int = 20
+    lexical_k: int = 20
+    lambda_mult: float = 0.5
+    rrf_k: int = 60
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        embedding = self.vector_store.embeddings.embed_query(query)
+        return self._select(query, embedding)
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        embedding = await self.vector_store.embeddings.aembed_query(query)
+        return await asyncio.to_thread(self._select, query, embedding)
+
+    def _select(self, query: str, embedding: List[float]) -> List[Document]:
+        with tracer.start_as_current_span("chatbot.HybridRetriever.select") as span:
+            vector_ids = self.vector_store.candidate_ids(embedding, self.fetch_k)
+            lexical_ids = [
+                chunk_id
+                for chunk_id, _ in self.lexical_index.search(query, self.lexical_k)
+            ]
+            fused = reciprocal_rank_fusion([vector_ids, lexical_ids], self.rrf_k)
+            candidates = fused[: self.fetch_k]
+            span.set_attribute("chatbot.retrieval.vector_candidates", len(vector_ids))
+            span.set_attribute("chatbot.retrieval.lexical_candidates", len(lexical_ids))
+            span.set_attribute(
+                "chatbot.retrieval.lexical_only",
+                len(set(candidates) - set(vector_ids)),
+            )
+
+            documents, vectors = self.vector_store.documents_with_embeddings(candidates)
+            selected = maximal_marginal_relevance(
+                normalise(embedding), vectors, self.k, self.lambda_mult
+            )
+            return [documents[index] for index in selected]
@@ -1,26 +1,40 @@
 from pathlib import Path
 from fastapi import WebSocket
-from langchain.chains import ConversationalRetrievalChain
+from langchain.callbacks.base import BaseCallbackHandler
 from langchain.embeddings.openai import OpenAIEmbeddings
-from langchain.vectorstores.chroma import Chroma
+from langchain.schema import BaseRetriever
+from langchain.schema.embeddings import Embeddings
+from langchain.schema.language_model import BaseLanguageModel
 from langchain.vectorstores.base import VectorStore
 from langchain.prompts import (
     SystemMessagePromptTemplate,
     HumanMessagePromptTemplate,
     ChatPromptTemplate,
 )
-from messageData import MessageData
+from message_writer import MessageWriter
+from conversation_store import Conversation
+from stream_writer import StreamWriter
 from schema.message import Message
 from query.callbacks.final_answer import FinalAnswerCallback
+from query.cached_retrieval_chain import CachedConversationalRetrievalChain
+from query.context_packer import ContextPacker
+from query.hybrid_retriever import HybridRetriever
+from query.semantic_cache import SemanticCache
+from query.warm_cache import WarmCache
 from settings.chat_bot_settings import ChatbotSettings
-import os
-import boto3
+from document_store.bm25 import BM25Index
+from document_store.chroma_store import MmrChroma
+from document_store.vector_index import MmapVectorStore
+from store_format.bm25 import BM25_INDEX_DIRECTORY
+from store_format.cached_embeddings import CachedEmbeddings
+from store_format.vector_index import VECTOR_INDEX_DIRECTORY
 
 from langchain.chains.chat_vector_db.prompts import CONDENSE_QUESTION_PROMPT
 from langchain.chains.llm import LLMChain
 from langchain.chains.question_answering import load_qa_chain
 from langchain.chat_models import ChatOpenAI
 from langchain.llms import OpenAI
+from langchain.memory.prompt import SUMMARY_PROMPT
 from opentelemetry import trace
 from query.callbacks.otel_callback import OpentelemetryCallback
 from query.callbacks.streaming_callback import StreamingCallback
@@ -29,60 +43,147 @@ from query.callbacks.streaming_callback import StreamingCallback
 tracer = trace.get_tracer("chatbot.vortex_query")
 
 
-class LLMChainFactory:
+class LLMChainFactory:  # pylint: disable=too-many-instance-attributes
     USER_PROMPT = "Question:```{question}```"
 
     def __init__(
         self,
-        message_data_table: MessageData,
+        message_writer: MessageWriter,
         vector_store: VectorStore,
         settings: ChatbotSettings,
+        store_version: str | None = None,
+        *,
+        lexical_index: BM25Index | None = None,
+        question_llm: BaseLanguageModel | None = None,
+        answer_llm: BaseLanguageModel | None = None,
+        context_packer: ContextPacker | None = None,
     ):
-        self.message_data_table = message_data_table
+        """
+        question_llm, answer_llm and context_packer replace the OpenAI models and
+        tiktoken based packer, which the load tests use to run offline.
+        """
+        self.message_writer = message_writer
         self.vector_store = vector_store
+        self.lexical_index = lexical_index
         self.settings = settings
+        self.otel_handler = OpentelemetryCallback(settings.token_event_interval)
+        self.chat_prompt_template = LLMChainFactory.get_chat_prompt_template(settings)
+        self.question_llm = question_llm
+        self.answer_llm = answer_llm
+        self.context_packer = context_packer or ContextPacker(settings)
+        self.semantic_cache = (
+            SemanticCache(settings) if settings.semantic_cache_enabled else None
+        )
+        if self.semantic_cache is not None:
+            self.semantic_cache.set_store_version(
+                store_version or LLMChainFactory.get_store_version(vector_store)
+            )
+            self.load_warm_cache()
+        self.chain = self.build_chain()
+
+    def swap_vector_store(
+        self,
+        vector_store: VectorStore,
+        store_version: str,
+        lexical_index: BM25Index | None = None,
+    ):
+        """
+        Serve new questions from another vector store. Questions already being
+        answered keep the chain they started with.
+        """
+        self.vector_store = vector_store
+        self.lexical_index = lexical_index
+        if (
+            self.semantic_cache is not None
+            and store_version != self.semantic_cache.store_version
+        ):
+            self.semantic_cache.set_store_version(store_version)
+            self.load_warm_cache()
+        self.chain = self.build_chain()
+
+    def load_warm_cache(self):
+        """Pin the warm cache's answers if it was built for the current store."""
+        path = self.settings.warm_cache_file
+        if path is None or not Path(path).exists():
+            return
+        with tracer.start_as_current_span(
+            "chatbot.VortexQuery.load_warm_cache"
+        ) as span:
+            pinned = WarmCache.load(path).pin_into(self.semantic_cache)
+            span.set_attribute("chatbot.warm_cache.answers", pinned)
 
     @staticmethod
-    def download_document_store(settings: ChatbotSettings):
-        if not Path(settings.persist_directory).exists():
-            LLMChainFactory.download_data(settings)
+    def get_embeddings(settings: ChatbotSettings) -> Embeddings:
+        """
+        The embeddings provider behind its cache. It holds an HTTP client and the
+        cache's sqlite connection, neither survives a fork, so each worker process
+        makes its own.
+        """
+        openai_embeddings = OpenAIEmbeddings(client=None)
+        return CachedEmbeddings(
+            openai_embeddings,
+            openai_embeddings.model,
+            settings.embedding_cache_size,
+            settings.embedding_cache_file,
+        )
 
     @staticmethod
-    @tracer.start_as_current_span("chatbot.VortexQuery.download_data")
-    def download_data(settings: ChatbotSettings):
+    def preload_vector_index(
+        settings: ChatbotSettings, persist_directory: Path | None = None
+    ) -> MmapVectorStore | None:
         """
-        Download the contents of a folder directory
-        Args:
-            bucket_name: the name of the s3 bucket
-            s3_folder: the folder path in the s3 bucket
-            local_dir: a relative or absolute directory path in the local file system
+        Map the read only index and load its ids without an embeddings provider,
+        so a process can do it once and fork workers that share it.
         """
-        s3 = boto3.resource("s3")
-        bucket = s3.Bucket(settings.document_store_bucket)
-        for obj in bucket.objects.filter():
-            target = (
-                obj.key
-                if settings.persist_directory is None
-                else os.path.join(settings.persist_directory, obj.key)
-            )
-            if not os.path.exists(os.path.dirname(target)):
-                os.makedirs(os.path.dirname(target))
-            if obj.key[-1] == "/":
-                continue
-            bucket.download_file(obj.key, target)
+        if settings.vector_store_mode != "mmap":
+            return None
+        persist_directory = Path(persist_directory or settings.persist_directory)
+        index = MmapVectorStore(persist_directory / VECTOR_INDEX_DIRECTORY, None)
+        index.load_ids()
+        return index
 
     @staticmethod
     @tracer.start_as_current_span("chatbot.VortexQuery.get_vector_store")
-    def get_vector_store(settings: ChatbotSettings) -> VectorStore:
-        LLMChainFactory.download_document_store(settings)
-        embedding = OpenAIEmbeddings(client=None)
+    def get_vector_store(
+        settings: ChatbotSettings,
+        persist_directory: Path | None = None,
+        preloaded: MmapVectorStore | None = None,
+    ) -> VectorStore:
+        embedding = LLMChainFactory.get_embeddings(settings)
+        if preloaded is not None:
+            return preloaded.with_embedding(embedding)
+        persist_directory = Path(persist_directory or settings.persist_directory)
 
-        return Chroma(
+        if settings.vector_store_mode == "mmap":
+            return MmapVectorStore(
+                persist_directory / VECTOR_INDEX_DIRECTORY, embedding
+            )
+        return MmrChroma(
             collection_name=settings.collection_name,
             embedding_function=embedding,
-            persist_directory=settings.persist_directory,
+            persist_directory=str(persist_directory),
         )
 
+    @staticmethod
+    def get_lexical_index(
+        settings: ChatbotSettings, persist_directory: Path | None = None
+    ) -> BM25Index | None:
+        """The BM25 index for hybrid retrieval, if enabled and the store has one."""
+        directory = (
+            Path(persist_directory or settings.persist_directory) / BM25_INDEX_DIRECTORY
+        )
+        if not settings.hybrid_retrieval or not directory.exists():
+            return None
+        return BM25Index(directory)
+
+    @staticmethod
+    def get_store_version(vector_store: VectorStore) -> str:
+        """Identify the contents of the store so cached answers can be invalidated."""
+        collection = getattr(vector_store, "_collection", None)
+        if collection is None:
+            return type(vector_store).__name__
+        return f"{collection.name}:{collection.count()}"
+
     @staticmethod
     def get_chat_prompt_template(settings: ChatbotSettings) -> ChatPromptTemplate:
         system = settings.system_prompt
@@ -93,33 +194,28 @@ class LLMChainFactory:
         ]
         return ChatPromptTemplate.from_messages(messages)
 
-    @tracer.start_as_current_span("chatbot.VortexQuery.make_chain")
-    def make_chain(
-        self,
-        websocket: WebSocket,
-        previous_message: Message,
-    ) -> ConversationalRetrievalChain:
-        stream_handler = StreamingCallback(websocket)
-        final_answer_handler = FinalAnswerCallback(
-            websocket, previous_message, self.message_data_table
-        )
-        otel_handler = OpentelemetryCallback()
-
-        question_gen_llm = OpenAI(
+    @tracer.start_as_current_span("chatbot.VortexQuery.build_chain")
+    def build_chain(self) -> CachedConversationalRetrievalChain:
+        """
+        Build the chain with everything that can be shared between questions.
+        Callbacks that belong to a single question are attached at call time by
+        make_callbacks.
+        """
+        question_gen_llm = self.question_llm or OpenAI(
             temperature=self.settings.temperature,
             verbose=True,
-            callbacks=[otel_handler],
+            callbacks=[self.otel_handler],
             model_name="gpt-3.5-turbo-instruct",
         )
         question_generator = LLMChain(
             llm=question_gen_llm,
             prompt=CONDENSE_QUESTION_PROMPT,
-            callbacks=[otel_handler],
+            callbacks=[self.otel_handler],
         )
 
-        streaming_llm = ChatOpenAI(
+        streaming_llm = self.answer_llm or ChatOpenAI(
             streaming=True,
-            callbacks=[stream_handler, otel_handler],
+            callbacks=[self.otel_handler],
             verbose=True,
             temperature=self.settings.temperature,
             model=self.settings.model_name,
@@ -128,23 +224,73 @@ class LLMChainFactory:
         doc_chain = load_qa_chain(
             streaming_llm,
             chain_type="stuff",
-            prompt=LLMChainFactory.get_chat_prompt_template(self.settings),
-            callbacks=[otel_handler],
+            prompt=self.chat_prompt_template,
+            callbacks=[self.otel_handler],
         )
 
-        qa = ConversationalRetrievalChain(
-            retriever=self.vector_store.as_retriever(
-                search_type="mmr",
-                search_kwargs={
-                    "k": self.settings.documents_returned,
-                    "fetch_k": self.settings.documents_considered,
-                    "lambda_mult": self.settings.lambda_mult,
-                },
-            ),
+        return CachedConversationalRetrievalChain(
+            retriever=self.get_retriever(),
             combine_docs_chain=doc_chain,
             question_generator=question_generator,
             return_source_documents=True,
-            callbacks=[final_answer_handler, otel_handler],
+            callbacks=[self.otel_handler],
+            semantic_cache=self.semantic_cache,
+            embeddings=self.vector_store.embeddings,
+            speculative_retrieval=self.settings.speculative_retrieval,
+            context_packer=self.context_packer,
         )
 
-        return qa
+    def build_summary_chain(self) -> LLMChain:
+        """Folds older messages of a conversation into its running summary."""
+        summary_llm = self.question_llm or OpenAI(
+            temperature=0,
+            callbacks=[self.otel_handler],
+            model_name="gpt-3.5-turbo-instruct",
+            max_tokens=self.settings.conversation_summary_max_tokens,
+        )
+        return LLMChain(
+            llm=summary_llm, prompt=SUMMARY_PROMPT, callbacks=[self.otel_handler]
+        )
+
+    def get_retriever(self) -> BaseRetriever:
+        if self.lexical_index is not None:
+            return HybridRetriever(
+                vector_store=self.vector_store,
+                lexical_index=self.lexical_index,
+                k=self.settings.documents_returned,
+                fetch_k=self.settings.documents_considered,
+                lexical_k=self.settings.lexical_documents_considered,
+                lambda_mult=self.settings.lambda_mult,
+                rrf_k=self.settings.rrf_k,
+            )
+        return self.vector_store.as_retriever(
+            search_type="mmr",
+            search_kwargs={
+                "k": self.settings.documents_returned,
+                "fetch_k": self.settings.documents_considered,
+                "lambda_mult": self.settings.lambda_mult,
+            },
+        )
+
+    def make_callbacks(
+        self,
+        websocket: WebSocket,
+        previous_message: Message,
+        question_received: float | None = None,
+        first_turn: bool = True,
+        conversation: Conversation | None = None,
+    ) -> list[BaseCallbackHandler]:
+        """Run level callbacks to pass to chain.acall for a single question."""
+        return [
+            StreamingCallback(
+                StreamWriter(websocket, self.settings),
+                question_received,
+                {
+                    "chatbot.persona": self.settings.persona,
+                    "chatbot.first_turn": first_turn,
+                },
+            ),
+            FinalAnswerCallback(
+                websocket, previous_message, self.message_writer, conversation
+            ),
+        ]
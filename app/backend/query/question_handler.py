@@ -1,57 +1,210 @@
-from typing import Coroutine
+import asyncio
+import time
 from fastapi import WebSocket
 from opentelemetry import trace
-from messageData import MessageData
-from settings.chat_bot_settings import ChatbotSettings
-from captcha import QuestionTooLongError, captcha_check, throw_on_long_question
-from schema.message import Message
-from schema.api_question import ApiQuestion
+from opentelemetry.trace import Link, Span
+from admission import AdmissionController, QueueFullError
+from captcha import CaptchaVerifier, QuestionTooLongError, throw_on_long_question
+from conversation_store import ConversationStore
+from query.cached_retrieval_chain import (
+    SEMANTIC_CACHE_LOOKUP_KEY,
+    CachedConversationalRetrievalChain,
+)
 from query.llm_chain_factory import LLMChainFactory
+from document_store.bm25 import BM25Index
 from langchain.vectorstores.base import VectorStore
+from sessions import SessionTokens
+from settings.chat_bot_settings import ChatbotSettings
+
+tracer = trace.get_tracer("chatbot.question_handler")
 
 
 class QuestionHandler:
     def __init__(
         self,
-        vector_store: VectorStore,
+        llm_chain_factory: LLMChainFactory,
+        captcha_verifier: CaptchaVerifier,
+        admission_controller: AdmissionController,
+        sessions: SessionTokens,
+        conversations: ConversationStore,
+    ):
+        self.llm_chain_factory = llm_chain_factory
+        self.captcha_verifier = captcha_verifier
+        self.admission_controller = admission_controller
+        self.sessions = sessions
+        self.conversations = conversations
+
+    @classmethod
+    def create(
+        cls,
         settings: ChatbotSettings,
-        messageDataTable: MessageData,
+        llm_chain_factory: LLMChainFactory,
+        captcha_verifier: CaptchaVerifier,
     ):
-        self.llm_chain_factory = LLMChainFactory(
-            messageDataTable, vector_store, settings
+        """A handler with its own admission control, sessions and conversations."""
+        return cls(
+            llm_chain_factory,
+            captcha_verifier,
+            AdmissionController(settings),
+            SessionTokens(settings),
+            ConversationStore(
+                settings,
+                llm_chain_factory.build_summary_chain(),
+                llm_chain_factory.message_writer.message_data,
+            ),
         )
 
-    async def handle_question(self, websocket: WebSocket) -> Coroutine:
-        try:
-            question = await websocket.receive_json()
-            captcha_check(question.get("captcha"), websocket.client)
-            throw_on_long_question(question)
-
-            chat_history: list[Message]
-            chat_history = ApiQuestion.from_list(
-                question.get("messages")
-            ).message_history
+    def swap_vector_store(
+        self,
+        vector_store: VectorStore,
+        store_version: str,
+        lexical_index: BM25Index | None = None,
+    ):
+        self.llm_chain_factory.swap_vector_store(
+            vector_store, store_version, lexical_index
+        )
 
-            qa_chain = self.llm_chain_factory.make_chain(
-                websocket,
-                chat_history[-1],
-            )
+    async def handle_question(self, websocket: WebSocket):
+        """
+        Answer the question in the first frame and, if the client asked for a
+        session, every question it sends on the socket afterwards until it closes.
+        A session only needs a captcha when it starts, the signed token sent back
+        lets the client reconnect without one, and as the server keeps the
+        conversation each later frame only carries the new question.
+        """
+        question = await websocket.receive_json()
+        question_received = time.perf_counter()
 
-            return await qa_chain.acall(
+        if question.get("session"):
+            session_id = self.sessions.resume(question.get("sessionToken"))
+            if session_id is None:
+                await self.captcha_verifier.verify(
+                    question.get("captcha"), websocket.client
+                )
+                session_id = self.sessions.start()
+            await websocket.send_json(
                 {
-                    "question": chat_history[-1].message.content,
-                    "chat_history": [
-                        chat_entry.message for chat_entry in chat_history[:-1]
-                    ],
+                    "sender": "bot",
+                    "type": "session",
+                    "sessionToken": self.sessions.token(session_id),
                 }
             )
+            connection = trace.get_current_span()
+            while True:
+                await self.answer(
+                    websocket, question, question_received, connection=connection
+                )
+                question = await websocket.receive_json()
+                question_received = time.perf_counter()
+
+        return await self.answer(
+            websocket, question, question_received, check_captcha=True
+        )
+
+    async def answer(
+        self,
+        websocket: WebSocket,
+        question: dict,
+        question_received: float,
+        check_captcha: bool = False,
+        connection: Span | None = None,
+    ):
+        context, links = None, None
+        if connection is not None:
+            # Each turn of a session is its own trace, linked to the connection's,
+            # so sampling and latency rules judge every question on its own
+            context = trace.set_span_in_context(trace.INVALID_SPAN)
+            links = [Link(connection.get_span_context())]
+        with tracer.start_as_current_span(
+            "chatbot.QuestionHandler.answer", context=context, links=links
+        ) as span:
+            span.set_attribute("chatbot.session", connection is not None)
+            try:
+                throw_on_long_question(question)
+                captcha_check = None
+                if check_captcha:
+                    # Checked while the question is parsed, nothing touches the
+                    # conversation store until it has passed
+                    captcha_check = asyncio.create_task(
+                        self.captcha_verifier.verify(
+                            question.get("captcha"), websocket.client
+                        )
+                    )
+                try:
+                    messages = self.conversations.parse(question.get("messages"))
+                    if captcha_check is not None:
+                        await captcha_check
+                finally:
+                    if captcha_check is not None:
+                        captcha_check.cancel()
+
+                conversation = await self.conversations.continue_with(messages)
+                chat_history = conversation.chat_history()
+                chain = self.llm_chain_factory.chain
+                callbacks = self.llm_chain_factory.make_callbacks(
+                    websocket,
+                    conversation.last_message,
+                    question_received,
+                    first_turn=not chat_history,
+                    conversation=conversation,
+                )
+
+                try:
+                    return await self.call_chain(
+                        websocket,
+                        chain,
+                        {
+                            "question": conversation.last_message.message.content,
+                            "chat_history": chat_history,
+                        },
+                        callbacks,
+                    )
+                finally:
+                    # Indexes the conversation under the answer, if there is one
+                    self.conversations.save(conversation)
+
+            except QueueFullError as e:
+                span.record_exception(e)
+                await websocket.send_json(
+                    {
+                        "sender": "bot",
+                        "message": "Lots of people are asking me questions right now, please try again in a minute.",
+                        "type": "error",
+                    }
+                )
+
+            except QuestionTooLongError as e:
+                span.record_exception(e)
+                await websocket.send_json(
+                    {
+                        "sender": "bot",
+                        "message": "Your question was too long to be processed, please phrase your question in less that 250 characters.",
+                        "type": "error",
+                    }
+                )
+
+    async def call_chain(
+        self,
+        websocket: WebSocket,
+        chain: CachedConversationalRetrievalChain,
+        inputs: dict,
+        callbacks: list,
+    ) -> dict:
+        """
+        Run the chain once admitted. A first turn is already a standalone question,
+        so an answer from the semantic cache needs no LLM call and neither waits
+        for nor takes an admission slot.
+        """
+        if not inputs["chat_history"]:
+            lookup = await chain.alookup(inputs["question"])
+            inputs[SEMANTIC_CACHE_LOOKUP_KEY] = lookup
+            if lookup is not None and lookup.cached is not None:
+                return await chain.acall(inputs, callbacks=callbacks)
+
+        async def send_position(position: int):
+            await websocket.send_json(
+                {"sender": "bot", "type": "queued", "position": position}
+            )
 
-        except QuestionTooLongError as e:
-            current_span = trace.get_current_span()
-            current_span.record_exception(e)
-            resp = {
-                "sender": "bot",
-                "message": "Your question was too long to be processed, please phrase your question in less that 250 characters.",
-                "type": "error",
-            }
-            return websocket.send_json(resp)
+        async with self.admission_controller.admit(send_position):
+            return await chain.acall(inputs, callbacks=callbacks)
@@ -0,0 +1,202 @@
+import re
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable
+
+import numpy as np
+from langchain.schema import Document
+from opentelemetry import metrics
+
+from settings.chat_bot_settings import ChatbotSettings
+
+meter = metrics.get_meter("chatbot.semantic_cache")
+cache_hits = meter.create_counter(
+    "chatbot.semantic_cache.hits", description="Questions answered from the cache"
+)
+cache_misses = meter.create_counter(
+    "chatbot.semantic_cache.misses", description="Questions sent to the LLM"
+)
+cache_evictions = meter.create_counter(
+    "chatbot.semantic_cache.evictions",
+    description="Answers removed from the cache because of size, age or a new store",
+)
+
+
+@dataclass
+class CachedAnswer:
+    """An answer to a standalone question along with the documents it was based on"""
+
+    question: str
+    answer: str
+    sources: list[Document]
+    created: float
+    pinned: bool = False
+    """Loaded from the warm cache, never expires or is evicted for space."""
+
+
+def normalise_question(question: str) -> str:
+    return " ".join(re.sub(r"[^\w\s]", " ", question.lower()).split())
+
+
+class SemanticCache:  # pylint: disable=too-many-instance-attributes
+    """
+    Caches answers keyed on the embedding of the standalone question. A question
+    whose embedding has a cosine similarity above the threshold with a previously
+    answered question gets that question's answer.
+
+    Embeddings are kept normalised in a preallocated matrix so a lookup is a single
+    matrix-vector product. Entries expire after the TTL, the least recently used
+    entry is evicted once the cache is full and everything is dropped when the
+    document store changes.
+
+    Answers from the warm cache are pinned and can also be found by the text of
+    any of the questions they were built from, without embedding the question.
+    """
+
+    def __init__(
+        self,
+        settings: ChatbotSettings,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.threshold = settings.semantic_cache_threshold
+        self.ttl = settings.semantic_cache_ttl
+        self.max_entries = settings.semantic_cache_size
+        self.clock = clock
+        self.store_version: str | None = None
+        self.hits = 0
+        self.misses = 0
+
+        self.entries: OrderedDict[int, CachedAnswer] = OrderedDict()
+        self.free_slots = list(range(self.max_entries - 1, -1, -1))
+        self.embeddings: np.ndarray | None = None
+        self.occupied = np.zeros(self.max_entries, dtype=bool)
+        self.pinned_questions: dict[str, CachedAnswer] = {}
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def set_store_version(self, version: str):
+        """Drop every cached answer if the document store has changed."""
+        if version != self.store_version:
+            self.invalidate()
+            self.store_version = version
+
+    def invalidate(self):
+        cache_evictions.add(len(self.entries))
+        self.entries.clear()
+        self.pinned_questions.clear()
+        self.free_slots = list(range(self.max_entries - 1, -1, -1))
+        self.occupied[:] = False
+
+    def lookup(self, embedding: list[float]) -> CachedAnswer | None:
+        match = self._nearest(embedding)
+        if match is None:
+            self.misses += 1
+            cache_misses.add(1)
+            return None
+
+        self.hits += 1
+        cache_hits.add(1)
+        self.entries.move_to_end(match)
+        return self.entries[match]
+
+    def lookup_question(self, question: str) -> CachedAnswer | None:
+        """A pinned answer for this exact question, ignoring case and punctuation."""
+        cached = self.pinned_questions.get(normalise_question(question))
+        if cached is not None:
+            self.hits += 1
+            cache_hits.add(1)
+        return cached
+
+    def pin(
+        self,
+        question: str,
+        variants: list[str],
+        embedding: list[float],
+        answer: str,
+        sources: list[Document],
+    ):
+        """Add an answer that stays cached until the document store changes."""
+        cached = self.add(question, embedding, answer, sources, pinned=True)
+        if cached is None:
+            return
+        for variant in [question, *variants]:
+            self.pinned_questions[normalise_question(variant)] = cached
+
+    def add(
+        self,
+        question: str,
+        embedding: list[float],
+        answer: str,
+        sources: list[Document],
+        pinned: bool = False,
+    ) -> CachedAnswer | None:
+        if self.max_entries == 0:
+            return None
+        self._expire()
+        if not self.free_slots:
+            unpinned = next(
+                (slot for slot, entry in self.entries.items() if not entry.pinned),
+                None,
+            )
+            if unpinned is None:
+                return None
+            self._remove(unpinned)
+
+        vector = self._normalise(embedding)
+        if self.embeddings is None:
+            self.embeddings = np.zeros(
+                (self.max_entries, vector.shape[0]), dtype=np.float32
+            )
+
+        slot = self.free_slots.pop()
+        self.embeddings[slot] = vector
+        self.occupied[slot] = True
+        self.entries[slot] = CachedAnswer(
+            question, answer, sources, self.clock(), pinned
+        )
+        return self.entries[slot]
+
+    def _nearest(self, embedding: list[float]) -> int | None:
+        if not self.entries:
+            return None
+
+        scores = self.embeddings @ self._normalise(embedding)
+        scores[~self.occupied] = -np.inf
+        slot = int(np.argmax(scores))
+        if scores[slot] < self.threshold:
+            return None
+
+        entry = self.entries[slot]
+        if not entry.pinned and self.clock() - entry.created > self.ttl:
+            self._remove(slot)
+            return None
+        return slot
+
+    def _expire(self):
+        now = self.clock()
+        expired = [
+            slot
+            for slot, entry in self.entries.items()
+            if not entry.pinned and now - entry.created > self.ttl
+        ]
+        for slot in expired:
+            self._remove(slot)
+
+    def _remove(self, slot: int):
+        del self.entries[slot]
+        self.occupied[slot] = False
+        self.free_slots.append(slot)
+        cache_evictions.add(1)
+
+    @staticmethod
+    def _normalise(embedding: list[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
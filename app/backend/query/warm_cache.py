@@ -0,0 +1,78 @@
+import json
+import logging
+from dataclasses import asdict, dataclass, field
+
+from langchain.schema import Document
+
+from query.semantic_cache import SemanticCache
+
+
+@dataclass
+class WarmAnswer:
+    """The answer to a group of first questions that mean the same thing."""
+
+    question: str
+    variants: list[str]
+    count: int
+    embedding: list[float]
+    answer: str
+    sources: list[Document]
+
+
+@dataclass
+class WarmCache:
+    """
+    Answers to the most frequent first questions, built offline by
+    build_warm_cache and pinned into the semantic cache at startup. They are only
+    used with the document store version they were answered from.
+    """
+
+    store_version: str
+    persona: str
+    answers: list[WarmAnswer]
+    report: dict = field(default_factory=dict)
+
+    def save(self, path: str):
+        data = asdict(self)
+        for answer, warm_answer in zip(data["answers"], self.answers):
+            answer["sources"] = [
+                {"page_content": source.page_content, "metadata": source.metadata}
+                for source in warm_answer.sources
+            ]
+        with open(path, "w", encoding="utf-8") as warm_cache_file:
+            json.dump(data, warm_cache_file)
+
+    @staticmethod
+    def load(path: str) -> "WarmCache":
+        with open(path, "r", encoding="utf-8") as warm_cache_file:
+            data = json.load(warm_cache_file)
+        answers = [
+            WarmAnswer(
+                **{
+                    **answer,
+                    "sources": [Document(**source) for source in answer["sources"]],
+                }
+            )
+            for answer in data.pop("answers")
+        ]
+        return WarmCache(answers=answers, **data)
+
+    def pin_into(self, semantic_cache: SemanticCache) -> int:
+        """Pin the answers into the cache, returning how many were pinned."""
+        if self.store_version != semantic_cache.store_version:
+            logging.getLogger().warning(
+                "Not loading the warm cache answered from document store %s while"
+                " serving %s",
+                self.store_version,
+                semantic_cache.store_version,
+            )
+            return 0
+        for answer in self.answers:
+            semantic_cache.pin(
+                answer.question,
+                answer.variants,
+                answer.embedding,
+                answer.answer,
+                answer.sources,
+            )
+        return len(self.answers)
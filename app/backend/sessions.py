@@ -0,0 +1,69 @@
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import time
+import uuid
+
+from opentelemetry import metrics
+
+from settings.chat_bot_settings import ChatbotSettings
+
+# Shared by every worker so a session token from one is accepted by the others,
+# without it each process signs with its own random key
+session_secret_default = os.getenv("SESSION_SECRET")
+
+meter = metrics.get_meter("chatbot.sessions")
+sessions_started = meter.create_counter(
+    "chatbot.sessions.started",
+    description="Chat sessions started after a captcha check",
+)
+sessions_resumed = meter.create_counter(
+    "chatbot.sessions.resumed",
+    description="Chat sessions resumed with a session token, skipping the captcha",
+)
+
+
+class SessionTokens:
+    """
+    Signs session tokens so a client that has passed the captcha once can
+    reconnect without another one until its token expires. The conversation
+    itself is kept by the ConversationStore.
+    """
+
+    def __init__(
+        self, settings: ChatbotSettings, secret: str | None = session_secret_default
+    ):
+        self.secret = secret.encode() if secret else secrets.token_bytes(32)
+        self.ttl = settings.session_ttl
+
+    def start(self) -> str:
+        sessions_started.add(1)
+        return str(uuid.uuid4())
+
+    def resume(self, token: str | None) -> str | None:
+        """The id of the session the token was issued for, None if it is not valid."""
+        session_id = self.verify(token)
+        if session_id is not None:
+            sessions_resumed.add(1)
+        return session_id
+
+    def token(self, session_id: str) -> str:
+        expires = str(int(time.time() + self.ttl))
+        payload = f"{session_id}.{expires}"
+        return f"{payload}.{self._sign(payload)}"
+
+    def verify(self, token: str | None) -> str | None:
+        if not token or token.count(".") != 2:
+            return None
+        session_id, expires, signature = token.split(".")
+        if not hmac.compare_digest(signature, self._sign(f"{session_id}.{expires}")):
+            return None
+        if not expires.isdigit() or int(expires) < time.time():
+            return None
+        return session_id
+
+    def _sign(self, payload: str) -> str:
+        digest = hmac.new(self.secret, payload.encode(), hashlib.sha256).digest()
+        return base64.urlsafe_b64encode(digest).decode().rstrip("=")
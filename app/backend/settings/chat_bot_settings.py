@@ -13,15 +13,99 @@ class ChatbotSettings:
 
     collection_name: str = "neonshield-2023-05"
     persist_directory: str = "./query/temp_data/chroma"
+    # "chroma" opens the Chroma store, "mmap" serves the read only index exported
+    # by the ingester which is shared between worker processes
+    vector_store_mode: str = "chroma"
 
     model_name: str = "gpt-3.5-turbo-1106"
     documents_returned: str = 4
     documents_considered: str = 20
     lambda_mult: str = 0.5
+    # Fuse BM25 matches over the chunk text with the vector candidates, needs the
+    # bm25_index exported by the ingester
+    hybrid_retrieval: bool = False
+    lexical_documents_considered: int = 20
+    rrf_k: int = 60
     temperature: str = 0.7
 
+    # Retrieved documents are packed into the prompt up to this many tokens, less
+    # if the model's window, which can be overridden, has less room left
+    context_token_budget: int = 3000
+    context_window: int | None = None
+    context_min_document_tokens: int = 64
+    context_min_overlap_characters: int = 32
+    context_token_cache_size: int = 10000
+
+    persona: str = "test"
+    stream_max_frame_bytes: int = 512
+    stream_max_delay_ms: float = 50
+    stream_flush_on_sentence: bool = True
+    stream_max_buffer_bytes: int = 64 * 1024
+    # Add a span event for every nth streamed token, 0 only records aggregates
+    token_event_interval: int = 0
+
+    # "full", "tail", "ratio" or "off", see start_opentelemetry.make_tracer_provider
+    telemetry_profile: str = "full"
+    trace_sample_ratio: float = 0.1
+    trace_slow_request_ms: float = 10000
+    # "otlp", "console" or "none", left unset it is otlp on Heroku and console
+    # everywhere else
+    telemetry_exporter: str | None = None
+    telemetry_max_queue_size: int = 2048
+    telemetry_max_export_batch_size: int = 512
+    telemetry_export_delay_ms: float = 5000
+    log_level: str = "INFO"
+    speculative_retrieval: bool = False
+    # Chains answering at once in each worker, further questions wait in a queue
+    # of up to max_queued_chains and are rejected once it is full
+    max_concurrent_chains: int = 20
+    max_queued_chains: int = 100
+    # Queued clients are reminded of their position this often, the frontend gives
+    # up on a socket that is silent for 10 seconds
+    queue_update_interval: float = 5.0
+    # Clients that ask for a session keep one socket open for many questions and
+    # only pass the captcha once
+    session_ttl: float = 60 * 60
+    # Each question is sent with the last conversation_window_messages and a
+    # summary of older ones, brought up to date conversation_summary_batch
+    # messages at a time
+    conversation_max_conversations: int = 10000
+    conversation_window_messages: int = 6
+    conversation_summary_batch: int = 4
+    conversation_summary_max_tokens: int = 256
+    # How far back a conversation that is not in memory is rebuilt
+    conversation_rebuild_messages: int = 20
+
     build_directory: str = "../frontend/dist"
     document_store_bucket: str = "gladstone-gpt-data"
+    document_store_endpoint_url: str | None = None
+    document_store_transfer_concurrency: int = 8
+    store_cache_directory: str = "./query/temp_data/store_cache"
+
+    database_endpoint_url: str | None = None
+    message_queue_size: int = 1000
+    message_batch_size: int = 25
+    message_flush_interval: float = 1.0
+    message_write_attempts: int = 5
+
+    captcha_verify_url: str = "https://www.google.com/recaptcha/api/siteverify"
+    captcha_timeout: float = 10.0
+    captcha_connect_timeout: float = 2.0
+    captcha_max_connections: int = 20
+    captcha_max_concurrency: int = 100
+
+    embedding_cache_size: int = 10000
+    embedding_cache_file: str | None = None
+
+    semantic_cache_enabled: bool = True
+    semantic_cache_threshold: float = 0.95
+    semantic_cache_ttl: float = 6 * 60 * 60
+    semantic_cache_size: int = 1000
+    # Answers to the most frequent first questions built by build_warm_cache and
+    # pinned into the semantic cache at startup
+    warm_cache_file: str | None = None
+    warm_cache_size: int = 100
+    warm_cache_scan_segments: int = 4
 
     @classmethod
     def from_yaml(cls, file_name):
@@ -0,0 +1,194 @@
+import asyncio
+import logging
+import os
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Callable, Iterator, TypeVar
+
+from opentelemetry import trace
+from opentelemetry.trace import Span, Status, StatusCode, Tracer
+
+tracer = trace.get_tracer("chatbot.startup")
+
+T = TypeVar("T")
+
+
+@dataclass
+class Phase:
+    name: str
+    state: str = "pending"
+    """pending, running, ready or failed"""
+    started: int | None = None
+    ended: int | None = None
+    error: str | None = None
+    process: int | None = None
+
+    @property
+    def preloaded(self) -> bool:
+        """Run by the process this one was forked from."""
+        return self.process is not None and self.process != os.getpid()
+
+    @property
+    def seconds(self) -> float | None:
+        if self.started is None:
+            return None
+        return ((self.ended or time.time_ns()) - self.started) / 1e9
+
+
+class Startup:
+    """
+    The app's startup as named phases, so the server can accept connections while
+    the slow parts run and /healthz and /readyz can say how far along it is.
+
+    Each phase is timed, logged and traced as a child of the app.startup span.
+    Phases that finish before telemetry is configured, such as configuring it or
+    those preloaded by the process the workers were forked from, are reported
+    once telemetry_started is called, with the times they ran.
+    """
+
+    def __init__(self, phases: list[str], phase_tracer: Tracer = tracer):
+        self.tracer = phase_tracer
+        self.started = time.time_ns()
+        self.phases = {name: Phase(name) for name in phases}
+        self.span: Span | None = None
+        self.error: str | None = None
+        self.finished = asyncio.Event()
+        self.logger = logging.getLogger()
+
+    @property
+    def state(self) -> str:
+        if self.error is not None:
+            return "failed"
+        return "ready" if self.finished.is_set() else "starting"
+
+    @property
+    def ready(self) -> bool:
+        return self.state == "ready"
+
+    def report(self) -> dict:
+        return {
+            "status": self.state,
+            "process": os.getpid(),
+            "seconds": ((self.ended() or time.time_ns()) - self.started) / 1e9,
+            **({"error": self.error} if self.error else {}),
+            "phases": {
+                name: {"state": phase.state, "seconds": phase.seconds}
+                | ({"preloaded": True} if phase.preloaded else {})
+                | ({"error": phase.error} if phase.error else {})
+                for name, phase in self.phases.items()
+            },
+        }
+
+    def ended(self) -> int | None:
+        if not self.finished.is_set():
+            return None
+        return max(
+            (phase.ended for phase in self.phases.values() if phase.ended),
+            default=self.started,
+        )
+
+    def telemetry_started(self):
+        """Start the app.startup span and report the phases that ran before it."""
+        self.span = self.tracer.start_span("app.startup", start_time=self.started)
+        for phase in self.phases.values():
+            if phase.ended is not None:
+                self._report_after(phase)
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        phase = self.phases.setdefault(name, Phase(name))
+        phase.state = "running"
+        phase.started = time.time_ns()
+        phase.process = os.getpid()
+        span = None
+        if self.span is not None:
+            span = self.tracer.start_span(
+                f"app.startup.{name}",
+                context=trace.set_span_in_context(self.span),
+                start_time=phase.started,
+            )
+        try:
+            with trace.use_span(span or trace.INVALID_SPAN, end_on_exit=False):
+                yield
+        except BaseException as e:
+            phase.state = "failed"
+            phase.error = repr(e)
+            raise
+        else:
+            phase.state = "ready"
+        finally:
+            phase.ended = time.time_ns()
+            if span is not None:
+                self._record(phase, span)
+                span.end(end_time=phase.ended)
+            elif self.span is not None:
+                self._report_after(phase)
+
+    async def run(self, name: str, function: Callable[..., T], *args) -> T:
+        """Run a blocking phase in a thread so the event loop keeps serving."""
+        with self.phase(name):
+            return await asyncio.to_thread(function, *args)
+
+    async def wait_until_ready(self) -> bool:
+        """Wait for startup to finish, returning whether it succeeded."""
+        await self.finished.wait()
+        return self.ready
+
+    def fail(self, error: BaseException):
+        """Give up starting, chats waiting for startup are told it failed."""
+        self.error = repr(error)
+        self.finished.set()
+        self.logger.error("Couldn't start the app: %s", self.error)
+        self._end()
+
+    def finish(self):
+        self.finished.set()
+        self._end()
+        self.logger.info(
+            "Started in %.2fs: %s",
+            self.report()["seconds"],
+            ", ".join(
+                f"{phase.name} {phase.seconds:.2f}s"
+                for phase in self.phases.values()
+                if phase.seconds is not None
+            ),
+        )
+
+    def _report_after(self, phase: Phase):
+        """Trace a phase that ran before there was an app.startup span."""
+        span = self.tracer.start_span(
+            f"app.startup.{phase.name}",
+            context=trace.set_span_in_context(self.span),
+            start_time=phase.started,
+        )
+        self._record(phase, span)
+        span.end(end_time=phase.ended)
+
+    def _record(self, phase: Phase, span: Span):
+        span.set_attribute("chatbot.startup.phase", phase.name)
+        span.set_attribute("chatbot.startup.seconds", phase.seconds)
+        span.set_attribute("chatbot.startup.preloaded", phase.preloaded)
+        if phase.state == "failed":
+            span.set_status(Status(StatusCode.ERROR, phase.error))
+            self.logger.error(
+                "Startup phase %s failed after %.2fs: %s",
+                phase.name,
+                phase.seconds,
+                phase.error,
+            )
+        else:
+            self.logger.info("Startup phase %s took %.2fs", phase.name, phase.seconds)
+
+    def _end(self):
+        if self.span is None:
+            return
+        for phase in self.phases.values():
+            if phase.seconds is not None:
+                self.span.set_attribute(
+                    f"chatbot.startup.{phase.name}.seconds", phase.seconds
+                )
+        self.span.set_attribute("chatbot.startup.state", self.state)
+        self.span.set_attribute("chatbot.startup.seconds", self.report()["seconds"])
+        self.span.end(end_time=self.ended() or time.time_ns())
+        self.span = None
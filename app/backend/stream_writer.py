@@ -0,0 +1,129 @@
+import asyncio
+
+from fastapi import WebSocket
+from opentelemetry import metrics
+
+from settings.chat_bot_settings import ChatbotSettings
+
+meter = metrics.get_meter("chatbot.stream_writer")
+sent_frames = meter.create_counter(
+    "chatbot.stream_writer.frames",
+    description="Stream frames sent to websocket clients",
+)
+frame_size = meter.create_histogram(
+    "chatbot.stream_writer.frame_size",
+    unit="By",
+    description="Size of the answer text carried by each stream frame",
+)
+backpressure_waits = meter.create_counter(
+    "chatbot.stream_writer.backpressure_waits",
+    description="Times the answer waited for a slow client to catch up",
+)
+
+SENTENCE_ENDINGS = (".", "!", "?", "\n")
+
+
+class StreamWriter:  # pylint: disable=too-many-instance-attributes
+    """
+    Sends streamed answer tokens to a websocket, coalescing them into fewer frames.
+    Tokens are buffered and a background task sends them as a single stream frame
+    once the buffer reaches the maximum frame size, a sentence ends or the oldest
+    buffered token has waited the maximum delay. The first token is sent straight
+    away so the time to first token is unaffected.
+
+    Tokens keep buffering while a frame is being sent, if a slow client lets the
+    buffer reach its limit write waits for the frame to go rather than letting the
+    buffer grow.
+    """
+
+    def __init__(self, websocket: WebSocket, settings: ChatbotSettings):
+        self.websocket = websocket
+        self.max_frame_bytes = settings.stream_max_frame_bytes
+        self.max_delay = settings.stream_max_delay_ms / 1000
+        self.flush_on_sentence = settings.stream_flush_on_sentence
+        self.max_buffer_bytes = settings.stream_max_buffer_bytes
+
+        self.buffer: list[str] = []
+        self.buffered_bytes = 0
+        self.buffer_started = 0.0
+        self.frames = 0
+        self.first_token_sent = False
+        self.stopping = False
+        self.task: asyncio.Task | None = None
+        self.ready = asyncio.Event()
+        self.send_now = asyncio.Event()
+        self.drained = asyncio.Event()
+
+    async def write(self, token: str):
+        self._raise_if_failed()
+        while self.buffered_bytes >= self.max_buffer_bytes:
+            backpressure_waits.add(1)
+            self.drained.clear()
+            await self.drained.wait()
+            self._raise_if_failed()
+
+        loop = asyncio.get_running_loop()
+        if not self.buffer:
+            self.buffer_started = loop.time()
+        self.buffer.append(token)
+        self.buffered_bytes += len(token.encode("utf-8"))
+        if (
+            not self.first_token_sent
+            or self.buffered_bytes >= self.max_frame_bytes
+            or (self.flush_on_sentence and token.rstrip(" ").endswith(SENTENCE_ENDINGS))
+        ):
+            self.first_token_sent = True
+            self.send_now.set()
+        self.ready.set()
+        if self.task is None:
+            self.task = loop.create_task(self._run())
+
+    async def flush(self):
+        """Send everything buffered and wait for the background task to finish."""
+        if self.task is None:
+            return
+        self.stopping = True
+        self.send_now.set()
+        self.ready.set()
+        try:
+            await self.task
+        finally:
+            self.task = None
+            self.stopping = False
+
+    def _raise_if_failed(self):
+        if self.task is not None and self.task.done():
+            self.task.result()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                await self.ready.wait()
+                if not self.buffer:
+                    if self.stopping:
+                        return
+                    self.ready.clear()
+                    continue
+                timeout = self.buffer_started + self.max_delay - loop.time()
+                if timeout > 0 and not self.send_now.is_set():
+                    try:
+                        await asyncio.wait_for(self.send_now.wait(), timeout)
+                    except asyncio.TimeoutError:
+                        pass
+                await self._send()
+        finally:
+            self.drained.set()
+
+    async def _send(self):
+        message = "".join(self.buffer)
+        self.buffer.clear()
+        self.buffered_bytes = 0
+        self.send_now.clear()
+        self.drained.set()
+        await self.websocket.send_json(
+            {"sender": "bot", "message": message, "type": "stream"}
+        )
+        self.frames += 1
+        sent_frames.add(1)
+        frame_size.record(len(message.encode("utf-8")))
@@ -1,6 +1,16 @@
+import io
+import threading
+import uuid
+from hashlib import md5
+
+from boto3.s3.transfer import TransferConfig
 from pytest import MonkeyPatch
 import pytest
+from langchain.embeddings import DeterministicFakeEmbedding, FakeEmbeddings
+from langchain.vectorstores.chroma import Chroma
+from store_format.archive import StoreArchive
 
+from document_store.chroma_store import MmrChroma
 from settings.chat_bot_settings import ChatbotSettings
 
 monkey_patch = MonkeyPatch()
@@ -9,4 +19,144 @@ monkey_patch.setenv("OPENAI_API_KEY", "FAKE_API_KEY")
 
 @pytest.fixture()
 def mock_settings():
-    return ChatbotSettings("Mock System prompt", "not-a-region", "not-a-database", 1)
+    return ChatbotSettings(
+        "Mock System prompt {context}", "not-a-region", "not-a-database", 1
+    )
+
+
+@pytest.fixture()
+def mock_vector_store():
+    return Chroma(collection_name="test", embedding_function=FakeEmbeddings(size=8))
+
+
+class FakeS3Client:
+    """In memory stand in for the parts of the S3 client the document store uses."""
+
+    class exceptions:  # pylint: disable=invalid-name
+        class NoSuchKey(Exception):
+            pass
+
+    def __init__(self):
+        self.objects: dict[str, bytes] = {}
+        self.etags: dict[str, str] = {}
+        self.calls: list[tuple[str, str]] = []
+        self.lock = threading.Lock()
+
+    def put(self, key: str, body: bytes, config: TransferConfig | None = None):
+        with self.lock:
+            self.objects[key] = body
+            if config is None or len(body) < config.multipart_threshold:
+                self.etags[key] = md5(body).hexdigest()
+            else:
+                size = config.multipart_chunksize
+                parts = [body[i : i + size] for i in range(0, len(body), size)]
+                digests = b"".join(md5(part).digest() for part in parts)
+                self.etags[key] = f"{md5(digests).hexdigest()}-{len(parts)}"
+
+    def get_object(self, Bucket, Key):  # pylint: disable=invalid-name
+        if Key not in self.objects:
+            raise self.exceptions.NoSuchKey()
+        return {"Body": io.BytesIO(self.objects[Key])}
+
+    def put_object(self, Bucket, Key, Body, **kwargs):  # pylint: disable=invalid-name
+        self.calls.append(("put_object", Key))
+        self.put(Key, Body)
+
+    def upload_file(self, filename, bucket, key, Config=None):
+        self.calls.append(("upload_file", key))
+        with open(filename, "rb") as file:
+            self.put(key, file.read(), Config)
+
+    def download_file(self, bucket, key, filename, Config=None):
+        self.calls.append(("download_file", key))
+        with open(filename, "wb") as file:
+            file.write(self.objects[key])
+
+    def delete_objects(self, Bucket, Delete):  # pylint: disable=invalid-name
+        self.calls.append(("delete_objects", len(Delete["Objects"])))
+        for item in Delete["Objects"]:
+            del self.objects[item["Key"]]
+            del self.etags[item["Key"]]
+
+    def get_paginator(self, operation):
+        assert operation == "list_objects_v2"
+        return self
+
+    def paginate(self, Bucket, Prefix):  # pylint: disable=invalid-name
+        keys = sorted(key for key in self.objects if key.startswith(Prefix))
+        for start in range(0, len(keys), 2):
+            yield {
+                "Contents": [
+                    {
+                        "Key": key,
+                        "Size": len(self.objects[key]),
+                        "ETag": f'"{self.etags[key]}"',
+                    }
+                    for key in keys[start : start + 2]
+                ]
+            }
+
+
+@pytest.fixture(name="s3_client")
+def fixture_s3_client():
+    return FakeS3Client()
+
+
+@pytest.fixture()
+def publish_store(s3_client):
+    """Publish a store to s3_client as the ingester does, returning its manifest."""
+
+    def publish(directory) -> dict:
+        archive = StoreArchive(s3_client, "bucket")
+        archive.publish(directory)
+        return archive.read_manifest()
+
+    return publish
+
+
+class FakeClock:
+    """A clock that only moves when `now` is set."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture()
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture()
+def make_chroma():
+    """Build an in memory Chroma store over texts, with ids chunk-0, chunk-1 and so on."""
+
+    def make(texts: list[str]) -> MmrChroma:
+        vector_store = MmrChroma(
+            collection_name=f"test-{uuid.uuid4().hex[:8]}",
+            embedding_function=DeterministicFakeEmbedding(size=16),
+        )
+        if texts:
+            vector_store.add_texts(
+                texts,
+                metadatas=[{"chunk": i} for i in range(len(texts))],
+                ids=[f"chunk-{i}" for i in range(len(texts))],
+            )
+        return vector_store
+
+    return make
+
+
+@pytest.fixture()
+def write_store():
+    """Write the files of a store, given by their paths relative to the directory."""
+
+    def write(directory, files: dict[str, bytes]):
+        for name, content in files.items():
+            path = directory / name
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(content)
+
+    return write
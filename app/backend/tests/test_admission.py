@@ -0,0 +1,177 @@
+import asyncio
+import dataclasses
+
+import pytest
+
+from admission import AdmissionController, QueueFullError
+
+
+def make_controller(mock_settings, max_in_flight=1, max_queued=2):
+    return AdmissionController(
+        dataclasses.replace(
+            mock_settings,
+            max_concurrent_chains=max_in_flight,
+            max_queued_chains=max_queued,
+        )
+    )
+
+
+class Chain:
+    """A chain that runs until it is told to finish, recording queue positions."""
+
+    def __init__(self, controller: AdmissionController):
+        self.controller = controller
+        self.positions: list[int] = []
+        self.started = asyncio.Event()
+        self.finish = asyncio.Event()
+
+    async def record_position(self, position: int):
+        self.positions.append(position)
+
+    async def run(self):
+        async with self.controller.admit(self.record_position):
+            self.started.set()
+            await self.finish.wait()
+
+
+async def settle():
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+def test_chains_run_straight_away_below_the_limit(mock_settings):
+    async def run():
+        controller = make_controller(mock_settings, max_in_flight=2)
+        chains = [Chain(controller) for _ in range(2)]
+        tasks = [asyncio.create_task(chain.run()) for chain in chains]
+        await settle()
+
+        assert all(chain.started.is_set() for chain in chains)
+        assert all(chain.positions == [] for chain in chains)
+        assert controller.in_flight == 2
+
+        for chain in chains:
+            chain.finish.set()
+        await asyncio.gather(*tasks)
+        assert controller.in_flight == 0
+
+    asyncio.run(run())
+
+
+def test_queued_chains_are_told_their_position_and_run_in_order(mock_settings):
+    async def run():
+        controller = make_controller(mock_settings, max_in_flight=1, max_queued=2)
+        first, second, third = chains = [Chain(controller) for _ in range(3)]
+        tasks = []
+        for chain in chains:
+            tasks.append(asyncio.create_task(chain.run()))
+            await settle()
+
+        assert first.started.is_set()
+        assert not second.started.is_set() and not third.started.is_set()
+        assert second.positions == [1]
+        assert third.positions == [2]
+
+        first.finish.set()
+        await settle()
+        assert second.started.is_set() and not third.started.is_set()
+        assert third.positions == [2, 1]
+
+        second.finish.set()
+        await settle()
+        assert third.started.is_set()
+        assert third.positions == [2, 1]
+
+        third.finish.set()
+        await asyncio.gather(*tasks)
+        assert controller.in_flight == 0
+        assert not controller.waiters
+
+    asyncio.run(run())
+
+
+def test_questions_are_rejected_once_the_queue_is_full(mock_settings):
+    async def run():
+        controller = make_controller(mock_settings, max_in_flight=1, max_queued=1)
+        running, waiting = Chain(controller), Chain(controller)
+        tasks = [asyncio.create_task(running.run())]
+        await settle()
+        tasks.append(asyncio.create_task(waiting.run()))
+        await settle()
+
+        with pytest.raises(QueueFullError):
+            await Chain(controller).run()
+
+        running.finish.set()
+        waiting.finish.set()
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run())
+
+
+def test_a_client_leaving_the_queue_moves_the_others_up(mock_settings):
+    async def run():
+        controller = make_controller(mock_settings, max_in_flight=1, max_queued=2)
+        running, leaving, staying = chains = [Chain(controller) for _ in range(3)]
+        tasks = []
+        for chain in chains:
+            tasks.append(asyncio.create_task(chain.run()))
+            await settle()
+
+        tasks[1].cancel()
+        await settle()
+        assert staying.positions == [2, 1]
+        assert len(controller.waiters) == 1
+
+        running.finish.set()
+        await settle()
+        assert staying.started.is_set()
+        assert not leaving.started.is_set()
+
+        staying.finish.set()
+        await asyncio.gather(tasks[0], tasks[2])
+        assert controller.in_flight == 0
+
+    asyncio.run(run())
+
+
+def test_a_failing_chain_frees_its_slot(mock_settings):
+    async def run():
+        controller = make_controller(mock_settings, max_in_flight=1)
+
+        async def fail():
+            async with controller.admit(Chain(controller).record_position):
+                raise RuntimeError("upstream rate limit")
+
+        with pytest.raises(RuntimeError):
+            await fail()
+        assert controller.in_flight == 0
+
+        chain = Chain(controller)
+        chain.finish.set()
+        await chain.run()
+        assert chain.started.is_set()
+
+    asyncio.run(run())
+
+
+def test_queued_chains_are_reminded_of_their_position(mock_settings):
+    async def run():
+        controller = AdmissionController(
+            dataclasses.replace(
+                mock_settings, max_concurrent_chains=1, queue_update_interval=0.01
+            )
+        )
+        running, waiting = Chain(controller), Chain(controller)
+        tasks = [asyncio.create_task(running.run())]
+        await settle()
+        tasks.append(asyncio.create_task(waiting.run()))
+        await asyncio.sleep(0.035)
+
+        assert waiting.positions[:3] == [1, 1, 1]
+
+        running.finish.set()
+        waiting.finish.set()
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run())
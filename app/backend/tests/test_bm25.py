@@ -0,0 +1,98 @@
+import uuid
+
+from langchain.embeddings import DeterministicFakeEmbedding
+from store_format.bm25 import build_bm25_index, export_bm25_index
+from store_format.vector_index import export_vector_index
+
+from document_store.bm25 import BM25Index
+from document_store.chroma_store import MmrChroma
+from document_store.vector_index import MmapVectorStore
+from query.hybrid_retriever import HybridRetriever, reciprocal_rank_fusion
+
+TEXTS = [
+    "The Liberal Democrats will invest in rural bus services",
+    "Our plan for the NHS cuts waiting lists and hires more GPs",
+    "Fixing ERR_SSL_PROTOCOL errors on the donation page",
+    "Local councillors campaign to save the village library",
+    "Sewage dumping in rivers must end, say Liberal Democrats",
+    "Campaign update for the by-election in Tiverton and Honiton",
+]
+
+
+def test_exact_terms_rank_first(tmp_path):
+    build_bm25_index(
+        ((f"chunk-{i}", text) for i, text in enumerate(TEXTS)), tmp_path / "bm25"
+    )
+    index = BM25Index(tmp_path / "bm25")
+
+    assert index.search("ERR_SSL_PROTOCOL", 3)[0][0] == "chunk-2"
+    assert index.search("what about tiverton?", 3)[0][0] == "chunk-5"
+    assert {chunk_id for chunk_id, _ in index.search("liberal democrats", 3)} == {
+        "chunk-0",
+        "chunk-4",
+    }
+    assert not index.search("unmatched", 3)
+
+
+def test_compound_tokens_match_their_parts(tmp_path):
+    build_bm25_index([("a", "lighthouse-admin v2.3 released")], tmp_path / "bm25")
+    index = BM25Index(tmp_path / "bm25")
+
+    assert index.search("lighthouse", 1)[0][0] == "a"
+    assert index.search("v2.3", 1)[0][0] == "a"
+
+
+def test_index_is_loaded_on_first_search(tmp_path):
+    build_bm25_index([("a", "library")], tmp_path / "bm25")
+    index = BM25Index(tmp_path / "bm25")
+
+    assert not index.loaded
+    index.search("library", 1)
+    assert index.loaded
+
+
+def test_rebuild_replaces_the_index(tmp_path):
+    build_bm25_index([("a", "library")], tmp_path / "bm25")
+    build_bm25_index([("b", "bus")], tmp_path / "bm25")
+
+    found = BM25Index(tmp_path / "bm25").search("bus library", 2)
+    assert [chunk_id for chunk_id, _ in found] == ["b"]
+    assert not list(tmp_path.glob(".*partial"))
+
+
+def test_reciprocal_rank_fusion_favours_agreement():
+    assert reciprocal_rank_fusion([["a", "b"], ["b", "c"]]) == ["b", "a", "c"]
+
+
+def hybrid_retriever(vector_store, directory):
+    # pylint: disable-next=protected-access
+    export_bm25_index(vector_store._collection, directory / "bm25", page_size=4)
+    return HybridRetriever(
+        vector_store=vector_store,
+        lexical_index=BM25Index(directory / "bm25"),
+        k=2,
+        fetch_k=2,
+        lexical_k=2,
+    )
+
+
+def test_hybrid_retriever_finds_exact_terms_with_chroma(tmp_path, make_chroma):
+    retriever = hybrid_retriever(make_chroma(TEXTS), tmp_path)
+
+    found = retriever.get_relevant_documents("ERR_SSL_PROTOCOL")
+
+    assert TEXTS[2] in [doc.page_content for doc in found]
+
+
+def test_hybrid_retriever_finds_exact_terms_with_mmap(tmp_path, make_chroma):
+    chroma = make_chroma(TEXTS)
+    # pylint: disable-next=protected-access
+    export_vector_index(chroma._collection, tmp_path / "vector_index")
+    mmap_store = MmapVectorStore(tmp_path / "vector_index", chroma.embeddings)
+    retriever = hybrid_retriever(chroma, tmp_path)
+    retriever.vector_store = mmap_store
+
+    found = retriever.get_relevant_documents("Tiverton")
+
+    assert TEXTS[5] in [doc.page_content for doc in found]
+    assert len({doc.page_content for doc in found}) == 2
@@ -0,0 +1,92 @@
+import asyncio
+
+from langchain.chains import LLMChain
+from langchain.chains.question_answering import load_qa_chain
+from langchain.embeddings import DeterministicFakeEmbedding
+from langchain.llms.fake import FakeListLLM
+from langchain.prompts import PromptTemplate
+from langchain.schema import AIMessage, Document, HumanMessage
+from langchain.vectorstores.chroma import Chroma
+
+from query.cached_retrieval_chain import (
+    SEMANTIC_CACHE_LOOKUP_KEY,
+    CachedConversationalRetrievalChain,
+)
+from query.semantic_cache import SemanticCache
+
+
+class CountingLLM(FakeListLLM):
+    calls: int = 0
+
+    async def _acall(self, *args, **kwargs) -> str:
+        self.calls += 1
+        return await super()._acall(*args, **kwargs)
+
+
+class CountingEmbeddings(DeterministicFakeEmbedding):
+    requests: list = []
+
+    async def aembed_query(self, text: str):
+        self.requests.append(text)
+        return self.embed_query(text)
+
+
+def make_chain(condensed_question: str, speculative_retrieval=False):
+    embeddings = DeterministicFakeEmbedding(size=8)
+    vector_store = Chroma(collection_name="retrieval", embedding_function=embeddings)
+    vector_store.add_documents([Document(page_content="Lighthouse manages members")])
+    prompt = PromptTemplate.from_template("{context} {question}")
+    condense_llm = CountingLLM(responses=[condensed_question])
+    chain = CachedConversationalRetrievalChain(
+        retriever=vector_store.as_retriever(search_kwargs={"k": 1}),
+        combine_docs_chain=load_qa_chain(
+            FakeListLLM(responses=["answer"]), chain_type="stuff", prompt=prompt
+        ),
+        question_generator=LLMChain(
+            llm=condense_llm,
+            prompt=PromptTemplate.from_template("{chat_history} {question}"),
+        ),
+        return_source_documents=True,
+        return_generated_question=True,
+        speculative_retrieval=speculative_retrieval,
+    )
+    return chain, condense_llm
+
+
+def test_first_turn_skips_condensing():
+    chain, condense_llm = make_chain("unused")
+
+    output = asyncio.run(
+        chain.acall({"question": "what is lighthouse", "chat_history": []})
+    )
+
+    assert condense_llm.calls == 0
+    assert output["generated_question"] == "what is lighthouse"
+
+
+def test_speculative_retrieval_used_for_unchanged_question():
+    chain, condense_llm = make_chain("What is  Lighthouse", speculative_retrieval=True)
+    history = [HumanMessage(content="hello"), AIMessage(content="hi")]
+
+    output = asyncio.run(
+        chain.acall({"question": "what is lighthouse", "chat_history": history})
+    )
+
+    assert condense_llm.calls == 1
+    assert output["source_documents"][0].page_content == "Lighthouse manages members"
+
+
+def test_lookup_made_before_the_chain_is_reused(mock_settings):
+    chain, _ = make_chain("unused")
+    chain.semantic_cache = SemanticCache(mock_settings)
+    chain.embeddings = CountingEmbeddings(size=8, requests=[])
+    question = {"question": "what is lighthouse", "chat_history": []}
+
+    lookup = asyncio.run(chain.alookup(question["question"]))
+    first = asyncio.run(chain.acall({**question, SEMANTIC_CACHE_LOOKUP_KEY: lookup}))
+    second = asyncio.run(chain.acall(question))
+
+    assert lookup.cached is None
+    assert chain.embeddings.requests == ["what is lighthouse"] * 2
+    assert second["answer"] == first["answer"]
+    assert chain.semantic_cache.hits == 1
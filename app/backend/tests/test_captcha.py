@@ -0,0 +1,55 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+from fastapi import HTTPException
+from fastapi.datastructures import Address
+
+from captcha import CaptchaVerifier
+from settings.chat_bot_settings import ChatbotSettings
+
+
+def stub_transport(success: bool, delay: float = 0.0) -> httpx.MockTransport:
+    async def handler(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(delay)
+        return httpx.Response(
+            200, json={"success": success, "error-codes": [] if success else ["bad"]}
+        )
+
+    return httpx.MockTransport(handler)
+
+
+def test_verify_success(mock_settings: ChatbotSettings):
+    async def run():
+        verifier = CaptchaVerifier(mock_settings, "secret", stub_transport(True))
+        result = await verifier.verify("token", Address("127.0.0.1", 1))
+        await verifier.aclose()
+        return result
+
+    assert asyncio.run(run())
+
+
+def test_verify_failure_raises(mock_settings: ChatbotSettings):
+    async def run():
+        verifier = CaptchaVerifier(mock_settings, "secret", stub_transport(False))
+        try:
+            await verifier.verify("token", Address("127.0.0.1", 1))
+        finally:
+            await verifier.aclose()
+
+    with pytest.raises(HTTPException):
+        asyncio.run(run())
+
+
+def test_verifications_run_concurrently(mock_settings: ChatbotSettings):
+    async def run():
+        verifier = CaptchaVerifier(mock_settings, "secret", stub_transport(True, 0.1))
+        start = time.perf_counter()
+        await asyncio.gather(
+            *[verifier.verify("token", Address("127.0.0.1", 1)) for _ in range(20)]
+        )
+        await verifier.aclose()
+        return time.perf_counter() - start
+
+    assert asyncio.run(run()) < 1.0
@@ -0,0 +1,112 @@
+import asyncio
+import dataclasses
+
+from langchain.chains import LLMChain
+from langchain.chains.question_answering import load_qa_chain
+from langchain.embeddings import DeterministicFakeEmbedding
+from langchain.llms.fake import FakeListLLM
+from langchain.prompts import PromptTemplate
+from langchain.schema import Document
+from langchain.vectorstores.chroma import Chroma
+
+from query.cached_retrieval_chain import CachedConversationalRetrievalChain
+from query.context_packer import ContextPacker
+
+
+class WordEncoding:
+    """Stands in for a tiktoken encoding with one token per word."""
+
+    def encode(self, text):
+        return text.split()
+
+    def decode(self, tokens):
+        return " ".join(tokens)
+
+
+def make_packer(mock_settings, **overrides):
+    settings = dataclasses.replace(
+        mock_settings,
+        context_window=1000,
+        context_min_document_tokens=3,
+        context_min_overlap_characters=8,
+        **overrides,
+    )
+    return ContextPacker(settings, WordEncoding())
+
+
+def words(start, count):
+    return " ".join(f"w{i}" for i in range(start, start + count))
+
+
+def test_budget_leaves_room_for_the_prompt_and_answer(mock_settings):
+    packer = make_packer(mock_settings, context_token_budget=5000, max_tokens=200)
+
+    # 1000 - 200 - 3 prompt words - 2 question words - 16 overhead
+    assert packer.budget("a question") == 779
+    assert make_packer(mock_settings, context_token_budget=50).budget("a") == 50
+
+
+def test_documents_are_packed_in_order_until_the_budget(mock_settings):
+    # Each document also costs a separator token
+    packer = make_packer(mock_settings, context_token_budget=26)
+    documents = [Document(page_content=words(i * 100, 10)) for i in range(4)]
+
+    packed = packer.pack(documents, "question")
+
+    assert [doc.page_content for doc in packed] == [
+        words(0, 10),
+        words(100, 10),
+        words(200, 3),
+    ]
+
+
+def test_stored_token_counts_are_used(mock_settings):
+    packer = make_packer(mock_settings, context_token_budget=25)
+    documents = [
+        Document(page_content=words(0, 10), metadata={"tokens": 30}),
+        Document(page_content=words(100, 10)),
+    ]
+
+    packed = packer.pack(documents, "question")
+
+    assert [doc.page_content for doc in packed] == [words(0, 10)]
+
+
+def test_duplicates_and_overlaps_are_removed(mock_settings):
+    packer = make_packer(mock_settings, context_token_budget=100)
+    documents = [
+        Document(page_content=words(0, 10)),
+        Document(page_content=words(2, 5)),
+        Document(page_content=words(6, 10), metadata={"source": "b"}),
+    ]
+
+    packed = packer.pack(documents, "question")
+
+    assert [doc.page_content for doc in packed] == [words(0, 10), words(10, 6)]
+    assert packed[1].metadata == {"source": "b"}
+
+
+def test_chain_answers_from_packed_documents(mock_settings):
+    vector_store = Chroma(
+        collection_name="packing",
+        embedding_function=DeterministicFakeEmbedding(size=8),
+    )
+    vector_store.add_documents([Document(page_content=words(0, 50))])
+    chain = CachedConversationalRetrievalChain(
+        retriever=vector_store.as_retriever(search_kwargs={"k": 1}),
+        combine_docs_chain=load_qa_chain(
+            FakeListLLM(responses=["answer"]),
+            chain_type="stuff",
+            prompt=PromptTemplate.from_template("{context} {question}"),
+        ),
+        question_generator=LLMChain(
+            llm=FakeListLLM(responses=["unused"]),
+            prompt=PromptTemplate.from_template("{chat_history} {question}"),
+        ),
+        return_source_documents=True,
+        context_packer=make_packer(mock_settings, context_token_budget=11),
+    )
+
+    output = asyncio.run(chain.acall({"question": "what", "chat_history": []}))
+
+    assert output["source_documents"][0].page_content == words(0, 10)
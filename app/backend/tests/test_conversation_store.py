@@ -0,0 +1,209 @@
+import asyncio
+import dataclasses
+from types import SimpleNamespace
+
+from langchain.chains.llm import LLMChain
+from langchain.llms.fake import FakeListLLM
+from langchain.memory.prompt import SUMMARY_PROMPT
+from langchain.schema import SystemMessage
+
+from conversation_store import ConversationStore
+from messageData import MessageData
+from schema.message import Message
+
+
+def make_store(mock_settings, summary_chain=None, message_data=None, **overrides):
+    settings = dataclasses.replace(
+        mock_settings,
+        **{
+            "conversation_window_messages": 4,
+            "conversation_summary_batch": 2,
+            **overrides,
+        },
+    )
+    return ConversationStore(settings, summary_chain, message_data)
+
+
+def make_summary_chain(*responses: str) -> LLMChain:
+    return LLMChain(llm=FakeListLLM(responses=list(responses)), prompt=SUMMARY_PROMPT)
+
+
+def question(number: int, previous: str = "null") -> dict:
+    return {
+        "type": "human",
+        "content": f"question {number}",
+        "messageId": f"q{number}",
+        "previousMessageId": previous,
+        "userId": "user",
+        "time": number,
+    }
+
+
+def answer(number: int) -> dict:
+    return {
+        "type": "ai",
+        "content": f"answer {number}",
+        "messageId": f"a{number}",
+        "previousMessageId": f"q{number}",
+        "userId": "AI",
+        "time": number,
+    }
+
+
+async def ask(store: ConversationStore, number: int, messages: list[dict] = None):
+    """One turn as the question handler and final answer callback take it."""
+    previous = "null" if number == 1 else f"a{number - 1}"
+    conversation = await store.continue_with(
+        store.parse((messages or []) + [question(number, previous)])
+    )
+    history = conversation.chat_history()
+    conversation.add(Message.from_dict(answer(number)))
+    store.save(conversation)
+    return conversation, history
+
+
+def contents(history) -> list[str]:
+    return [message.content for message in history]
+
+
+def test_questions_find_their_conversation_by_previous_message(mock_settings):
+    async def run():
+        store = make_store(mock_settings)
+        first, history = await ask(store, 1)
+        assert history == []
+        second, history = await ask(store, 2)
+
+        assert second is first
+        assert contents(history) == ["question 1", "answer 1"]
+        assert list(store.conversations) == ["a2"]
+
+    asyncio.run(run())
+
+
+def test_history_is_limited_to_the_window_without_a_summary(mock_settings):
+    async def run():
+        store = make_store(mock_settings)
+        for number in range(1, 4):
+            conversation, history = await ask(store, number)
+
+        assert contents(history) == ["answer 1", "question 2", "answer 2"]
+        assert conversation.pending == []
+
+    asyncio.run(run())
+
+
+def test_older_messages_are_summarised_in_the_background(mock_settings):
+    async def run():
+        store = make_store(mock_settings, make_summary_chain("They met."))
+        for number in range(1, 4):
+            await ask(store, number)
+        await asyncio.gather(*store.background_tasks)
+
+        conversation, history = await ask(store, 4)
+
+        assert isinstance(history[0], SystemMessage)
+        assert contents(history) == [
+            "Summary of the conversation so far: They met.",
+            "question 2",
+            "answer 2",
+            "question 3",
+            "answer 3",
+        ]
+        assert conversation.summary == "They met."
+
+    asyncio.run(run())
+
+
+def test_messages_waiting_to_be_summarised_are_sent_in_full(mock_settings):
+    async def run():
+        store = make_store(
+            mock_settings, make_summary_chain("They met."), conversation_summary_batch=3
+        )
+        for number in range(1, 3):
+            await ask(store, number)
+
+        _, history = await ask(store, 3)
+
+        assert contents(history) == [
+            "question 1",
+            "answer 1",
+            "question 2",
+            "answer 2",
+        ]
+
+    asyncio.run(run())
+
+
+def test_a_failed_summary_keeps_the_messages(mock_settings):
+    class FailingChain:
+        async def apredict(self, **kwargs):
+            raise ConnectionError("upstream unavailable")
+
+    async def run():
+        store = make_store(mock_settings, FailingChain())
+        for number in range(1, 4):
+            conversation, _ = await ask(store, number)
+        await asyncio.gather(*store.background_tasks, return_exceptions=True)
+
+        assert conversation.summary == ""
+        assert [message.messageId for message in conversation.pending] == [
+            "q1",
+            "a1",
+        ]
+        assert conversation.summarising is None
+
+    asyncio.run(run())
+
+
+def test_conversations_are_rebuilt_from_the_client(mock_settings):
+    async def run():
+        store = make_store(mock_settings)
+        sent = [question(1), answer(1)]
+
+        _, history = await ask(store, 2, sent)
+
+        assert contents(history) == ["question 1", "answer 1"]
+
+    asyncio.run(run())
+
+
+def test_conversations_are_rebuilt_from_the_database(mock_settings):
+    items = {}
+    for number in range(1, 4):
+        for message in (question(number, f"a{number - 1}"), answer(number)):
+            message = Message.from_dict(message)
+            items[message.messageId] = MessageData.to_item(message)
+    items["q1"]["previousMessageId"] = "null"
+    table = SimpleNamespace(
+        name="messages",
+        get_item=lambda Key: {"Item": items[Key["messageId"]]},
+    )
+
+    async def run():
+        store = make_store(
+            mock_settings,
+            message_data=MessageData(table, mock_settings),
+            conversation_window_messages=10,
+        )
+
+        _, history = await ask(store, 4)
+
+        assert contents(history) == [
+            f"{kind} {number}"
+            for number in range(1, 4)
+            for kind in ("question", "answer")
+        ]
+
+    asyncio.run(run())
+
+
+def test_least_recently_used_conversations_are_forgotten(mock_settings):
+    async def run():
+        store = make_store(mock_settings, conversation_max_conversations=2)
+        await store.continue_with(store.parse([question(1)]))
+        await store.continue_with(store.parse([question(2)]))
+        await store.continue_with(store.parse([question(3)]))
+
+        assert list(store.conversations) == ["q2", "q3"]
+
+    asyncio.run(run())
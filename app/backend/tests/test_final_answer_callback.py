@@ -0,0 +1,45 @@
+import asyncio
+from uuid import uuid4
+
+from langchain.schema import HumanMessage
+
+from query.callbacks.final_answer import FinalAnswerCallback
+from schema.message import Message
+
+
+class RecordingWebsocket:
+    def __init__(self):
+        self.sent = []
+
+    async def send_json(self, data):
+        self.sent.append(data)
+
+
+class RecordingWriter:
+    def __init__(self):
+        self.messages = []
+
+    async def add_message(self, message):
+        self.messages.append(message)
+
+
+def test_only_root_chain_is_reported():
+    websocket = RecordingWebsocket()
+    writer = RecordingWriter()
+    question = Message(HumanMessage(content="hi"), "1", "null", {}, "user", 0, "human")
+    callback = FinalAnswerCallback(websocket, question, writer)
+    root = uuid4()
+
+    async def run():
+        await callback.on_chain_start({}, {}, run_id=root)
+        await callback.on_chain_start({}, {}, run_id=uuid4(), parent_run_id=root)
+        await callback.on_chain_end({}, run_id=uuid4(), parent_run_id=root)
+        await callback.on_chain_end(
+            {"answer": "hello", "source_documents": []}, run_id=root
+        )
+
+    asyncio.run(run())
+
+    assert [frame["type"] for frame in websocket.sent] == ["start", "end"]
+    assert websocket.sent[0]["messageId"] == websocket.sent[1]["id"]
+    assert len(writer.messages) == 2
@@ -1,8 +1,63 @@
+import asyncio
+
+from admission import AdmissionController
+from conversation_store import ConversationStore
+from sessions import SessionTokens
 from settings.chat_bot_settings import ChatbotSettings
 from query.llm_chain_factory import LLMChainFactory
+from query.question_handler import QuestionHandler
+from query.callbacks.final_answer import FinalAnswerCallback
+from query.callbacks.streaming_callback import StreamingCallback
 from langchain.prompts import ChatPromptTemplate
 
 
 def test_get_chat_prompt_template(mock_settings: ChatbotSettings):
     chat_prompt_template = LLMChainFactory.get_chat_prompt_template(mock_settings)
     assert isinstance(chat_prompt_template, ChatPromptTemplate)
+
+
+def test_chain_is_shared_between_questions(mock_settings, mock_vector_store):
+    factory = LLMChainFactory(None, mock_vector_store, mock_settings)
+    handler = QuestionHandler(
+        factory,
+        None,
+        AdmissionController(mock_settings),
+        SessionTokens(mock_settings, "secret"),
+        ConversationStore(mock_settings),
+    )
+    calls = []
+
+    async def call_chain(websocket, chain, inputs, callbacks):
+        calls.append((chain, callbacks))
+
+    handler.call_chain = call_chain
+
+    async def ask_twice():
+        for number in (1, 2):
+            question = {
+                "messages": [
+                    {
+                        "type": "human",
+                        "content": f"question {number}",
+                        "messageId": f"q{number}",
+                        "previousMessageId": "null",
+                        "userId": "user",
+                        "time": number,
+                    }
+                ]
+            }
+            await handler.answer(None, question, 0.0)
+
+    asyncio.run(ask_twice())
+
+    (first_chain, first), (second_chain, second) = calls
+    assert first_chain is factory.chain
+    assert second_chain is factory.chain
+    for callbacks in (first, second):
+        assert [type(callback) for callback in callbacks] == [
+            StreamingCallback,
+            FinalAnswerCallback,
+        ]
+        # Passed to acall for the one question, never attached to the chain
+        assert not any(callback in factory.chain.callbacks for callback in callbacks)
+    assert all(a is not b for a, b in zip(first, second))
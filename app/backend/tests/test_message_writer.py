@@ -0,0 +1,132 @@
+import asyncio
+from types import SimpleNamespace
+
+from botocore.exceptions import ClientError
+from langchain.schema import HumanMessage
+
+from messageData import MessageData
+from message_writer import MessageWriter
+from schema.message import Message
+from settings.chat_bot_settings import ChatbotSettings
+
+
+class FakeDynamoClient:
+    """Stands in for DynamoDB, leaving the first item of each call unprocessed
+    for the first `unprocessed_calls` calls and failing the first calls with
+    `errors`, one error code each."""
+
+    def __init__(
+        self, table_name: str, unprocessed_calls: int = 0, errors: list[str] = ()
+    ):
+        self.table_name = table_name
+        self.unprocessed_calls = unprocessed_calls
+        self.errors = list(errors)
+        self.calls: list[int] = []
+        self.items: dict[str, dict] = {}
+
+    def batch_write_item(self, RequestItems: dict):
+        requests = RequestItems[self.table_name]
+        assert len(requests) <= MessageData.MAX_BATCH_SIZE
+        self.calls.append(len(requests))
+        if self.errors:
+            raise ClientError(
+                {"Error": {"Code": self.errors.pop(0), "Message": "fake"}},
+                "BatchWriteItem",
+            )
+
+        unprocessed = []
+        if self.unprocessed_calls > 0:
+            self.unprocessed_calls -= 1
+            unprocessed, requests = requests[:1], requests[1:]
+
+        for request in requests:
+            item = request["PutRequest"]["Item"]
+            self.items[item["messageId"]] = item
+
+        if unprocessed:
+            return {"UnprocessedItems": {self.table_name: unprocessed}}
+        return {"UnprocessedItems": {}}
+
+
+def make_writer(mock_settings: ChatbotSettings, client: FakeDynamoClient):
+    table = SimpleNamespace(name=client.table_name, meta=SimpleNamespace(client=client))
+    mock_settings.message_flush_interval = 0.01
+    return MessageWriter(MessageData(table, mock_settings), mock_settings)
+
+
+def make_message(message_id: int) -> Message:
+    return Message(
+        message=HumanMessage(content=f"question {message_id}"),
+        messageId=str(message_id),
+        previousMessageId="null",
+        sources={},
+        user="user",
+        time=message_id,
+        sender_type="human",
+    )
+
+
+def test_messages_are_batched(mock_settings: ChatbotSettings):
+    client = FakeDynamoClient("messages")
+    writer = make_writer(mock_settings, client)
+
+    async def run():
+        await writer.start()
+        for message_id in range(60):
+            await writer.add_message(make_message(message_id))
+        await writer.stop()
+
+    asyncio.run(run())
+
+    assert len(client.items) == 60
+    assert max(client.calls) == MessageData.MAX_BATCH_SIZE
+    assert len(client.calls) < 60
+
+
+def test_unprocessed_items_are_retried(mock_settings: ChatbotSettings):
+    client = FakeDynamoClient("messages", unprocessed_calls=2)
+    writer = make_writer(mock_settings, client)
+
+    writer.flush([make_message(message_id) for message_id in range(3)])
+
+    assert client.calls == [3, 1, 1]
+    assert len(client.items) == 3
+
+
+def test_throttled_batches_are_retried(mock_settings: ChatbotSettings):
+    client = FakeDynamoClient(
+        "messages",
+        errors=["ProvisionedThroughputExceededException", "ThrottlingException"],
+    )
+    writer = make_writer(mock_settings, client)
+
+    writer.flush([make_message(message_id) for message_id in range(3)])
+
+    assert client.calls == [3, 3, 3]
+    assert len(client.items) == 3
+
+
+def test_batches_that_cannot_succeed_are_not_retried(mock_settings: ChatbotSettings):
+    client = FakeDynamoClient("messages", errors=["ValidationException"])
+    writer = make_writer(mock_settings, client)
+
+    writer.flush([make_message(message_id) for message_id in range(3)])
+
+    assert client.calls == [3]
+    assert not client.items
+
+
+def test_stop_drains_queue(mock_settings: ChatbotSettings):
+    client = FakeDynamoClient("messages")
+    writer = make_writer(mock_settings, client)
+    writer.flush_interval = 60
+
+    async def run():
+        await writer.start()
+        await writer.add_message(make_message(1))
+        assert writer.queue_depth <= 1
+        await writer.stop()
+
+    asyncio.run(run())
+
+    assert "1" in client.items
@@ -0,0 +1,46 @@
+import uuid
+
+import numpy as np
+from langchain.embeddings import DeterministicFakeEmbedding
+from langchain.vectorstores.utils import (
+    maximal_marginal_relevance as generic_maximal_marginal_relevance,
+)
+from store_format.vector_index import normalise
+
+from document_store.chroma_store import MmrChroma
+from document_store.mmr import maximal_marginal_relevance, top_k
+
+
+def test_matches_generic_implementation():
+    rng = np.random.default_rng(0)
+    candidates = normalise(rng.standard_normal((50, 16)))
+    query = normalise(rng.standard_normal(16))
+
+    for lambda_mult in (0.0, 0.5, 1.0):
+        expected = generic_maximal_marginal_relevance(
+            query, candidates, lambda_mult=lambda_mult, k=8
+        )
+        assert maximal_marginal_relevance(query, candidates, 8, lambda_mult) == (
+            expected
+        )
+
+
+def test_top_k_is_ordered_and_bounded():
+    scores = np.array([0.1, 0.9, 0.5, 0.7], dtype=np.float32)
+
+    assert top_k(scores, 3).tolist() == [1, 3, 2]
+    assert top_k(scores, 10).tolist() == [1, 3, 2, 0]
+    assert top_k(scores, 0).tolist() == []
+
+
+def test_chroma_returns_documents_in_pick_order():
+    vector_store = MmrChroma(
+        collection_name=f"mmr-{uuid.uuid4().hex[:8]}",
+        embedding_function=DeterministicFakeEmbedding(size=16),
+    )
+    vector_store.add_texts([f"document {i}" for i in range(10)])
+
+    found = vector_store.max_marginal_relevance_search("document 6", k=3, fetch_k=50)
+
+    assert found[0].page_content == "document 6"
+    assert len({doc.page_content for doc in found}) == 3
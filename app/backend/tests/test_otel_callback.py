@@ -0,0 +1,114 @@
+import asyncio
+from uuid import uuid4
+
+from langchain.schema.output import LLMResult
+from opentelemetry import trace
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import (
+    InMemorySpanExporter,
+)
+
+from query.cached_retrieval_chain import SEMANTIC_CACHE_LLM_NAME
+from query.callbacks.otel_callback import OpentelemetryCallback
+
+
+def stream_tokens(callback: OpentelemetryCallback, clock, tokens: int, serialized=None):
+    exporter = InMemorySpanExporter()
+    provider = TracerProvider()
+    provider.add_span_processor(SimpleSpanProcessor(exporter))
+    run_id = uuid4()
+
+    async def run():
+        with provider.get_tracer("test").start_as_current_span("answer"):
+            await callback.on_llm_start(serialized or {}, ["prompt"], run_id=run_id)
+            clock.now += 0.5
+            for i in range(tokens):
+                await callback.on_llm_new_token("token", run_id=run_id)
+                clock.now += 0.1 if i % 2 else 0.3
+            await callback.on_llm_end(LLMResult(generations=[]), run_id=run_id)
+
+    asyncio.run(run())
+    return exporter.get_finished_spans()[0]
+
+
+def test_tokens_are_summarised_on_the_span(clock):
+    callback = OpentelemetryCallback(clock=clock)
+
+    span = stream_tokens(callback, clock, 5)
+
+    assert [event.name for event in span.events] == ["on_llm_start", "on_llm_end"]
+    assert span.attributes["chatbot.llm.tokens"] == 5
+    assert span.attributes["chatbot.llm.time_to_first_token_ms"] == 500
+    assert round(span.attributes["chatbot.llm.max_inter_token_latency_ms"]) == 300
+    assert round(span.attributes["chatbot.llm.tokens_per_second"], 3) == 5.0
+    assert not callback.runs
+
+
+def test_token_events_are_sampled(clock):
+    span = stream_tokens(OpentelemetryCallback(3, clock), clock, 7)
+
+    token_events = [e for e in span.events if e.name == "on_llm_new_token"]
+    assert [e.attributes["chatbot.llms.token_index"] for e in token_events] == [
+        1,
+        4,
+        7,
+    ]
+
+
+def test_runs_without_tokens_add_no_attributes(clock):
+    span = stream_tokens(OpentelemetryCallback(clock=clock), clock, 0)
+
+    assert "chatbot.llm.tokens" not in span.attributes
+
+
+def test_replayed_answers_are_not_timed(clock):
+    span = stream_tokens(
+        OpentelemetryCallback(clock=clock),
+        clock,
+        5,
+        {"name": SEMANTIC_CACHE_LLM_NAME},
+    )
+
+    assert span.attributes["chatbot.llm.replayed"]
+    assert span.attributes["chatbot.llm.tokens"] == 5
+    assert "chatbot.llm.time_to_first_token_ms" not in span.attributes
+
+
+def test_runs_that_never_end_are_dropped_with_their_chain():
+    callback = OpentelemetryCallback()
+    chain_run, other_chain_run = uuid4(), uuid4()
+
+    async def run():
+        await callback.on_llm_start(
+            {}, ["prompt"], run_id=uuid4(), parent_run_id=chain_run
+        )
+        await callback.on_llm_new_token(
+            "token", run_id=uuid4(), parent_run_id=chain_run
+        )
+        await callback.on_llm_start(
+            {}, ["prompt"], run_id=uuid4(), parent_run_id=other_chain_run
+        )
+        await callback.on_chain_error(
+            RuntimeError("cancelled"), run_id=chain_run, parent_run_id=None
+        )
+
+    asyncio.run(run())
+
+    assert [stats.parent_run_id for stats in callback.runs.values()] == [
+        other_chain_run
+    ]
+
+
+def test_runs_in_flight_are_bounded(monkeypatch):
+    callback = OpentelemetryCallback()
+    monkeypatch.setattr(OpentelemetryCallback, "MAX_RUNS", 3)
+    run_ids = [uuid4() for _ in range(5)]
+
+    async def run():
+        for run_id in run_ids:
+            await callback.on_llm_start({}, ["prompt"], run_id=run_id)
+
+    asyncio.run(run())
+
+    assert list(callback.runs) == run_ids[2:]
@@ -0,0 +1,210 @@
+import asyncio
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+
+import pytest
+from fastapi import WebSocketDisconnect
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import (
+    InMemorySpanExporter,
+)
+
+from admission import AdmissionController, QueueFullError
+from conversation_store import ConversationStore
+from query import question_handler
+from query.cached_retrieval_chain import CacheLookup
+from query.question_handler import QuestionHandler
+from query.semantic_cache import CachedAnswer
+from sessions import SessionTokens
+
+
+class FakeWebSocket:
+    client = None
+
+    def __init__(self, frames: list[dict]):
+        self.frames = frames
+        self.sent: list[dict] = []
+
+    async def receive_json(self) -> dict:
+        if not self.frames:
+            raise WebSocketDisconnect()
+        return self.frames.pop(0)
+
+    async def send_json(self, data: dict):
+        self.sent.append(data)
+
+
+class FakeChain:
+    def __init__(self, cached: CachedAnswer | None = None):
+        self.cached = cached
+        self.calls: list[dict] = []
+
+    async def alookup(self, question: str) -> CacheLookup:
+        return CacheLookup(self.cached)
+
+    async def acall(self, inputs: dict, callbacks: list):
+        self.calls.append(inputs)
+        return {"answer": "An answer."}
+
+
+async def verify(token, client):
+    pass
+
+
+def make_handler(mock_settings) -> QuestionHandler:
+    return QuestionHandler(
+        SimpleNamespace(chain=FakeChain(), make_callbacks=lambda *args, **kwargs: []),
+        SimpleNamespace(verify=verify),
+        AdmissionController(mock_settings),
+        SessionTokens(mock_settings, "secret"),
+        ConversationStore(mock_settings),
+    )
+
+
+def frame(number: int, **fields) -> dict:
+    return {
+        "messages": [
+            {
+                "type": "human",
+                "content": f"question {number}",
+                "messageId": f"q{number}",
+                "previousMessageId": "null" if number == 1 else f"q{number - 1}",
+                "userId": "user",
+                "time": number,
+            }
+        ],
+        "captcha": "token",
+        **fields,
+    }
+
+
+def test_each_turn_of_a_session_is_its_own_trace(mock_settings, monkeypatch):
+    exporter = InMemorySpanExporter()
+    provider = TracerProvider()
+    provider.add_span_processor(SimpleSpanProcessor(exporter))
+    monkeypatch.setattr(question_handler, "tracer", provider.get_tracer("test"))
+    handler = make_handler(mock_settings)
+    websocket = FakeWebSocket([frame(1, session=True), frame(2)])
+
+    async def chat():
+        with provider.get_tracer("test").start_as_current_span("app.chat"):
+            with pytest.raises(WebSocketDisconnect):
+                await handler.handle_question(websocket)
+
+    asyncio.run(chat())
+
+    spans = exporter.get_finished_spans()
+    connection = next(span for span in spans if span.name == "app.chat")
+    turns = [span for span in spans if span.name == "chatbot.QuestionHandler.answer"]
+    assert len(turns) == 2
+    assert len({turn.context.trace_id for turn in turns}) == 2
+    for turn in turns:
+        assert turn.parent is None
+        assert turn.context.trace_id != connection.context.trace_id
+        assert [link.context for link in turn.links] == [connection.context]
+
+
+def test_a_single_question_is_traced_under_its_connection(mock_settings, monkeypatch):
+    exporter = InMemorySpanExporter()
+    provider = TracerProvider()
+    provider.add_span_processor(SimpleSpanProcessor(exporter))
+    monkeypatch.setattr(question_handler, "tracer", provider.get_tracer("test"))
+    handler = make_handler(mock_settings)
+
+    async def chat():
+        with provider.get_tracer("test").start_as_current_span("app.chat"):
+            await handler.handle_question(FakeWebSocket([frame(1)]))
+
+    asyncio.run(chat())
+
+    spans = {span.name: span for span in exporter.get_finished_spans()}
+    answer = spans["chatbot.QuestionHandler.answer"]
+    assert answer.parent.span_id == spans["app.chat"].context.span_id
+
+
+def test_chain_waits_for_the_captcha(mock_settings):
+    handler = make_handler(mock_settings)
+
+    async def reject(token, client):
+        await asyncio.sleep(0)
+        raise PermissionError("captcha failed")
+
+    handler.captcha_verifier.verify = reject
+
+    with pytest.raises(PermissionError):
+        asyncio.run(handler.handle_question(FakeWebSocket([frame(1)])))
+    assert handler.llm_chain_factory.chain.calls == []
+
+
+def test_conversation_is_untouched_until_the_captcha_passes(mock_settings):
+    handler = make_handler(mock_settings)
+    lookups = []
+    handler.conversations = ConversationStore(
+        mock_settings,
+        message_data=SimpleNamespace(
+            get_conversation=lambda *args: lookups.append(args) or []
+        ),
+    )
+
+    async def reject(token, client):
+        await asyncio.sleep(0.01)
+        raise PermissionError("captcha failed")
+
+    handler.captcha_verifier.verify = reject
+
+    with pytest.raises(PermissionError):
+        asyncio.run(handler.handle_question(FakeWebSocket([frame(2)])))
+    assert not lookups
+    assert not handler.conversations.conversations
+
+
+def test_long_questions_are_not_sent_for_a_captcha_check(mock_settings):
+    handler = make_handler(mock_settings)
+    checked = []
+
+    async def record(token, client):
+        checked.append(token)
+
+    handler.captcha_verifier.verify = record
+    question = frame(1)
+    question["messages"][0]["content"] = "why " * 100
+    websocket = FakeWebSocket([question])
+
+    asyncio.run(handler.handle_question(websocket))
+
+    assert not checked
+    assert websocket.sent[-1]["type"] == "error"
+
+
+class FullAdmissionController:
+    @asynccontextmanager
+    async def admit(self, send_position):
+        raise QueueFullError()
+        yield  # pylint: disable=unreachable
+
+
+def test_cached_first_turns_do_not_wait_for_admission(mock_settings):
+    handler = make_handler(mock_settings)
+    handler.admission_controller = FullAdmissionController()
+    handler.llm_chain_factory.chain.cached = CachedAnswer(
+        "question 1", "A cached answer.", [], created=0
+    )
+    websocket = FakeWebSocket([frame(1)])
+
+    asyncio.run(handler.handle_question(websocket))
+
+    [inputs] = handler.llm_chain_factory.chain.calls
+    assert inputs["semantic_cache_lookup"].cached.answer == "A cached answer."
+    assert not websocket.sent
+
+
+def test_uncached_first_turns_wait_for_admission(mock_settings):
+    handler = make_handler(mock_settings)
+    handler.admission_controller = FullAdmissionController()
+    websocket = FakeWebSocket([frame(1)])
+
+    asyncio.run(handler.handle_question(websocket))
+
+    assert handler.llm_chain_factory.chain.calls == []
+    assert websocket.sent[-1]["type"] == "error"
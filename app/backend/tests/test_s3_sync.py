@@ -0,0 +1,55 @@
+import json
+
+from boto3.s3.transfer import TransferConfig
+
+from document_store.s3_sync import S3Sync
+
+
+def make_sync(client):
+    config = TransferConfig(multipart_threshold=16, multipart_chunksize=8)
+    return S3Sync(client, "bucket", max_workers=4, transfer_config=config)
+
+
+def read_store(directory):
+    return {
+        path.relative_to(directory).as_posix(): path.read_bytes()
+        for path in directory.rglob("*")
+        if path.is_file()
+    }
+
+
+def publish(client, files):
+    """Put a store in the bucket as the file by file sync published them."""
+    config = TransferConfig(multipart_threshold=16, multipart_chunksize=8)
+    entries = {}
+    for name, content in files.items():
+        key = f"versions/1/{name}"
+        client.put(key, content, config)
+        entries[name] = {"key": key, "size": len(content), "etag": client.etags[key]}
+    client.put("manifest.json", json.dumps({"version": "1", "files": entries}).encode())
+
+
+def test_download_only_fetches_changes_and_removes_stale_files(
+    tmp_path, s3_client, write_store
+):
+    publish(s3_client, {"same": b"same", "changed": b"new" * 10})
+    target = tmp_path / "target"
+    write_store(target, {"same": b"same", "changed": b"old", "stale": b"stale"})
+
+    assert make_sync(s3_client).download(target) == "1"
+
+    downloaded = [key for call, key in s3_client.calls if call == "download_file"]
+    assert downloaded == ["versions/1/changed"]
+    assert read_store(target) == {"same": b"same", "changed": b"new" * 10}
+
+
+def test_bucket_without_manifest_is_mirrored(tmp_path, s3_client):
+    s3_client.put("chroma.sqlite3", b"sqlite")
+    s3_client.put("index/", b"")
+    s3_client.put("index/header.bin", b"header")
+
+    assert make_sync(s3_client).download(tmp_path) is None
+    assert read_store(tmp_path) == {
+        "chroma.sqlite3": b"sqlite",
+        "index/header.bin": b"header",
+    }
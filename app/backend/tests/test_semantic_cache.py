@@ -0,0 +1,102 @@
+import asyncio
+
+from langchain.callbacks.base import AsyncCallbackHandler
+from langchain.chains import LLMChain
+from langchain.chains.question_answering import load_qa_chain
+from langchain.embeddings import DeterministicFakeEmbedding
+from langchain.llms.fake import FakeListLLM
+from langchain.prompts import PromptTemplate
+from langchain.schema import Document
+from langchain.vectorstores.chroma import Chroma
+
+from query.cached_retrieval_chain import CachedConversationalRetrievalChain
+from query.semantic_cache import SemanticCache
+from settings.chat_bot_settings import ChatbotSettings
+
+
+class TokenRecorder(AsyncCallbackHandler):
+    def __init__(self):
+        self.tokens = []
+
+    async def on_llm_new_token(self, token: str, **kwargs) -> None:
+        self.tokens.append(token)
+
+
+def test_similar_question_hits(mock_settings: ChatbotSettings):
+    cache = SemanticCache(mock_settings)
+    cache.add("what is fleet", [1.0, 0.0], "a website host", [])
+
+    assert cache.lookup([0.99, 0.01]).answer == "a website host"
+    assert cache.lookup([0.0, 1.0]) is None
+    assert cache.hit_rate == 0.5
+
+
+def test_entries_expire(mock_settings: ChatbotSettings, clock):
+    cache = SemanticCache(mock_settings, clock)
+    cache.add("question", [1.0, 0.0], "answer", [])
+
+    clock.now = mock_settings.semantic_cache_ttl + 1
+
+    assert cache.lookup([1.0, 0.0]) is None
+    assert len(cache) == 0
+
+
+def test_least_recently_used_is_evicted(mock_settings: ChatbotSettings):
+    mock_settings.semantic_cache_size = 2
+    cache = SemanticCache(mock_settings)
+    cache.add("first", [1.0, 0.0, 0.0], "1", [])
+    cache.add("second", [0.0, 1.0, 0.0], "2", [])
+    cache.lookup([1.0, 0.0, 0.0])
+    cache.add("third", [0.0, 0.0, 1.0], "3", [])
+
+    assert cache.lookup([1.0, 0.0, 0.0]).answer == "1"
+    assert cache.lookup([0.0, 1.0, 0.0]) is None
+    assert cache.lookup([0.0, 0.0, 1.0]).answer == "3"
+
+
+def test_new_store_version_invalidates(mock_settings: ChatbotSettings):
+    cache = SemanticCache(mock_settings)
+    cache.set_store_version("collection:1")
+    cache.add("question", [1.0, 0.0], "answer", [])
+
+    cache.set_store_version("collection:1")
+    assert len(cache) == 1
+
+    cache.set_store_version("collection:2")
+    assert len(cache) == 0
+
+
+def test_chain_replays_cached_answer(mock_settings: ChatbotSettings):
+    embeddings = DeterministicFakeEmbedding(size=8)
+    vector_store = Chroma(
+        collection_name="semantic-cache", embedding_function=embeddings
+    )
+    vector_store.add_documents([Document(page_content="Fleet hosts websites")])
+    prompt = PromptTemplate.from_template("{context} {question}")
+    chain = CachedConversationalRetrievalChain(
+        retriever=vector_store.as_retriever(search_kwargs={"k": 1}),
+        combine_docs_chain=load_qa_chain(
+            FakeListLLM(responses=["first answer", "second answer"]),
+            chain_type="stuff",
+            prompt=prompt,
+        ),
+        question_generator=LLMChain(
+            llm=FakeListLLM(responses=["unused"]), prompt=prompt
+        ),
+        return_source_documents=True,
+        semantic_cache=SemanticCache(mock_settings),
+        embeddings=embeddings,
+    )
+    recorder = TokenRecorder()
+
+    async def ask():
+        return await chain.acall(
+            {"question": "what is fleet", "chat_history": []}, callbacks=[recorder]
+        )
+
+    first = asyncio.run(ask())
+    second = asyncio.run(ask())
+
+    assert first["answer"] == second["answer"] == "first answer"
+    assert second["source_documents"] == first["source_documents"]
+    assert "".join(recorder.tokens) == "first answer"
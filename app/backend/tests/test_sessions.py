@@ -0,0 +1,52 @@
+import dataclasses
+import time
+
+from sessions import SessionTokens
+
+
+def make_tokens(mock_settings, secret="secret", **overrides):
+    return SessionTokens(dataclasses.replace(mock_settings, **overrides), secret)
+
+
+def test_a_token_resumes_its_session(mock_settings):
+    tokens = make_tokens(mock_settings)
+    session_id = tokens.start()
+
+    assert tokens.resume(tokens.token(session_id)) == session_id
+
+
+def test_tokens_signed_with_another_secret_are_rejected(mock_settings):
+    other = make_tokens(mock_settings, "other secret")
+    tokens = make_tokens(mock_settings)
+
+    assert tokens.resume(other.token(other.start())) is None
+    assert tokens.resume(None) is None
+    assert tokens.resume("not-a-token") is None
+
+
+def test_tampered_tokens_are_rejected(mock_settings):
+    tokens = make_tokens(mock_settings)
+    session_id, expires, signature = tokens.token(tokens.start()).split(".")
+
+    assert tokens.resume(f"someone-else.{expires}.{signature}") is None
+    assert tokens.resume(f"{session_id}.{int(expires) + 60}.{signature}") is None
+
+
+def test_expired_tokens_are_rejected(mock_settings):
+    tokens = make_tokens(mock_settings, session_ttl=-1)
+
+    assert tokens.resume(tokens.token(tokens.start())) is None
+
+
+def test_workers_sharing_a_secret_accept_each_others_tokens(mock_settings):
+    first, second = make_tokens(mock_settings), make_tokens(mock_settings)
+    session_id = first.start()
+
+    assert second.resume(first.token(session_id)) == session_id
+
+
+def test_token_expiry_follows_the_ttl(mock_settings):
+    tokens = make_tokens(mock_settings, session_ttl=60)
+    expires = int(tokens.token(tokens.start()).split(".")[1])
+
+    assert time.time() + 50 < expires <= time.time() + 60
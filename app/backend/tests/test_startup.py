@@ -0,0 +1,128 @@
+import os
+import threading
+import time
+from types import SimpleNamespace
+
+from fastapi.testclient import TestClient
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import (
+    InMemorySpanExporter,
+)
+
+from app_factory import Services, create_app
+from startup import Startup
+
+
+def make_startup(phases):
+    exporter = InMemorySpanExporter()
+    provider = TracerProvider()
+    provider.add_span_processor(SimpleSpanProcessor(exporter))
+    return Startup(phases, provider.get_tracer("test")), exporter, provider
+
+
+def test_phases_before_telemetry_are_traced_once_it_starts():
+    startup, exporter, provider = make_startup(["telemetry", "chain"])
+    with startup.phase("telemetry"):
+        time.sleep(0.01)
+    startup.telemetry_started()
+    with startup.phase("chain"):
+        with provider.get_tracer("test").start_as_current_span("build"):
+            pass
+    startup.finish()
+
+    spans = {span.name: span for span in exporter.get_finished_spans()}
+    root = spans["app.startup"]
+    assert spans["app.startup.telemetry"].parent.span_id == root.context.span_id
+    assert spans["app.startup.telemetry"].attributes["chatbot.startup.seconds"] > 0
+    assert spans["build"].parent.span_id == spans["app.startup.chain"].context.span_id
+    assert root.attributes["chatbot.startup.state"] == "ready"
+    assert startup.report()["phases"]["chain"]["state"] == "ready"
+
+
+def test_phases_run_before_the_fork_are_marked_preloaded():
+    startup, exporter, _ = make_startup(["document_store", "telemetry"])
+    with startup.phase("document_store"):
+        pass
+    # As if this process had been forked from the one that ran it
+    startup.phases["document_store"].process = os.getpid() + 1
+    startup.telemetry_started()
+    startup.finish()
+
+    spans = {span.name: span for span in exporter.get_finished_spans()}
+    assert spans["app.startup.document_store"].attributes["chatbot.startup.preloaded"]
+    assert startup.report()["phases"]["document_store"]["preloaded"]
+    assert "preloaded" not in startup.report()["phases"]["telemetry"]
+
+
+def test_failed_phase_is_reported():
+    startup, exporter, _ = make_startup(["telemetry", "database"])
+    startup.telemetry_started()
+    try:
+        with startup.phase("database"):
+            raise ConnectionError("no route to dynamodb")
+    except ConnectionError as e:
+        startup.fail(e)
+
+    report = startup.report()
+    assert report["status"] == "failed"
+    assert report["phases"]["database"]["state"] == "failed"
+    assert "no route to dynamodb" in report["phases"]["database"]["error"]
+    assert report["phases"]["telemetry"]["state"] == "pending"
+    assert "app.startup" in [span.name for span in exporter.get_finished_spans()]
+
+
+async def noop():
+    pass
+
+
+def fake_services():
+    return Services(
+        question_handler=None,
+        message_writer=SimpleNamespace(start=noop, stop=noop),
+        captcha_verifier=SimpleNamespace(aclose=noop),
+    )
+
+
+def wait_for_status(client: TestClient, status: str):
+    deadline = time.monotonic() + 5
+    while client.get("/healthz").json()["status"] != status:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_ready_once_services_are_loaded(mock_settings):
+    loaded = threading.Event()
+
+    async def load_services(startup: Startup) -> Services:
+        await startup.run("services", loaded.wait)
+        return fake_services()
+
+    app = create_app(mock_settings, load_services, serve_frontend=False)
+    with TestClient(app) as client:
+        response = client.get("/readyz")
+        assert response.status_code == 503
+        assert response.json()["phases"]["services"]["state"] == "running"
+        assert client.get("/healthz").status_code == 200
+
+        loaded.set()
+        wait_for_status(client, "ready")
+
+        response = client.get("/readyz")
+        assert response.status_code == 200
+        assert response.json()["phases"]["message_writer"]["state"] == "ready"
+
+
+def test_chats_are_turned_away_when_startup_fails(mock_settings):
+    async def load_services(startup: Startup) -> Services:
+        with startup.phase("services"):
+            raise FileNotFoundError("no document store")
+
+    app = create_app(mock_settings, load_services, serve_frontend=False)
+    with TestClient(app) as client:
+        wait_for_status(client, "failed")
+
+        assert client.get("/healthz").status_code == 503
+        assert client.get("/readyz").status_code == 503
+        with client.websocket_connect("/chat") as websocket:
+            assert websocket.receive_json()["type"] == "error"
@@ -0,0 +1,160 @@
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from langchain.embeddings import DeterministicFakeEmbedding, FakeEmbeddings
+from langchain.vectorstores.chroma import Chroma
+from store_format.archive import StoreArchive
+
+from document_store.chroma_store import MmrChroma
+from document_store.loading import load_document_store
+from document_store.store_cache import StoreCache
+from query.llm_chain_factory import LLMChainFactory
+
+
+def make_cache(s3_client, tmp_path):
+    return StoreCache(StoreArchive(s3_client, "bucket"), tmp_path / "cache")
+
+
+def test_published_store_is_fetched_and_validated(
+    tmp_path, s3_client, publish_store, write_store
+):
+    files = {"chroma.sqlite3": b"sqlite", "index/data_level0.bin": b"x" * 4000}
+    write_store(tmp_path / "store", files)
+    cache = make_cache(s3_client, tmp_path)
+
+    version = publish_store(tmp_path / "store")["version"]
+    store = cache.fetch(cache.archive.read_manifest())
+
+    assert store.version == version
+    assert (store.directory / "index" / "data_level0.bin").read_bytes() == b"x" * 4000
+    assert cache.latest_valid().version == version
+
+
+def test_corrupt_archive_is_not_cached(tmp_path, s3_client, publish_store, write_store):
+    write_store(tmp_path / "store", {"chroma.sqlite3": b"sqlite"})
+    cache = make_cache(s3_client, tmp_path)
+    manifest = publish_store(tmp_path / "store")
+    s3_client.objects[manifest["archive"]] += b"\0"
+
+    with pytest.raises(ValueError):
+        cache.fetch(manifest)
+    assert cache.latest_valid() is None
+    assert not any((tmp_path / "cache").iterdir())
+
+
+def test_concurrent_fetches_of_one_version_both_succeed(
+    tmp_path, s3_client, publish_store, write_store
+):
+    write_store(tmp_path / "store", {"chroma.sqlite3": b"sqlite"})
+    cache = make_cache(s3_client, tmp_path)
+    manifest = publish_store(tmp_path / "store")
+    extract = cache.archive.extract
+    both_extracting = threading.Barrier(2)
+
+    def extract_together(*args):
+        both_extracting.wait(timeout=5)
+        extract(*args)
+
+    cache.archive.extract = extract_together
+    with ThreadPoolExecutor(2) as pool:
+        stores = list(pool.map(lambda _: cache.fetch(manifest), range(2)))
+
+    assert stores[0].directory == stores[1].directory
+    assert (stores[0].directory / "chroma.sqlite3").read_bytes() == b"sqlite"
+    assert {path.name for path in (tmp_path / "cache").iterdir()} == {
+        manifest["version"],
+        StoreCache.LOCK_FILE,
+    }
+
+
+def test_valid_cached_version_is_not_replaced(
+    tmp_path, s3_client, publish_store, write_store
+):
+    write_store(tmp_path / "store", {"chroma.sqlite3": b"sqlite"})
+    cache = make_cache(s3_client, tmp_path)
+    manifest = publish_store(tmp_path / "store")
+    store = cache.fetch(manifest)
+    inode = (store.directory / "chroma.sqlite3").stat().st_ino
+
+    assert cache.fetch(manifest).directory == store.directory
+    assert (store.directory / "chroma.sqlite3").stat().st_ino == inode
+
+
+def test_tampered_cache_is_discarded(tmp_path, s3_client, publish_store, write_store):
+    write_store(tmp_path / "store", {"chroma.sqlite3": b"sqlite"})
+    cache = make_cache(s3_client, tmp_path)
+    store = cache.fetch(publish_store(tmp_path / "store"))
+    (store.directory / "chroma.sqlite3").write_bytes(b"SQLITE")
+
+    assert cache.latest_valid() is None
+    assert not store.directory.exists()
+
+
+def test_cached_store_is_served_while_newer_one_is_fetched(
+    tmp_path, s3_client, publish_store, mock_settings, write_store
+):
+    cache = make_cache(s3_client, tmp_path)
+    write_store(tmp_path / "store", {"chroma.sqlite3": b"old"})
+    old = cache.fetch(publish_store(tmp_path / "store"))
+    write_store(tmp_path / "store", {"chroma.sqlite3": b"new"})
+    new_version = publish_store(tmp_path / "store")["version"]
+
+    store, newer = load_document_store(mock_settings, cache)
+
+    assert store.version == old.version
+    assert newer["version"] == new_version
+
+
+def test_swapped_vector_store_answers_new_questions(mock_settings, mock_vector_store):
+    factory = LLMChainFactory(None, mock_vector_store, mock_settings, "old")
+    old_chain = factory.chain
+    new_vector_store = Chroma(
+        collection_name="swapped", embedding_function=FakeEmbeddings(size=8)
+    )
+
+    factory.swap_vector_store(new_vector_store, "new")
+
+    assert factory.chain is not old_chain
+    assert factory.chain.retriever.vectorstore is new_vector_store
+    assert factory.semantic_cache.store_version == "new"
+
+
+def test_cache_stays_valid_once_chroma_has_served_from_it(
+    tmp_path, s3_client, publish_store
+):
+    chroma = MmrChroma(
+        collection_name="test",
+        embedding_function=DeterministicFakeEmbedding(size=8),
+        persist_directory=str(tmp_path / "store"),
+    )
+    chroma.add_texts(["the library opens at nine", "the bus leaves at ten"])
+    cache = make_cache(s3_client, tmp_path)
+    store = cache.fetch(publish_store(tmp_path / "store"))
+
+    served = MmrChroma(
+        collection_name="test",
+        embedding_function=DeterministicFakeEmbedding(size=8),
+        persist_directory=str(cache.working_copy(store)),
+    )
+    assert served.similarity_search("library", k=1)
+
+    assert cache.latest_valid().directory == store.directory
+
+
+def test_working_copies_of_exited_processes_are_removed(
+    tmp_path, s3_client, publish_store, write_store
+):
+    write_store(tmp_path / "store", {"chroma.sqlite3": b"sqlite"})
+    cache = make_cache(s3_client, tmp_path)
+    store = cache.fetch(publish_store(tmp_path / "store"))
+    with subprocess.Popen(["true"]) as exited:
+        exited.wait()
+    orphan = tmp_path / "cache" / StoreCache.WORKING_DIRECTORY / f"old.{exited.pid}.x"
+    orphan.mkdir(parents=True)
+
+    copy = cache.working_copy(store)
+
+    assert (copy / "chroma.sqlite3").read_bytes() == b"sqlite"
+    assert not orphan.exists()
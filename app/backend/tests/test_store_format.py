@@ -0,0 +1,46 @@
+from langchain.embeddings import DeterministicFakeEmbedding
+from store_format.archive import StoreArchive
+from store_format.bm25 import BM25_INDEX_DIRECTORY, export_bm25_index
+from store_format.vector_index import VECTOR_INDEX_DIRECTORY, export_vector_index
+
+from document_store.bm25 import BM25Index
+from document_store.chroma_store import MmrChroma
+from document_store.store_cache import StoreCache
+from document_store.vector_index import MmapVectorStore
+
+TEXTS = [
+    "The Liberal Democrats will invest in rural bus services",
+    "Fixing ERR_SSL_PROTOCOL errors on the donation page",
+    "Local councillors campaign to save the village library",
+]
+
+
+def test_store_published_by_the_ingester_is_served_from_the_cache(tmp_path, s3_client):
+    # Written the way VortexIngester.update_store and ingest.py write it
+    embedding = DeterministicFakeEmbedding(size=16)
+    chroma = MmrChroma(
+        collection_name="test",
+        embedding_function=embedding,
+        persist_directory=str(tmp_path / "store"),
+    )
+    chroma.add_texts(
+        TEXTS,
+        metadatas=[{"chunk": i} for i in range(len(TEXTS))],
+        ids=[f"chunk-{i}" for i in range(len(TEXTS))],
+    )
+    chroma.persist()
+    collection = chroma._collection  # pylint: disable=protected-access
+    export_vector_index(collection, tmp_path / "store" / VECTOR_INDEX_DIRECTORY)
+    export_bm25_index(collection, tmp_path / "store" / BM25_INDEX_DIRECTORY)
+    version = StoreArchive(s3_client, "bucket").publish(tmp_path / "store")
+
+    cache = StoreCache(StoreArchive(s3_client, "bucket"), tmp_path / "cache")
+    store = cache.fetch(cache.archive.read_manifest())
+    vector_store = MmapVectorStore(store.directory / VECTOR_INDEX_DIRECTORY, embedding)
+    lexical_index = BM25Index(store.directory / BM25_INDEX_DIRECTORY)
+
+    assert store.version == version
+    assert cache.latest_valid().directory == store.directory
+    found = vector_store.similarity_search(TEXTS[2], k=1)[0]
+    assert (found.page_content, found.metadata) == (TEXTS[2], {"chunk": 2})
+    assert lexical_index.search("ERR_SSL_PROTOCOL", 1)[0][0] == "chunk-1"
@@ -0,0 +1,100 @@
+import asyncio
+import dataclasses
+
+import pytest
+
+from stream_writer import StreamWriter
+
+
+class FakeWebSocket:
+    def __init__(self, send_delay: float = 0, fail: bool = False):
+        self.send_delay = send_delay
+        self.fail = fail
+        self.frames: list[dict] = []
+
+    async def send_json(self, data: dict):
+        if self.fail:
+            raise ConnectionError("client went away")
+        await asyncio.sleep(self.send_delay)
+        self.frames.append(data)
+
+
+def make_writer(mock_settings, websocket, **overrides):
+    settings = dataclasses.replace(
+        mock_settings,
+        **{
+            "stream_max_frame_bytes": 16,
+            "stream_max_delay_ms": 20,
+            "stream_max_buffer_bytes": 64,
+            **overrides,
+        },
+    )
+    return StreamWriter(websocket, settings)
+
+
+async def stream(writer: StreamWriter, tokens, token_delay: float = 0):
+    for token in tokens:
+        await writer.write(token)
+        await asyncio.sleep(token_delay)
+    await writer.flush()
+
+
+def test_tokens_are_coalesced_into_frames(mock_settings):
+    websocket = FakeWebSocket()
+    writer = make_writer(mock_settings, websocket)
+    tokens = ["Hello", " there", ".", " Lighthouse", " is", " the", " portal", "."]
+
+    asyncio.run(stream(writer, tokens, token_delay=0.001))
+
+    assert [frame["message"] for frame in websocket.frames] == [
+        "Hello",
+        " there.",
+        " Lighthouse is the",
+        " portal.",
+    ]
+    assert {frame["type"] for frame in websocket.frames} == {"stream"}
+
+
+def test_frames_are_sent_after_the_maximum_delay(mock_settings):
+    websocket = FakeWebSocket()
+    writer = make_writer(
+        mock_settings, websocket, stream_max_frame_bytes=1000, stream_max_delay_ms=30
+    )
+
+    async def run():
+        await writer.write("first")
+        await asyncio.sleep(0.001)
+        await writer.write(" a")
+        await writer.write(" b")
+        await asyncio.sleep(0.01)
+        assert len(websocket.frames) == 1
+        await asyncio.sleep(0.05)
+        assert websocket.frames[-1]["message"] == " a b"
+        await writer.flush()
+
+    asyncio.run(run())
+
+
+def test_slow_clients_do_not_grow_the_buffer(mock_settings):
+    websocket = FakeWebSocket(send_delay=0.05)
+    writer = make_writer(mock_settings, websocket)
+    largest = 0
+
+    async def run():
+        nonlocal largest
+        for _ in range(100):
+            await writer.write("word ")
+            largest = max(largest, writer.buffered_bytes)
+        await writer.flush()
+
+    asyncio.run(run())
+
+    assert largest < 64 + len("word ")
+    assert "".join(frame["message"] for frame in websocket.frames) == "word " * 100
+
+
+def test_send_errors_reach_the_writer(mock_settings):
+    writer = make_writer(mock_settings, FakeWebSocket(fail=True))
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(stream(writer, ["a", "b", "c"], token_delay=0.01))
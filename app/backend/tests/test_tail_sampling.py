@@ -0,0 +1,94 @@
+import time
+
+from opentelemetry import trace
+
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import (
+    InMemorySpanExporter,
+)
+
+from observability.start_opentelemetry import make_tracer_provider
+from observability.tail_sampling import TailSamplingSpanProcessor
+
+
+def make_tracer(ratio=0.0, slow_seconds=60.0, max_traces=100):
+    exporter = InMemorySpanExporter()
+    processor = TailSamplingSpanProcessor(
+        SimpleSpanProcessor(exporter), ratio, slow_seconds, max_traces
+    )
+    provider = TracerProvider()
+    provider.add_span_processor(processor)
+    return provider.get_tracer("test"), exporter, processor
+
+
+def test_unremarkable_traces_are_dropped():
+    tracer, exporter, processor = make_tracer()
+
+    with tracer.start_as_current_span("request"):
+        with tracer.start_as_current_span("retrieve"):
+            pass
+
+    assert not exporter.get_finished_spans()
+    assert processor.dropped == 2
+    assert not processor.traces
+
+
+def test_traces_with_errors_are_kept_whole():
+    tracer, exporter, _ = make_tracer()
+
+    with tracer.start_as_current_span("request"):
+        with tracer.start_as_current_span("retrieve") as span:
+            span.record_exception(ValueError("no documents"))
+        with tracer.start_as_current_span("answer"):
+            pass
+
+    assert {span.name for span in exporter.get_finished_spans()} == {
+        "request",
+        "retrieve",
+        "answer",
+    }
+
+
+def test_slow_traces_are_kept():
+    tracer, exporter, _ = make_tracer(slow_seconds=0.01)
+
+    with tracer.start_as_current_span("fast"):
+        pass
+    with tracer.start_as_current_span("slow"):
+        time.sleep(0.02)
+
+    assert [span.name for span in exporter.get_finished_spans()] == ["slow"]
+
+
+def test_ratio_keeps_a_share_of_traces():
+    tracer, exporter, _ = make_tracer(ratio=0.25)
+
+    for _ in range(2000):
+        with tracer.start_as_current_span("request"):
+            pass
+
+    assert 400 < len(exporter.get_finished_spans()) < 600
+
+
+def test_unfinished_traces_are_bounded():
+    tracer, _, processor = make_tracer(max_traces=10)
+
+    for _ in range(50):
+        # The root span never ends so its trace is never decided
+        root = tracer.start_span("websocket")
+        with tracer.start_as_current_span("question", trace.set_span_in_context(root)):
+            pass
+
+    assert len(processor.traces) == 10
+    assert processor.dropped == 40
+
+
+def test_profiles(mock_settings):
+    exporter = InMemorySpanExporter()
+    for profile, recorded in (("full", True), ("ratio", False), ("off", False)):
+        mock_settings.telemetry_profile = profile
+        mock_settings.trace_sample_ratio = 0.0
+        tracer = make_tracer_provider(mock_settings, exporter).get_tracer("test")
+        with tracer.start_as_current_span("request") as span:
+            assert span.is_recording() == recorded
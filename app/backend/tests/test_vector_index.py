@@ -0,0 +1,77 @@
+import uuid
+
+import numpy as np
+from langchain.embeddings import DeterministicFakeEmbedding
+from langchain.vectorstores.chroma import Chroma
+from store_format.vector_index import export_vector_index
+
+from document_store.vector_index import MmapVectorStore
+from query.llm_chain_factory import LLMChainFactory
+
+
+def export(vector_store, tmp_path, dtype="float32"):
+    directory = tmp_path / "vector_index"
+    # pylint: disable-next=protected-access
+    export_vector_index(vector_store._collection, directory, dtype, page_size=3)
+    return MmapVectorStore(directory, vector_store.embeddings)
+
+
+def test_search_ranks_by_cosine_similarity(tmp_path, make_chroma):
+    texts = [f"document {i}" for i in range(10)]
+    chroma = make_chroma(texts)
+    mmap_store = export(chroma, tmp_path)
+    vectors = np.array(chroma.embeddings.embed_documents(texts))
+    query = vectors[3]
+    similarity = vectors @ query / np.linalg.norm(vectors, axis=1)
+
+    found = mmap_store.similarity_search("document 3", k=3)
+
+    assert [doc.page_content for doc in found] == [
+        texts[i] for i in np.argsort(-similarity)[:3]
+    ]
+    assert found[0].metadata == {"chunk": 3}
+
+
+def test_mmr_returns_distinct_documents(tmp_path, make_chroma):
+    mmap_store = export(make_chroma([f"document {i}" for i in range(10)]), tmp_path)
+
+    found = mmap_store.max_marginal_relevance_search(
+        "document 3", k=4, fetch_k=8, lambda_mult=0.5
+    )
+
+    assert found[0].page_content == "document 3"
+    assert len({doc.page_content for doc in found}) == 4
+
+
+def test_half_precision_index_keeps_the_nearest_document(tmp_path, make_chroma):
+    mmap_store = export(
+        make_chroma([f"document {i}" for i in range(10)]), tmp_path, "float16"
+    )
+
+    assert mmap_store.similarity_search("document 7", k=1)[0].page_content == (
+        "document 7"
+    )
+
+
+def test_empty_collection(tmp_path, make_chroma):
+    mmap_store = export(make_chroma([]), tmp_path)
+
+    assert len(mmap_store) == 0
+    assert mmap_store.max_marginal_relevance_search("anything") == []
+
+
+def test_preloaded_index_is_shared_with_each_workers_embeddings(
+    tmp_path, mock_settings, make_chroma
+):
+    texts = [f"document {i}" for i in range(10)]
+    chroma = make_chroma(texts)
+    export(chroma, tmp_path)
+    mock_settings.vector_store_mode = "mmap"
+
+    preloaded = LLMChainFactory.preload_vector_index(mock_settings, tmp_path)
+    store = preloaded.with_embedding(chroma.embeddings)
+
+    assert preloaded.embedding is None
+    assert store.vectors is preloaded.vectors
+    assert store.ids is preloaded.ids
+    assert store.similarity_search("document 3", k=1)[0].page_content == texts[3]
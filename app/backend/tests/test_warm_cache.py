@@ -0,0 +1,134 @@
+from langchain.embeddings import DeterministicFakeEmbedding
+from langchain.schema import Document
+
+from benchmarks.fakes import make_table, seed_question_history
+from build_warm_cache import cluster_questions, coverage_report, scan_questions
+from query.semantic_cache import SemanticCache
+from query.warm_cache import WarmAnswer, WarmCache
+from settings.chat_bot_settings import ChatbotSettings
+
+
+def warm_cache(store_version: str = "v1") -> WarmCache:
+    return WarmCache(
+        store_version,
+        "test",
+        [
+            WarmAnswer(
+                "How do I join?",
+                ["how do I join", "HOW DO I JOIN?!"],
+                10,
+                [1.0, 0.0, 0.0],
+                "Online.",
+                [Document(page_content="Join online", metadata={"source": "s"})],
+            )
+        ],
+        {"first_question_coverage": 0.5},
+    )
+
+
+def test_pinned_answers_are_found_by_any_variant(mock_settings: ChatbotSettings):
+    cache = SemanticCache(mock_settings)
+    cache.set_store_version("v1")
+
+    assert warm_cache().pin_into(cache) == 1
+
+    assert cache.lookup_question("How do I join").answer == "Online."
+    assert cache.lookup_question("how do i JOIN") is not None
+    assert cache.lookup_question("How do I leave?") is None
+    assert cache.lookup([0.99, 0.01, 0.0]).answer == "Online."
+
+
+def test_pinned_answers_do_not_expire_or_get_evicted(
+    mock_settings: ChatbotSettings, clock
+):
+    mock_settings.semantic_cache_size = 2
+    cache = SemanticCache(mock_settings, clock)
+    cache.set_store_version("v1")
+    warm_cache().pin_into(cache)
+
+    cache.add("second", [0.0, 1.0, 0.0], "2", [])
+    cache.add("third", [0.0, 0.0, 1.0], "3", [])
+    clock.now = mock_settings.semantic_cache_ttl + 1
+
+    assert cache.lookup([1.0, 0.0, 0.0]).answer == "Online."
+    assert cache.lookup([0.0, 0.0, 1.0]) is None
+    assert len(cache) == 1
+
+
+def test_warm_cache_from_another_document_store_is_ignored(
+    mock_settings: ChatbotSettings,
+):
+    cache = SemanticCache(mock_settings)
+    cache.set_store_version("v2")
+
+    assert warm_cache("v1").pin_into(cache) == 0
+    assert len(cache) == 0
+
+
+def test_warm_cache_round_trips(tmp_path):
+    path = tmp_path / "warm.json"
+    warm_cache().save(path)
+
+    loaded = WarmCache.load(path)
+
+    assert loaded == warm_cache()
+
+
+def test_frequent_questions_are_clustered_with_their_variants(
+    mock_settings: ChatbotSettings,
+):
+    questions = ["How do I join?"] * 3 + ["how do i join"] + ["What is Fleet?"]
+
+    clusters = cluster_questions(
+        questions,
+        DeterministicFakeEmbedding(size=8),
+        mock_settings.semantic_cache_threshold,
+    )
+
+    assert [cluster.question for cluster in clusters] == [
+        "How do I join?",
+        "What is Fleet?",
+    ]
+    assert clusters[0].variants == ["how do i join"]
+    assert clusters[0].count == 4
+
+
+def test_no_questions_make_an_empty_report(mock_settings: ChatbotSettings):
+    first_questions, questions = scan_questions(lambda: make_table("empty"), 2)
+    clusters = cluster_questions(
+        first_questions,
+        DeterministicFakeEmbedding(size=8),
+        mock_settings.semantic_cache_threshold,
+    )
+
+    assert clusters == []
+    assert coverage_report(clusters, 5, len(first_questions), questions) == {
+        "questions": 0,
+        "first_questions": 0,
+        "distinct_first_questions": 0,
+        "clusters": 0,
+        "cached_clusters": 0,
+        "first_question_coverage": 0,
+        "traffic_coverage": 0,
+    }
+
+
+def test_coverage_is_reported_from_a_parallel_scan(mock_settings: ChatbotSettings):
+    table = make_table("messages")
+    seed_question_history(table, 200)
+
+    first_questions, questions = scan_questions(lambda: table, 4)
+    clusters = cluster_questions(
+        first_questions,
+        DeterministicFakeEmbedding(size=8),
+        mock_settings.semantic_cache_threshold,
+    )
+    report = coverage_report(clusters, 5, len(first_questions), questions)
+
+    assert len(first_questions) == 200
+    assert questions >= 200
+    assert report["cached_clusters"] == 5
+    assert report["first_question_coverage"] == (
+        sum(cluster.count for cluster in clusters[:5]) / 200
+    )
+    assert 0 < report["traffic_coverage"] < report["first_question_coverage"] <= 1
@@ -8,6 +8,8 @@ import {
   StreamMessage,
   EndMessage,
   ErrorMessage,
+  QueuedMessage,
+  SessionMessage,
 } from "./types";
 
 type ChatProps = {
@@ -28,6 +30,19 @@ const websocket_error_message = {
 
 const websocket_timeout_ms = 10 * 1000;
 
+// One socket carries every question of a conversation, the server remembers the
+// conversation and the token lets a new socket carry on without another captcha
+type ChatSession = {
+  socket: WebSocket | null;
+  token: string | null;
+};
+
+const chatSession: ChatSession = { socket: null, token: null };
+
+function sessionOpen() {
+  return chatSession.socket?.readyState === WebSocket.OPEN;
+}
+
 function Chat({ userId, localPartyDetails }: ChatProps) {
   const [text, setText] = useState("");
   const [pastMessages, setMessages] = useState<MessageData[]>([]);
@@ -91,6 +106,19 @@ function doCaptchaThenSendChatMessage(
   setText: React.Dispatch<React.SetStateAction<string>>
 ) {
   event.preventDefault();
+  if (sessionOpen()) {
+    sendChatMessage(
+      text,
+      pastMessages,
+      userId,
+      null,
+      localPartyDetails,
+      setMessages,
+      setInFlight,
+      setText
+    );
+    return;
+  }
   window.grecaptcha.ready(() => {
     window.grecaptcha
       .execute("6LftMhQoAAAAAPhghGEe6eUxV4QhUnaG4Vyxg5mf", { action: "submit" })
@@ -141,11 +169,21 @@ function sendChatMessage(
   ];
   setMessages(messages);
 
-  var chatRequest = {
-    messages: messages,
-    captcha: token,
-    local_party_details: localPartyDetails,
-  };
+  // A new socket starts or resumes the session with the whole conversation,
+  // after that only the new question is sent
+  const reuseSocket = sessionOpen();
+  var chatRequest = reuseSocket
+    ? {
+        messages: messages.slice(-1),
+        local_party_details: localPartyDetails,
+      }
+    : {
+        session: true,
+        sessionToken: chatSession.token,
+        messages: messages,
+        captcha: token,
+        local_party_details: localPartyDetails,
+      };
 
   function get_watchdog_timer() {
     return window.setTimeout(function () {
@@ -160,16 +198,31 @@ function sendChatMessage(
 
   var watchdog = get_watchdog_timer();
 
-  const chatSocket = new WebSocket(`wss://${document.location.host}/chat`);
-  chatSocket.onopen = (event) => {
+  const chatSocket = reuseSocket
+    ? (chatSession.socket as WebSocket)
+    : new WebSocket(`wss://${document.location.host}/chat`);
+  chatSession.socket = chatSocket;
+  if (reuseSocket) {
     chatSocket.send(JSON.stringify(chatRequest));
-  };
+  } else {
+    chatSocket.onopen = (event) => {
+      chatSocket.send(JSON.stringify(chatRequest));
+    };
+  }
+
+  function finish_question() {
+    window.clearTimeout(watchdog);
+    setInFlight(false);
+  }
 
   chatSocket.onmessage = (event) => {
     window.clearTimeout(watchdog);
     watchdog = get_watchdog_timer();
     const message: BaseMessage = JSON.parse(event.data);
     switch (message.type) {
+      case "session":
+        chatSession.token = (message as SessionMessage).sessionToken;
+        break;
       case "start":
         messages = process_start_message(
           message as StartMessage,
@@ -182,9 +235,18 @@ function sendChatMessage(
         break;
       case "end":
         process_end_message(message as EndMessage, setMessages, messages);
+        finish_question();
         break;
       case "error":
         process_error_message(message as ErrorMessage, setMessages, messages);
+        finish_question();
+        break;
+      case "queued":
+        messages = process_queued_message(
+          message as QueuedMessage,
+          setMessages,
+          messages
+        );
         break;
       default:
         console.log("default");
@@ -192,8 +254,10 @@ function sendChatMessage(
     }
   };
   chatSocket.onclose = (event) => {
-    window.clearTimeout(watchdog);
-    setInFlight(false);
+    if (chatSession.socket === chatSocket) {
+      chatSession.socket = null;
+    }
+    finish_question();
   };
   chatSocket.onerror = (event) => {
     window.clearTimeout(watchdog);
@@ -206,13 +270,40 @@ function sendChatMessage(
   };
 }
 
+function without_queued_message(pastMessages: MessageData[]) {
+  return pastMessages.filter((message) => message.type !== "queued");
+}
+
+function process_queued_message(
+  message: QueuedMessage,
+  setMessages: React.Dispatch<React.SetStateAction<MessageData[]>>,
+  pastMessages: MessageData[]
+) {
+  const messages: MessageData[] = [
+    ...without_queued_message(pastMessages),
+    {
+      type: "queued",
+      time: Date.now(),
+      messageId: "queued",
+      previousMessageId: "null",
+      content:
+        message.position === 1
+          ? "Lots of people are asking me questions, yours is next."
+          : `Lots of people are asking me questions, yours is number ${message.position} in the queue.`,
+      sources: {},
+    },
+  ];
+  setMessages(messages);
+  return messages;
+}
+
 function process_start_message(
   message: StartMessage,
   setMessages: React.Dispatch<React.SetStateAction<MessageData[]>>,
   pastMessages: MessageData[]
 ) {
   const messages: MessageData[] = [
-    ...pastMessages,
+    ...without_queued_message(pastMessages),
     {
       type: "ai",
       time: message.time,
@@ -261,7 +352,7 @@ function process_error_message(
   setMessages: React.Dispatch<React.SetStateAction<MessageData[]>>,
   pastMessages: MessageData[]
 ) {
-  var messages: MessageData[] = [...pastMessages];
+  var messages: MessageData[] = without_queued_message(pastMessages);
   var final_message = messages[messages.length - 1];
   final_message.content = message.message;
   setMessages(messages);
@@ -14,7 +14,7 @@ type MessageData = {
 
 interface BaseMessage {
   sender: string;
-  type: "start" | "end" | "error" | "stream";
+  type: "start" | "end" | "error" | "stream" | "queued" | "session";
 }
 
 interface StartMessage extends BaseMessage {
@@ -42,6 +42,16 @@ interface StreamMessage extends BaseMessage {
   type: "stream";
 }
 
+interface QueuedMessage extends BaseMessage {
+  position: number;
+  type: "queued";
+}
+
+interface SessionMessage extends BaseMessage {
+  sessionToken: string;
+  type: "session";
+}
+
 type SourceSet = Record<string, SourceData>;
 
 type SourceData = {
@@ -61,6 +71,8 @@ export {
   EndMessage,
   ErrorMessage,
   StreamMessage,
+  QueuedMessage,
+  SessionMessage,
   SourceSet,
   ChatRequest,
 };
@@ -0,0 +1,144 @@
+"""
+Benchmark document parsing over a synthetic corpus of generated PDFs and JSON
+items, comparing a single process with a pool of worker processes.
+
+    python benchmarks/parse_benchmark.py --pdfs 200 --json 2000 --processes 1 4
+"""
+import argparse
+import json
+import random
+import resource
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / "ingester"))
+
+# pylint: disable-next=wrong-import-position
+from parallel_parser import ParallelParser
+
+WORDS = (
+    "liberal democrats policy health education climate housing europe local "
+    "community fair tax water sewage nhs care energy rail transport schools"
+).split()
+
+
+def sentence(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def make_pdf(path: Path, rng: random.Random, pages: int, lines_per_page: int):
+    """Write a minimal valid PDF with one Helvetica text stream per page."""
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+        b"<< /Title (Synthetic policy paper) /Author (Benchmark) >>",
+    ]
+    page_numbers = []
+    for _ in range(pages):
+        lines = [
+            f"({sentence(rng, 10)}) Tj 0 -14 Td".encode("latin-1")
+            for _ in range(lines_per_page)
+        ]
+        stream = b"BT /F1 11 Tf 50 780 Td " + b" ".join(lines) + b" ET"
+        objects.append(
+            b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream)
+        )
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % len(objects)
+        )
+        page_numbers.append(len(objects))
+    kids = b" ".join(b"%d 0 R" % number for number in page_numbers)
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, pages)
+
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(output)
+    output += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    output += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    output += b"trailer\n<< /Size %d /Root 1 0 R /Info 4 0 R >>\n" % (len(objects) + 1)
+    output += b"startxref\n%d\n%%%%EOF\n" % xref
+    path.write_bytes(bytes(output))
+
+
+def make_corpus(folder: Path, pdfs: int, json_items: int, pages: int) -> list[Path]:
+    rng = random.Random(0)
+    documents = []
+    for i in range(pdfs):
+        make_pdf(folder / f"paper-{i}.pdf", rng, pages, 40)
+        document = folder / f"paper-{i}.json"
+        document.write_text(
+            json.dumps(
+                {
+                    "metadata": {
+                        "type": "pdf",
+                        "path": f"paper-{i}.pdf",
+                        "name": f"paper {i}",
+                        "date": "2023-10-01",
+                    }
+                }
+            )
+        )
+        documents.append(document)
+    for i in range(json_items):
+        document = folder / f"news-{i}.json"
+        document.write_text(
+            json.dumps(
+                {
+                    "metadata": {"type": "json", "name": f"news {i}", "date": "2023"},
+                    "content": "\n".join(sentence(rng, 15) for _ in range(30)),
+                }
+            )
+        )
+        documents.append(document)
+    return sorted(documents)
+
+
+def run(documents: list[Path], folder: Path, processes: int, split: bool):
+    parser = ParallelParser(
+        {"chunk_size": 250, "chunk_overlap": 25, "split_document_text": split},
+        processes,
+    )
+    start = time.perf_counter()
+    chunks = failures = 0
+    for result in parser.parse(documents, str(folder)):
+        chunks += len(result.chunks)
+        failures += result.error is not None
+    elapsed = time.perf_counter() - start
+    print(
+        f"processes={processes:<3} documents={len(documents)} chunks={chunks} "
+        f"failures={failures} seconds={elapsed:.2f} "
+        f"documents/s={len(documents) / elapsed:.1f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pdfs", type=int, default=100)
+    parser.add_argument("--json", type=int, default=1000)
+    parser.add_argument("--pages", type=int, default=5)
+    parser.add_argument("--processes", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--split", action="store_true")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        folder = Path(directory)
+        documents = make_corpus(folder, args.pdfs, args.json, args.pages)
+        for processes in args.processes:
+            run(documents, folder, processes, args.split)
+
+    self_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    print(
+        f"peak rss parent={self_rss / 1024:.0f} MiB worker={children_rss / 1024:.0f} MiB"
+    )
+
+
+if __name__ == "__main__":
+    main()
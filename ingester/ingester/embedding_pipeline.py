@@ -0,0 +1,202 @@
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+import json
+import os
+from pathlib import Path
+import random
+import time
+from typing import Callable, Dict, Iterable, List, Tuple
+import langchain.docstore.document as docstore
+from langchain.schema.embeddings import Embeddings
+import logging as logger
+
+Chunk = Tuple[docstore.Document, str]
+
+
+@dataclass
+class EmbeddingStats:
+    embedded_chunks: int = 0
+    restored_chunks: int = 0
+    failed_chunks: int = 0
+    requests: int = 0
+    retries: int = 0
+    embed_seconds: float = 0.0
+
+
+class EmbeddingCheckpoint:
+    """
+    Append only log of embedded batches. A run that crashes part way through can
+    reload the vectors it had already paid for rather than requesting them again.
+    """
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+
+    def load(self) -> Dict[str, List[float]]:
+        vectors = {}
+        if not self.path.exists():
+            return vectors
+        with open(self.path, "r") as checkpoint_file:
+            for line in checkpoint_file:
+                try:
+                    batch = json.loads(line)
+                except json.JSONDecodeError:
+                    # The last line is cut short if the run died while writing it
+                    break
+                vectors.update(zip(batch["ids"], batch["vectors"]))
+        return vectors
+
+    def append(self, ids: List[str], vectors: List[List[float]]):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "a") as checkpoint_file:
+            checkpoint_file.write(json.dumps({"ids": ids, "vectors": vectors}) + "\n")
+            checkpoint_file.flush()
+            os.fsync(checkpoint_file.fileno())
+
+    def remove(self):
+        self.path.unlink(missing_ok=True)
+
+
+class EmbeddingPipeline:  # pylint: disable=too-many-instance-attributes
+    """
+    Embeds chunks in batches of at most `max_batch_tokens` tokens, with up to
+    `concurrency` requests in flight. Failed requests are retried with jittered
+    exponential backoff and batches that still fail are logged and counted rather
+    than ending the run. Every completed batch is checkpointed and handed to
+    `write` as soon as it arrives.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        embeddings: Embeddings,
+        write: Callable[[List[Chunk], List[List[float]]], None],
+        *,
+        checkpoint_file: str | None = None,
+        max_batch_tokens=8000,
+        max_batch_size=1000,
+        concurrency=4,
+        max_attempts=6,
+        backoff_seconds=1.0,
+        max_backoff_seconds=60.0,
+        count_tokens: Callable[[str], int] | None = None,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.embeddings = embeddings
+        self.write = write
+        self.checkpoint = (
+            EmbeddingCheckpoint(checkpoint_file) if checkpoint_file else None
+        )
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_size = max_batch_size
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.count_tokens = count_tokens or self.estimate_tokens
+        self.sleep = sleep
+
+        self.stats = EmbeddingStats()
+        self.checkpointed = self.checkpoint.load() if self.checkpoint else {}
+        self.batch: List[Chunk] = []
+        self.batch_tokens = 0
+        self.pending: Dict[Future, List[Chunk]] = {}
+        self.executor = ThreadPoolExecutor(concurrency)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            # Checkpoint the requests already in flight and keep the checkpoint so
+            # the next run can resume from it
+            self._collect(until=0)
+            self.executor.shutdown()
+
+    @staticmethod
+    def estimate_tokens(text: str) -> int:
+        return len(text) // 4 + 1
+
+    def add(self, chunks: Iterable[Chunk]):
+        restored = []
+        for chunk, chunk_id in chunks:
+            if chunk_id in self.checkpointed:
+                restored.append((chunk, chunk_id))
+                continue
+            tokens = self.count_tokens(chunk.page_content)
+            if self.batch and (
+                self.batch_tokens + tokens > self.max_batch_tokens
+                or len(self.batch) >= self.max_batch_size
+            ):
+                self._submit()
+            self.batch.append((chunk, chunk_id))
+            self.batch_tokens += tokens
+
+        if restored:
+            self.write(
+                restored, [self.checkpointed[chunk_id] for _, chunk_id in restored]
+            )
+            self.stats.restored_chunks += len(restored)
+
+    def close(self) -> EmbeddingStats:
+        """Embed what is left, wait for every request and remove the checkpoint."""
+        if self.batch:
+            self._submit()
+        self._collect(until=0)
+        self.executor.shutdown()
+        if self.checkpoint is not None and not self.stats.failed_chunks:
+            self.checkpoint.remove()
+        return self.stats
+
+    def _submit(self):
+        self._collect(until=self.concurrency - 1)
+        batch = self.batch
+        self.batch, self.batch_tokens = [], 0
+        future = self.executor.submit(
+            self._embed, [chunk.page_content for chunk, _ in batch]
+        )
+        self.pending[future] = batch
+
+    def _collect(self, until: int):
+        """Write finished batches until no more than `until` requests are in flight."""
+        while len(self.pending) > until:
+            done, _ = wait(self.pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                self._finish(self.pending.pop(future), future)
+
+    def _finish(self, batch: List[Chunk], future: Future):
+        error = future.exception()
+        if error is not None:
+            logger.error(f"failed to embed {len(batch)} chunks because {error}")
+            self.stats.failed_chunks += len(batch)
+            self.stats.requests += self.max_attempts
+            self.stats.retries += self.max_attempts - 1
+            return
+        vectors, seconds, attempts = future.result()
+        ids = [chunk_id for _, chunk_id in batch]
+        if self.checkpoint is not None:
+            self.checkpoint.append(ids, vectors)
+        self.write(batch, vectors)
+        self.stats.embedded_chunks += len(batch)
+        self.stats.embed_seconds += seconds
+        self.stats.requests += attempts
+        self.stats.retries += attempts - 1
+
+    def _embed(self, texts: List[str]) -> Tuple[List[List[float]], float, int]:
+        """Runs on a worker thread, returning the vectors, seconds taken and attempts."""
+        for attempt in range(self.max_attempts - 1):
+            start = time.perf_counter()
+            try:
+                vectors = self.embeddings.embed_documents(texts)
+                return vectors, time.perf_counter() - start, attempt + 1
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                delay = min(
+                    self.max_backoff_seconds, self.backoff_seconds * 2**attempt
+                )
+                logger.warning(f"embedding request failed because {e}, retrying")
+                self.sleep(random.uniform(0, delay))
+        # The last attempt's error is raised for the batch to be counted as failed
+        start = time.perf_counter()
+        vectors = self.embeddings.embed_documents(texts)
+        return vectors, time.perf_counter() - start, self.max_attempts
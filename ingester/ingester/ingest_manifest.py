@@ -0,0 +1,106 @@
+from dataclasses import asdict, dataclass, field
+from hashlib import sha256
+import json
+import os
+from pathlib import Path
+from typing import Dict, List
+
+
+@dataclass
+class SourceFile:
+    """Fingerprint of a file read while parsing a document."""
+
+    path: str
+    mtime_ns: int
+    size: int
+    sha: str
+
+    @classmethod
+    def from_path(cls, path: str):
+        stat = os.stat(path)
+        return cls(path, stat.st_mtime_ns, stat.st_size, cls.hash_file(path))
+
+    @staticmethod
+    def hash_file(path: str) -> str:
+        digest = sha256()
+        with open(path, "rb") as file:
+            for block in iter(lambda: file.read(1 << 20), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def is_unchanged(self) -> bool:
+        """Compare size and mtime first, only hashing the file if they differ."""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        if stat.st_size != self.size:
+            return False
+        if stat.st_mtime_ns == self.mtime_ns:
+            return True
+        return self.hash_file(self.path) == self.sha
+
+
+@dataclass
+class DocumentRecord:
+    """The files a document was built from and the ids of the chunks it produced."""
+
+    sources: List[SourceFile]
+    chunk_ids: List[str]
+    parse_seconds: float
+
+    def is_unchanged(self) -> bool:
+        return all(source.is_unchanged() for source in self.sources)
+
+
+@dataclass
+class IngestManifest:
+    """Records what was ingested on the last run so unchanged documents can be skipped."""
+
+    documents: Dict[str, DocumentRecord] = field(default_factory=dict)
+    embed_seconds_per_chunk: float = 0.0
+
+    @classmethod
+    def load(cls, path: str):
+        if not Path(path).exists():
+            return cls()
+        with open(path, "r") as manifest_file:
+            data = json.load(manifest_file)
+        return cls(
+            documents={
+                name: DocumentRecord(
+                    sources=[SourceFile(**source) for source in record["sources"]],
+                    chunk_ids=record["chunk_ids"],
+                    parse_seconds=record["parse_seconds"],
+                )
+                for name, record in data["documents"].items()
+            },
+            embed_seconds_per_chunk=data["embed_seconds_per_chunk"],
+        )
+
+    def chunk_ids(self) -> set:
+        """The ids of every chunk the documents in the manifest produced."""
+        return {
+            chunk_id
+            for record in self.documents.values()
+            for chunk_id in record.chunk_ids
+        }
+
+    def save(self, path: str):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        temporary_path = f"{path}.tmp"
+        with open(temporary_path, "w") as manifest_file:
+            json.dump(asdict(self), manifest_file)
+        os.replace(temporary_path, path)
+
+    def unchanged_record(self, document: str, stored_ids: set) -> DocumentRecord | None:
+        """
+        Return the record for a document if it can be skipped, that is none of its
+        source files have changed and all of its chunks are still in the store.
+        """
+        record = self.documents.get(document)
+        if record is None or not record.is_unchanged():
+            return None
+        if not stored_ids.issuperset(record.chunk_ids):
+            return None
+        return record
@@ -0,0 +1,139 @@
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+import os
+from pathlib import Path
+import time
+from typing import Iterable, Iterator, List
+import langchain.docstore.document as docstore
+import logging as logger
+from parsers.json import JsonParser
+
+
+@dataclass
+class ParseResult:
+    """The chunks parsed from a document, or the reason parsing it failed."""
+
+    document: Path
+    chunks: List[docstore.Document] = field(default_factory=list)
+    sources: List[str] = field(default_factory=list)
+    parse_seconds: float = 0.0
+    error: str | None = None
+
+
+_worker_parser: JsonParser | None = None
+
+
+def _start_worker(parser_kwargs: dict):
+    global _worker_parser  # pylint: disable=global-statement
+    _worker_parser = JsonParser(**parser_kwargs)
+
+
+def _parse_document(document: Path, content_folder: str) -> ParseResult:
+    start = time.perf_counter()
+    try:
+        chunks = _worker_parser.text_to_docs(document, content_folder)
+        sources = _worker_parser.source_files(document, content_folder)
+    except Exception as e:  # pylint: disable=broad-exception-caught
+        return ParseResult(document, error=str(e))
+    return ParseResult(document, chunks, sources, time.perf_counter() - start)
+
+
+class ParallelParser:
+    """
+    Parses documents across a pool of processes. Results are yielded in the same
+    order as the documents and at most max_in_flight documents are being parsed or
+    waiting to be consumed at once, so memory stays bounded however many documents
+    there are. A document that fails, even by killing its worker, is yielded with
+    the error rather than ending the run.
+    """
+
+    def __init__(
+        self,
+        parser_kwargs: dict,
+        processes: int | None = None,
+        max_in_flight: int | None = None,
+    ):
+        self.parser_kwargs = parser_kwargs
+        self.processes = processes or os.cpu_count() or 1
+        self.max_in_flight = max_in_flight or self.processes * 4
+
+    def parse(
+        self, documents: Iterable[Path], content_folder: str
+    ) -> Iterator[ParseResult]:
+        if self.processes == 1:
+            _start_worker(self.parser_kwargs)
+            for document in documents:
+                yield _parse_document(document, content_folder)
+            return
+
+        pool = self._start_pool(self.processes)
+        pending: deque[tuple[Path, Future]] = deque()
+        try:
+            for document in documents:
+                pending.append((document, self._submit(pool, document, content_folder)))
+                if len(pending) >= self.max_in_flight:
+                    result, pool = self._next_result(pending, pool, content_folder)
+                    yield result
+            while pending:
+                result, pool = self._next_result(pending, pool, content_folder)
+                yield result
+        finally:
+            pool.shutdown(cancel_futures=True)
+
+    def _start_pool(self, processes: int) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(
+            processes,
+            initializer=_start_worker,
+            initargs=(self.parser_kwargs,),
+        )
+
+    @staticmethod
+    def _submit(
+        pool: ProcessPoolExecutor, document: Path, content_folder: str
+    ) -> Future:
+        try:
+            return pool.submit(_parse_document, document, content_folder)
+        except BrokenProcessPool as e:
+            # Fail it like the documents already in the pool so it is retried
+            future = Future()
+            future.set_exception(e)
+            return future
+
+    def _next_result(
+        self,
+        pending: deque[tuple[Path, Future]],
+        pool: ProcessPoolExecutor,
+        content_folder: str,
+    ) -> tuple[ParseResult, ProcessPoolExecutor]:
+        """
+        The result for the oldest document and the pool to carry on with. When a
+        worker dies every document in the pool fails with it, without saying which
+        one killed it, so the oldest is parsed again on its own and the rest are
+        resubmitted to a new pool.
+        """
+        document, future = pending.popleft()
+        try:
+            return future.result(), pool
+        except BrokenProcessPool:
+            logger.warning(f"A parser process died, parsing {document} on its own")
+            pool.shutdown(cancel_futures=True)
+            result = self._parse_alone(document, content_folder)
+            pool = self._start_pool(self.processes)
+            waiting = [waiting_document for waiting_document, _ in pending]
+            pending.clear()
+            pending.extend(
+                (waiting_document, self._submit(pool, waiting_document, content_folder))
+                for waiting_document in waiting
+            )
+            return result, pool
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            return ParseResult(document, error=str(e)), pool
+
+    def _parse_alone(self, document: Path, content_folder: str) -> ParseResult:
+        with self._start_pool(1) as pool:
+            try:
+                return pool.submit(_parse_document, document, content_folder).result()
+            except BrokenProcessPool as e:
+                return ParseResult(document, error=f"the parser process died: {e}")
@@ -26,6 +26,14 @@ class JsonParser(BaseParser):
             case "json":
                 return self.load_pure_json(data, metadata)
 
+    def source_files(self, file: str, path_root="./") -> List[str]:
+        """The files a document is built from, the JSON file and any PDF it points to."""
+        with open(file, "r") as doc:
+            metadata = json.load(doc).get("metadata")
+        if metadata.get("type") == "pdf":
+            return [str(file), path.join(path_root, metadata.get("path"))]
+        return [str(file)]
+
     def load_pure_json(self, data: dict, metadata: dict):
         text = self.clean_text([data.get("content")])
         return self._docs_builder(text, data.get("metadata"))
@@ -4,9 +4,6 @@ from parsers.base import BaseParser
 import langchain.docstore.document as docstore
 import pdfplumber
 import logging as logger
-from pypdf import PdfReader
-
-from utils import getattr_or_default
 
 
 class PdfParser(BaseParser):
@@ -29,27 +26,32 @@ class PdfParser(BaseParser):
         return self._docs_builder(cleaned_text_pdf, combined_metadata)
 
     def parse_pdf(self, pdf_file_path: Path) -> Tuple[list[str], Dict[str, str]]:
-        """Extract and return the pages and metadata from the PDF."""
-        metadata = self.extract_metadata_from_pdf(pdf_file_path)
-        pages = self.extract_pages_from_pdf(pdf_file_path)
+        """Extract and return the pages and metadata from the PDF, opening it once."""
+        with pdfplumber.open(pdf_file_path) as pdf:
+            metadata = self.extract_metadata_from_pdf(pdf)
+            pages = self.extract_pages_from_pdf(pdf)
         return pages, metadata
 
-    def extract_metadata_from_pdf(self, pdf_file_path: Path) -> Dict[str, str]:
+    def extract_metadata_from_pdf(self, pdf: pdfplumber.PDF) -> Dict[str, str]:
         """Extract and return the metadata from the PDF."""
         logger.debug("Extracting metadata")
-        with open(pdf_file_path, "rb") as pdf_file:
-            reader = PdfReader(pdf_file)
-            metadata = reader.metadata
-            logger.debug(f"{getattr(metadata, 'title', 'no title')}")
-            return {
-                "title": getattr_or_default(metadata, "title", "").strip(),
-                "author": getattr_or_default(metadata, "author", "").strip(),
-            }
-
-    def extract_pages_from_pdf(self, pdf_file_path) -> list[str]:
+        metadata = pdf.metadata
+        logger.debug(f"{metadata.get('Title', 'no title')}")
+        return {
+            "title": self.metadata_text(metadata, "Title"),
+            "author": self.metadata_text(metadata, "Author"),
+        }
+
+    @staticmethod
+    def metadata_text(metadata: Dict, key: str) -> str:
+        value = metadata.get(key)
+        if isinstance(value, bytes):
+            value = value.decode("utf-8", errors="ignore")
+        return str(value).strip() if value is not None else ""
+
+    def extract_pages_from_pdf(self, pdf: pdfplumber.PDF) -> list[str]:
         """Extract and return the text of each page from the PDF."""
         logger.debug("Extracting pages")
-        with pdfplumber.open(pdf_file_path) as pdf:
-            all_pages = map(lambda page: page.extract_text(), pdf.pages)
-            non_whitespace_pages = filter(lambda page: page.strip(), all_pages)
-            return list(non_whitespace_pages)
+        all_pages = map(lambda page: page.extract_text(), pdf.pages)
+        non_whitespace_pages = filter(lambda page: page.strip(), all_pages)
+        return list(non_whitespace_pages)
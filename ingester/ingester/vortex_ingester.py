@@ -1,72 +1,278 @@
+from dataclasses import dataclass
+from functools import lru_cache
 from hashlib import sha256
 import json
+import time
 from pathlib import Path
 from typing import List
+import tiktoken
 from langchain.embeddings import OpenAIEmbeddings
 from langchain.vectorstores import Chroma
 import langchain.docstore.document as docstore
 import logging as logger
-from parsers.json import JsonParser
+from embedding_pipeline import Chunk, EmbeddingPipeline, EmbeddingStats
+from parallel_parser import ParallelParser, ParseResult
+from ingest_manifest import DocumentRecord, IngestManifest, SourceFile
+from store_format.bm25 import BM25_INDEX_DIRECTORY, export_bm25_index
+from store_format.cached_embeddings import CachedEmbeddings
+from store_format.vector_index import VECTOR_INDEX_DIRECTORY, export_vector_index
 from tqdm import tqdm as progress_bar
 
 COLLECTION_NAME = "neonshield-2023-05"
 PERSIST_DIRECTORY = "./temp_data/chroma"
+EMBEDDING_CACHE_FILE = "./temp_data/embedding_cache.sqlite"
+MANIFEST_FILE = "./temp_data/ingest_manifest.json"
+EMBEDDING_CHECKPOINT_FILE = "./temp_data/embedding_checkpoint.jsonl"
+# Lets the backend pack prompts without tokenising every retrieved chunk
+TOKENS_METADATA_KEY = "tokens"
+
+
+@dataclass
+class IngestReport:  # pylint: disable=too-many-instance-attributes
+    parsed_documents: int = 0
+    skipped_documents: int = 0
+    added_chunks: int = 0
+    removed_chunks: int = 0
+    skipped_chunks: int = 0
+    failed_chunks: int = 0
+    seconds: float = 0.0
+    estimated_seconds_saved: float = 0.0
 
 
 class VortexIngester:
     def __init__(self, content_folder: str):
         self.content_folder = content_folder
 
-    def ingest(
+    def ingest(  # pylint: disable=too-many-locals
         self,
-        chunk_size=250,
-        model_name="gpt-3.5-turbo",
-        chunk_overlap=25,
-        split_document_text=True,
-    ) -> None:
-        files_to_ingest = list(Path(self.content_folder).glob("*.json"))
-        vortex_json_parser = JsonParser(
-            chunk_size=chunk_size,
-            model_name=model_name,
-            chunk_overlap=chunk_overlap,
-            split_document_text=split_document_text,
-        )
+        incremental=False,
+        processes: int | None = None,
+        embed_concurrency=4,
+        max_batch_tokens=8000,
+        **parser_kwargs,
+    ) -> IngestReport:
+        """
+        Parse, embed and store every document in the content folder. In incremental
+        mode documents whose files are unchanged since the last run are not parsed,
+        only chunks missing from the store are embedded and chunks whose document
+        has gone are deleted.
 
-        chunks: List[docstore.Document] = []
-        for document in progress_bar(files_to_ingest, total=len(files_to_ingest)):
-            try:
-                new_chunks = vortex_json_parser.text_to_docs(
-                    document, self.content_folder
-                )
-                logger.debug(f"Extracted {len(new_chunks)} chunks from {document}")
-                chunks.extend(new_chunks)
-            except Exception as e:
-                logger.error(f"failed to ingest {document} because {e}")
+        Documents are parsed across `processes` worker processes, with the
+        chunk_size, model_name, chunk_overlap and split_document_text options
+        passed on to the parser. Their chunks are embedded in batches of up to
+        `max_batch_tokens` tokens with `embed_concurrency` requests in flight, and
+        each batch is written to the store as soon as it is embedded. Embedded
+        batches are checkpointed so a run that crashes resumes without embedding
+        them again.
+        """
+        start = time.perf_counter()
+        report = IngestReport()
 
-        embeddings = OpenAIEmbeddings(client=None)
+        openai_embeddings = OpenAIEmbeddings(client=None)
+        embeddings = CachedEmbeddings(
+            openai_embeddings,
+            openai_embeddings.model,
+            cache_file=EMBEDDING_CACHE_FILE,
+        )
         logger.info("Loaded embeddings")
-        vector_store = Chroma.from_documents(
-            chunks,
-            embeddings,
+        vector_store = Chroma(
             collection_name=COLLECTION_NAME,
+            embedding_function=embeddings,
             persist_directory=PERSIST_DIRECTORY,
-            ids=self.get_sha_of_chunks(chunks),
+        )
+        stored_ids = set(vector_store.get(include=[])["ids"])
+
+        previous_manifest = (
+            IngestManifest.load(MANIFEST_FILE) if incremental else IngestManifest()
+        )
+        manifest = IngestManifest(
+            embed_seconds_per_chunk=previous_manifest.embed_seconds_per_chunk
+        )
+        documents_to_parse = self.skip_unchanged(
+            previous_manifest, manifest, stored_ids, report
         )
 
-        logger.info("Created Chroma vector store")
+        encoding = tiktoken.encoding_for_model(openai_embeddings.model)
+
+        # Each new chunk is counted when it is stored and again when batched
+        @lru_cache(maxsize=4096)
+        def count_tokens(text: str) -> int:
+            return len(encoding.encode(text))
+
+        pipeline = EmbeddingPipeline(
+            embeddings,
+            lambda chunks, vectors: self.write_chunks(vector_store, chunks, vectors),
+            checkpoint_file=EMBEDDING_CHECKPOINT_FILE,
+            max_batch_tokens=max_batch_tokens,
+            concurrency=embed_concurrency,
+            count_tokens=count_tokens,
+        )
+
+        seen_ids = set()
+        with pipeline:
+            for result in progress_bar(
+                ParallelParser(parser_kwargs, processes).parse(
+                    documents_to_parse, self.content_folder
+                ),
+                total=len(documents_to_parse),
+            ):
+                chunk_ids = self.record_result(
+                    result, previous_manifest, manifest, seen_ids
+                )
+                if chunk_ids is None:
+                    continue
+                report.parsed_documents += 1
+                new_chunks = [
+                    (chunk, chunk_id)
+                    for chunk, chunk_id in zip(result.chunks, chunk_ids)
+                    if chunk_id not in stored_ids
+                ]
+                for chunk, _ in new_chunks:
+                    chunk.metadata[TOKENS_METADATA_KEY] = count_tokens(
+                        chunk.page_content
+                    )
+                pipeline.add(new_chunks)
+
+        logger.info(f"Embedding finished {pipeline.stats}")
+        report.removed_chunks = self.update_store(vector_store, stored_ids, manifest)
+        self.finish_report(report, manifest, pipeline.stats)
+        manifest.save(MANIFEST_FILE)
+        report.seconds = time.perf_counter() - start
+        logger.info(f"Ingest finished {report}")
+        return report
+
+    def skip_unchanged(
+        self,
+        previous_manifest: IngestManifest,
+        manifest: IngestManifest,
+        stored_ids: set,
+        report: IngestReport,
+    ) -> List[Path]:
+        """
+        The documents that need parsing. Those that can be skipped keep their record
+        from the previous manifest and are counted in the report.
+        """
+        documents_to_parse = []
+        for document in sorted(Path(self.content_folder).glob("*.json")):
+            record = previous_manifest.unchanged_record(str(document), stored_ids)
+            if record is None:
+                documents_to_parse.append(document)
+                continue
+            manifest.documents[str(document)] = record
+            report.skipped_documents += 1
+            report.estimated_seconds_saved += record.parse_seconds
+        return documents_to_parse
+
+    def record_result(
+        self,
+        result: ParseResult,
+        previous_manifest: IngestManifest,
+        manifest: IngestManifest,
+        seen_ids: set,
+    ) -> List[str] | None:
+        """
+        Add a parsed document to the manifest and return the ids of its chunks. A
+        document that failed to parse keeps its previous record, if it had one, and
+        None is returned.
+        """
+        document = str(result.document)
+        if result.error is not None:
+            logger.error(f"failed to ingest {result.document} because {result.error}")
+            if document in previous_manifest.documents:
+                manifest.documents[document] = previous_manifest.documents[document]
+            return None
+
+        logger.debug(f"Extracted {len(result.chunks)} chunks from {result.document}")
+        chunk_ids = self.get_sha_of_chunks(result.chunks, seen_ids)
+        manifest.documents[document] = DocumentRecord(
+            sources=[SourceFile.from_path(source) for source in result.sources],
+            chunk_ids=chunk_ids,
+            parse_seconds=result.parse_seconds,
+        )
+        return chunk_ids
+
+    @staticmethod
+    def update_store(
+        vector_store: Chroma, stored_ids: set, manifest: IngestManifest
+    ) -> int:
+        """
+        Delete the chunks no document in the manifest produced, persist the store
+        and export the indexes the backend serves from. Returns how many chunks
+        were deleted.
+        """
+        removed_ids = list(stored_ids - manifest.chunk_ids())
+        if removed_ids:
+            vector_store.delete(ids=removed_ids)
+        logger.info("Updated Chroma vector store")
         vector_store.persist()
         logger.info("Persisted Chroma vector store")
+        export_vector_index(
+            vector_store._collection,  # pylint: disable=protected-access
+            Path(PERSIST_DIRECTORY) / VECTOR_INDEX_DIRECTORY,
+        )
+        logger.info("Exported memory mapped vector index")
+        export_bm25_index(
+            vector_store._collection,  # pylint: disable=protected-access
+            Path(PERSIST_DIRECTORY) / BM25_INDEX_DIRECTORY,
+        )
+        logger.info("Exported BM25 index")
+        return len(removed_ids)
+
+    @staticmethod
+    def finish_report(
+        report: IngestReport, manifest: IngestManifest, embedding_stats: EmbeddingStats
+    ):
+        """Count the embedded and skipped chunks and the time saved by skipping."""
+        report.added_chunks = (
+            embedding_stats.embedded_chunks + embedding_stats.restored_chunks
+        )
+        report.failed_chunks = embedding_stats.failed_chunks
+        if embedding_stats.embedded_chunks:
+            manifest.embed_seconds_per_chunk = (
+                embedding_stats.embed_seconds / embedding_stats.embedded_chunks
+            )
+        report.skipped_chunks = (
+            len(manifest.chunk_ids()) - report.added_chunks - report.failed_chunks
+        )
+        report.estimated_seconds_saved += (
+            report.skipped_chunks * manifest.embed_seconds_per_chunk
+        )
+
+    @staticmethod
+    def write_chunks(
+        vector_store: Chroma, chunks: List[Chunk], vectors: List[List[float]]
+    ):
+        """Store chunks that have already been embedded."""
+        # pylint: disable-next=protected-access
+        vector_store._collection.upsert(
+            ids=[chunk_id for _, chunk_id in chunks],
+            embeddings=vectors,
+            metadatas=[chunk.metadata for chunk, _ in chunks],
+            documents=[chunk.page_content for chunk, _ in chunks],
+        )
+
+    @staticmethod
+    def get_chunk_id(chunk: docstore.Document) -> str:
+        return sha256(chunk.page_content.encode("utf-8")).hexdigest()
 
     @staticmethod
-    def get_sha_of_chunks(chunks: List[docstore.Document]):
-        ids = set()
+    def get_sha_of_chunks(
+        chunks: List[docstore.Document], seen: set | None = None
+    ) -> List[str]:
+        """
+        Content hashes of the chunks, in the same order as the chunks. Raises if a
+        hash is repeated or is already in `seen`, which is updated with the hashes.
+        """
+        ids = []
+        seen = set() if seen is None else seen
 
         for chunk in chunks:
-            sha = sha256(chunk.page_content.encode("utf-8")).hexdigest()
-            if sha in ids:
+            sha = VortexIngester.get_chunk_id(chunk)
+            if sha in seen:
                 raise ValueError(
                     f"Found ID {sha} twice current document is {json.dumps(chunk.metadata)} content is {chunk.page_content}"  # pylint: disable=line-too-long
                 )
-            ids.add(sha)
+            seen.add(sha)
+            ids.append(sha)
 
-        return list(ids)
+        return ids
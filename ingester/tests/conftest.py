@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# The ingester is run from its own directory and imports its modules by name
+sys.path.append(str(Path(__file__).parent.parent / "ingester"))
@@ -0,0 +1,103 @@
+from langchain.docstore.document import Document
+from langchain.embeddings import DeterministicFakeEmbedding
+import pytest
+
+from ingester.embedding_pipeline import EmbeddingPipeline
+
+
+class FakeEmbeddings(DeterministicFakeEmbedding):
+    """Deterministic embeddings that record each request and can fail the first ones."""
+
+    failures: int = 0
+    requests: list = []
+
+    def embed_documents(self, texts):
+        self.requests.append(list(texts))
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("rate limited")
+        return super().embed_documents(texts)
+
+
+def make_chunks(count):
+    return [
+        (Document(page_content=f"chunk {i:03}", metadata={"chunk": i}), f"id-{i}")
+        for i in range(count)
+    ]
+
+
+class Writer:
+    def __init__(self):
+        self.vectors = {}
+
+    def __call__(self, chunks, vectors):
+        for (_, chunk_id), vector in zip(chunks, vectors):
+            self.vectors[chunk_id] = vector
+
+
+def make_pipeline(embeddings, writer, tmp_path, **kwargs):
+    return EmbeddingPipeline(
+        embeddings,
+        writer,
+        checkpoint_file=str(tmp_path / "checkpoint.jsonl"),
+        count_tokens=lambda text: 1,
+        sleep=lambda seconds: None,
+        **kwargs,
+    )
+
+
+def test_chunks_are_batched_by_token_budget(tmp_path):
+    embeddings, writer = FakeEmbeddings(size=4, requests=[]), Writer()
+
+    with make_pipeline(embeddings, writer, tmp_path, max_batch_tokens=3) as pipeline:
+        pipeline.add(make_chunks(7))
+
+    assert sorted(len(request) for request in embeddings.requests) == [1, 3, 3]
+    assert writer.vectors["id-5"] == embeddings.embed_query("chunk 005")
+    assert pipeline.stats.embedded_chunks == 7
+    assert not (tmp_path / "checkpoint.jsonl").exists()
+
+
+def test_failed_requests_are_retried(tmp_path):
+    embeddings, writer = FakeEmbeddings(size=4, failures=2, requests=[]), Writer()
+
+    with make_pipeline(embeddings, writer, tmp_path, concurrency=1) as pipeline:
+        pipeline.add(make_chunks(2))
+
+    assert pipeline.stats.retries == 2
+    assert len(writer.vectors) == 2
+
+
+def test_batch_that_keeps_failing_does_not_end_the_run(tmp_path):
+    embeddings, writer = FakeEmbeddings(size=4, failures=2, requests=[]), Writer()
+
+    with make_pipeline(
+        embeddings, writer, tmp_path, max_batch_tokens=2, concurrency=1, max_attempts=2
+    ) as pipeline:
+        pipeline.add(make_chunks(4))
+
+    assert pipeline.stats.failed_chunks == 2
+    assert sorted(writer.vectors) == ["id-2", "id-3"]
+    assert (tmp_path / "checkpoint.jsonl").exists()
+
+
+def test_crashed_run_resumes_from_checkpoint(tmp_path):
+    chunks = make_chunks(4)
+    with pytest.raises(KeyboardInterrupt):
+        with make_pipeline(
+            FakeEmbeddings(size=4, requests=[]),
+            Writer(),
+            tmp_path,
+            max_batch_tokens=2,
+            concurrency=1,
+        ) as pipeline:
+            pipeline.add(chunks[:3])
+            raise KeyboardInterrupt()
+
+    embeddings, writer = FakeEmbeddings(size=4, requests=[]), Writer()
+    with make_pipeline(embeddings, writer, tmp_path, max_batch_tokens=2) as pipeline:
+        pipeline.add(chunks)
+
+    assert pipeline.stats.restored_chunks == 2
+    assert embeddings.requests == [["chunk 002", "chunk 003"]]
+    assert len(writer.vectors) == 4
@@ -0,0 +1,51 @@
+import os
+
+from ingester.ingest_manifest import DocumentRecord, IngestManifest, SourceFile
+
+
+def make_manifest(tmp_path, content="content"):
+    document = tmp_path / "document.json"
+    document.write_text(content)
+    manifest = IngestManifest()
+    manifest.documents[str(document)] = DocumentRecord(
+        sources=[SourceFile.from_path(str(document))],
+        chunk_ids=["chunk"],
+        parse_seconds=1.0,
+    )
+    return manifest, document
+
+
+def test_unchanged_document_is_skipped(tmp_path):
+    manifest, document = make_manifest(tmp_path)
+
+    assert manifest.unchanged_record(str(document), {"chunk"}) is not None
+
+
+def test_touched_but_identical_document_is_skipped(tmp_path):
+    manifest, document = make_manifest(tmp_path)
+    os.utime(document, ns=(0, 0))
+
+    assert manifest.unchanged_record(str(document), {"chunk"}) is not None
+
+
+def test_changed_document_is_parsed(tmp_path):
+    manifest, document = make_manifest(tmp_path)
+    document.write_text("new content")
+
+    assert manifest.unchanged_record(str(document), {"chunk"}) is None
+
+
+def test_document_missing_from_store_is_parsed(tmp_path):
+    manifest, document = make_manifest(tmp_path)
+
+    assert manifest.unchanged_record(str(document), set()) is None
+
+
+def test_manifest_round_trip(tmp_path):
+    manifest, document = make_manifest(tmp_path)
+    manifest.embed_seconds_per_chunk = 0.5
+    manifest.save(str(tmp_path / "manifest.json"))
+
+    loaded = IngestManifest.load(str(tmp_path / "manifest.json"))
+
+    assert loaded == manifest
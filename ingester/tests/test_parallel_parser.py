@@ -0,0 +1,85 @@
+import json
+import os
+import time
+
+from ingester import parallel_parser
+from ingester.parallel_parser import ParallelParser
+
+PARSER_KWARGS = {"split_document_text": False}
+
+
+def write_documents(content_folder, names):
+    documents = []
+    for name in names:
+        document = content_folder / f"{name}.json"
+        document.write_text(
+            json.dumps(
+                {
+                    "metadata": {"type": "json", "date": "2023-05-01", "name": name},
+                    "content": f"{name} text",
+                }
+            )
+        )
+        documents.append(document)
+    return documents
+
+
+def test_results_are_in_document_order(tmp_path, monkeypatch):
+    text_to_docs = parallel_parser.JsonParser.text_to_docs
+
+    def slow_first(self, file, path_root="./"):
+        if file.name == "0.json":
+            time.sleep(0.2)
+        return text_to_docs(self, file, path_root)
+
+    monkeypatch.setattr(parallel_parser.JsonParser, "text_to_docs", slow_first)
+    documents = write_documents(tmp_path, [str(number) for number in range(8)])
+
+    results = list(
+        ParallelParser(PARSER_KWARGS, processes=3, max_in_flight=4).parse(
+            documents, str(tmp_path)
+        )
+    )
+
+    assert [result.document for result in results] == documents
+    assert [result.chunks[0].metadata["name"] for result in results] == [
+        str(number) for number in range(8)
+    ]
+
+
+def test_a_failing_document_is_reported_and_skipped(tmp_path):
+    documents = write_documents(tmp_path, ["before", "after"])
+    broken = tmp_path / "broken.json"
+    broken.write_text("{not json")
+    documents.insert(1, broken)
+
+    results = list(ParallelParser(PARSER_KWARGS, processes=2).parse(documents, "."))
+
+    assert [result.document for result in results] == documents
+    assert results[1].error is not None
+    assert results[0].error is None and results[2].error is None
+
+
+def test_a_document_that_kills_its_worker_is_skipped(tmp_path, monkeypatch):
+    text_to_docs = parallel_parser.JsonParser.text_to_docs
+
+    def crash(self, file, path_root="./"):
+        if file.name == "crash.json":
+            os._exit(1)
+        return text_to_docs(self, file, path_root)
+
+    monkeypatch.setattr(parallel_parser.JsonParser, "text_to_docs", crash)
+    names = ["first", "second", "crash", "third", "fourth", "fifth"]
+    documents = write_documents(tmp_path, names)
+
+    results = list(
+        ParallelParser(PARSER_KWARGS, processes=2, max_in_flight=3).parse(
+            documents, str(tmp_path)
+        )
+    )
+
+    assert [result.document for result in results] == documents
+    assert [result.error is None for result in results] == [
+        name != "crash" for name in names
+    ]
+    assert "died" in results[2].error
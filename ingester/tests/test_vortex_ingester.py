@@ -0,0 +1,133 @@
+import json
+from pathlib import Path
+from types import SimpleNamespace
+
+from langchain.embeddings import DeterministicFakeEmbedding
+from langchain.vectorstores import Chroma
+import pytest
+
+from ingester import vortex_ingester
+from ingester.vortex_ingester import VortexIngester
+
+
+class FakeEmbeddings(DeterministicFakeEmbedding):
+    model: str = "fake-model"
+    requests: list = []
+
+    def embed_documents(self, texts):
+        self.requests.append(list(texts))
+        return super().embed_documents(texts)
+
+
+@pytest.fixture(name="embeddings")
+def fixture_embeddings(tmp_path, monkeypatch):
+    embeddings = FakeEmbeddings(size=4, requests=[])
+    monkeypatch.setattr(vortex_ingester, "OpenAIEmbeddings", lambda client: embeddings)
+    monkeypatch.setattr(
+        vortex_ingester,
+        "tiktoken",
+        SimpleNamespace(
+            encoding_for_model=lambda model: SimpleNamespace(encode=str.split)
+        ),
+    )
+    for name, path in (
+        ("PERSIST_DIRECTORY", "chroma"),
+        ("EMBEDDING_CACHE_FILE", "embedding_cache.sqlite"),
+        ("MANIFEST_FILE", "ingest_manifest.json"),
+        ("EMBEDDING_CHECKPOINT_FILE", "embedding_checkpoint.jsonl"),
+    ):
+        monkeypatch.setattr(vortex_ingester, name, str(tmp_path / "temp_data" / path))
+    return embeddings
+
+
+def write_document(content_folder, name, content):
+    (content_folder / f"{name}.json").write_text(
+        json.dumps(
+            {
+                "metadata": {"type": "json", "date": "2023-05-01", "name": name},
+                "content": content,
+            }
+        )
+    )
+
+
+def ingest(content_folder):
+    return VortexIngester(str(content_folder)).ingest(
+        split_document_text=False, incremental=True, processes=1
+    )
+
+
+def stored_contents():
+    vector_store = Chroma(
+        collection_name=vortex_ingester.COLLECTION_NAME,
+        persist_directory=vortex_ingester.PERSIST_DIRECTORY,
+    )
+    return sorted(vector_store.get()["documents"])
+
+
+@pytest.fixture(name="content_folder")
+def fixture_content_folder(tmp_path):
+    content_folder = tmp_path / "content"
+    content_folder.mkdir()
+    for name in ("unchanged", "changed", "removed"):
+        write_document(content_folder, name, f"{name} text")
+    return content_folder
+
+
+def test_second_ingest_only_applies_what_changed(content_folder, embeddings):
+    first = ingest(content_folder)
+    write_document(content_folder, "changed", "changed text, edited")
+    (content_folder / "removed.json").unlink()
+    write_document(content_folder, "added", "added text")
+
+    second = ingest(content_folder)
+
+    assert (first.parsed_documents, first.added_chunks) == (3, 3)
+    assert second.skipped_documents == 1
+    assert second.parsed_documents == 2
+    assert second.added_chunks == 2
+    assert second.removed_chunks == 2
+    assert second.skipped_chunks == 1
+    assert embeddings.requests[1:] == [
+        ["2023-05-01  added text", "2023-05-01  changed text, edited"]
+    ]
+    assert stored_contents() == [
+        "2023-05-01  added text",
+        "2023-05-01  changed text, edited",
+        "2023-05-01  unchanged text",
+    ]
+
+
+def test_missing_manifest_parses_everything_without_embedding_again(
+    content_folder, embeddings
+):
+    ingest(content_folder)
+    Path(vortex_ingester.MANIFEST_FILE).unlink()
+
+    report = ingest(content_folder)
+
+    assert report.skipped_documents == 0
+    assert report.parsed_documents == 3
+    assert (report.added_chunks, report.removed_chunks) == (0, 0)
+    assert report.skipped_chunks == 3
+    assert len(embeddings.requests) == 1
+
+
+def test_stale_manifest_parses_documents_missing_from_the_store(
+    content_folder, embeddings
+):
+    ingest(content_folder)
+    vector_store = Chroma(
+        collection_name=vortex_ingester.COLLECTION_NAME,
+        persist_directory=vortex_ingester.PERSIST_DIRECTORY,
+    )
+    unchanged = vector_store.get(where={"name": "unchanged"})["ids"]
+    vector_store.delete(ids=unchanged)
+    vector_store.persist()
+
+    report = ingest(content_folder)
+
+    assert report.skipped_documents == 2
+    assert report.parsed_documents == 1
+    assert report.added_chunks == 1
+    assert len(stored_contents()) == 3
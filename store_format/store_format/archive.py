@@ -0,0 +1,150 @@
+import json
+import tarfile
+import tempfile
+import time
+from hashlib import sha256
+from pathlib import Path
+
+from boto3.s3.transfer import TransferConfig
+from opentelemetry import trace
+
+from store_format.manifest import build_manifest, hash_file
+
+tracer = trace.get_tracer("chatbot.document_store")
+
+
+class HashingReader:
+    """File like wrapper that hashes everything read through it."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.digest = sha256()
+        self.size = 0
+
+    def read(self, size=-1) -> bytes:
+        data = self.stream.read(size)
+        self.digest.update(data)
+        self.size += len(data)
+        return data
+
+    def drain(self):
+        while self.read(1 << 20):
+            pass
+
+
+class StoreArchive:
+    """
+    The document store published to S3 as a single gzipped tar archive, which
+    the ingester publishes and the backend's store cache downloads, checks
+    against the manifest and serves from. The archive is uploaded in parts,
+    `max_workers` at a time. The version is derived from the content hashes of
+    the files in the store and `store.json`, which describes the current
+    archive, is written after the archive so readers never find a manifest
+    pointing at a missing archive. Once it is, archives older than the previous
+    one are deleted, the previous one is kept for anyone still downloading it.
+    """
+
+    MANIFEST_KEY = "store.json"
+    ARCHIVE_PREFIX = "archives/"
+    DELETE_BATCH_SIZE = 1000
+
+    def __init__(
+        self,
+        client,
+        bucket: str,
+        max_workers: int = 8,
+        transfer_config: TransferConfig | None = None,
+    ):
+        self.client = client
+        self.bucket = bucket
+        self.transfer_config = transfer_config or TransferConfig(
+            multipart_threshold=8 * 1024 * 1024,
+            multipart_chunksize=16 * 1024 * 1024,
+            max_concurrency=max_workers,
+        )
+
+    @tracer.start_as_current_span("chatbot.StoreArchive.publish")
+    def publish(self, local_directory: Path) -> str:
+        manifest = build_manifest(local_directory)
+        version = sha256(
+            json.dumps(manifest["files"], sort_keys=True).encode("utf-8")
+        ).hexdigest()[:16]
+        trace.get_current_span().set_attribute(
+            "chatbot.document_store.version", version
+        )
+        current = self.read_manifest()
+        if current is not None and current["version"] == version:
+            return version
+
+        with tempfile.TemporaryDirectory() as directory:
+            archive_path = Path(directory) / f"{version}.tar.gz"
+            with tarfile.open(archive_path, "w:gz") as archive:
+                for name in manifest["files"]:
+                    archive.add(local_directory / name, arcname=name)
+            key = f"{self.ARCHIVE_PREFIX}{version}.tar.gz"
+            self.client.upload_file(
+                str(archive_path), self.bucket, key, Config=self.transfer_config
+            )
+            manifest.update(
+                version=version,
+                published=time.time(),
+                archive=key,
+                archive_sha256=hash_file(archive_path),
+                archive_size=archive_path.stat().st_size,
+            )
+
+        self.client.put_object(
+            Bucket=self.bucket,
+            Key=self.MANIFEST_KEY,
+            Body=json.dumps(manifest).encode("utf-8"),
+            ContentType="application/json",
+        )
+        keep = {manifest["archive"]}
+        if current is not None:
+            keep.add(current["archive"])
+        removed = self.delete_superseded(keep)
+        trace.get_current_span().set_attribute(
+            "chatbot.document_store.deleted_keys", len(removed)
+        )
+        return version
+
+    def read_manifest(self) -> dict | None:
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=self.MANIFEST_KEY)
+        except self.client.exceptions.NoSuchKey:
+            return None
+        return json.loads(response["Body"].read())
+
+    def extract(self, manifest: dict, target: Path):
+        """Download and unpack the archive in one streaming pass, checking its hash."""
+        response = self.client.get_object(Bucket=self.bucket, Key=manifest["archive"])
+        reader = HashingReader(response["Body"])
+        with tarfile.open(fileobj=reader, mode="r|gz") as archive:
+            archive.extractall(target, filter="data")
+        reader.drain()
+        if reader.digest.hexdigest() != manifest["archive_sha256"]:
+            raise ValueError(f"archive {manifest['archive']} failed its checksum")
+
+    def delete_superseded(self, keep: set[str]) -> list[str]:
+        """
+        Delete every key in the bucket but the manifest and the archives kept. The
+        bucket only holds the store, so this also removes what it was published as
+        before archives, files at the root of the bucket and the file by file
+        sync's manifest.json and versions/.
+        """
+        keep = keep | {self.MANIFEST_KEY}
+        removed = []
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=""):
+            removed.extend(
+                item["Key"]
+                for item in page.get("Contents", [])
+                if item["Key"] not in keep
+            )
+        for start in range(0, len(removed), self.DELETE_BATCH_SIZE):
+            batch = removed[start : start + self.DELETE_BATCH_SIZE]
+            self.client.delete_objects(
+                Bucket=self.bucket,
+                Delete={"Objects": [{"Key": key} for key in batch], "Quiet": True},
+            )
+        return removed
@@ -0,0 +1,116 @@
+"""
+The inverted index the ingester exports alongside the Chroma store for the
+backend's BM25Index, and the tokeniser both build and search it with.
+"""
+import json
+import re
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+
+from store_format.vector_index import move_into_place, start_partial
+
+BM25_INDEX_DIRECTORY = "bm25_index"
+INDEX_FILE = "index.json"
+TERMS_FILE = "terms.json"
+IDS_FILE = "ids.json"
+OFFSETS_FILE = "offsets.npy"
+ROWS_FILE = "rows.npy"
+FREQUENCIES_FILE = "frequencies.npy"
+LENGTHS_FILE = "lengths.npy"
+
+# Keep dotted, dashed and underscored runs together so version numbers, error
+# codes and product names such as ERR_SSL_PROTOCOL or v2.3 match exactly
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[._\-/][a-z0-9]+)*")
+
+
+def tokenise(text: str) -> List[str]:
+    tokens = TOKEN_PATTERN.findall(text.lower())
+    # Index the parts of compound tokens as well so "lighthouse" finds
+    # "lighthouse-admin"
+    parts = [
+        part
+        for token in tokens
+        if not token.isalnum()
+        for part in re.split(r"[._\-/]", token)
+    ]
+    return tokens + parts
+
+
+def build_bm25_index(
+    chunks: Iterable[Tuple[str, str]], directory: Path, k1: float = 1.2, b: float = 0.75
+):
+    """
+    Write an inverted index over (chunk id, text) pairs. Postings for every term
+    are stored contiguously, the term's slice found through an offsets array, so
+    the index can be memory mapped and only the postings for the query's terms
+    are read. The index is built alongside and moved into place once complete.
+    """
+    ids, lengths, postings = invert(chunks)
+    terms = sorted(postings)
+    offsets, rows, frequencies = pack_postings([postings[term] for term in terms])
+
+    partial = start_partial(directory)
+    np.save(partial / OFFSETS_FILE, offsets)
+    np.save(partial / ROWS_FILE, rows)
+    np.save(partial / FREQUENCIES_FILE, frequencies)
+    np.save(partial / LENGTHS_FILE, np.array(lengths, dtype=np.int32))
+    (partial / TERMS_FILE).write_text(json.dumps(terms))
+    (partial / IDS_FILE).write_text(json.dumps(ids))
+    (partial / INDEX_FILE).write_text(
+        json.dumps(
+            {
+                "count": len(ids),
+                "average_length": float(np.mean(lengths)) if lengths else 0.0,
+                "k1": k1,
+                "b": b,
+            }
+        )
+    )
+    move_into_place(partial, directory)
+
+
+def invert(
+    chunks: Iterable[Tuple[str, str]]
+) -> Tuple[List[str], List[int], Dict[str, List[Tuple[int, int]]]]:
+    """Chunk ids, lengths in tokens and each term's (row, frequency) postings."""
+    ids = []
+    lengths = []
+    postings: Dict[str, List[Tuple[int, int]]] = {}
+    for row, (chunk_id, text) in enumerate(chunks):
+        tokens = tokenise(text)
+        ids.append(chunk_id)
+        lengths.append(len(tokens))
+        for term, frequency in Counter(tokens).items():
+            postings.setdefault(term, []).append((row, frequency))
+    return ids, lengths, postings
+
+
+def pack_postings(
+    postings: List[List[Tuple[int, int]]]
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Every term's postings back to back as rows and frequencies, and offsets."""
+    offsets = np.zeros(len(postings) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(term_postings) for term_postings in postings])
+    rows = np.empty(offsets[-1], dtype=np.int32)
+    frequencies = np.empty(offsets[-1], dtype=np.uint16)
+    for index, term_postings in enumerate(postings):
+        term_postings = np.array(term_postings, dtype=np.int64).reshape(-1, 2)
+        rows[offsets[index] : offsets[index + 1]] = term_postings[:, 0]
+        frequencies[offsets[index] : offsets[index + 1]] = np.minimum(
+            term_postings[:, 1], np.iinfo(np.uint16).max
+        )
+    return offsets, rows, frequencies
+
+
+def export_bm25_index(collection, directory: Path, page_size: int = 5000):
+    """Build the BM25 index over every chunk in a Chroma collection."""
+
+    def chunks():
+        for start in range(0, collection.count(), page_size):
+            page = collection.get(include=["documents"], limit=page_size, offset=start)
+            yield from zip(page["ids"], page["documents"])
+
+    build_bm25_index(chunks(), directory)
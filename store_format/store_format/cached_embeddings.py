@@ -0,0 +1,174 @@
+import asyncio
+import sqlite3
+import threading
+import unicodedata
+from array import array
+from collections import OrderedDict
+from hashlib import sha256
+from pathlib import Path
+from typing import Iterable, List
+
+from langchain.schema.embeddings import Embeddings
+from opentelemetry import metrics
+
+meter = metrics.get_meter("chatbot.embeddings")
+cache_hits = meter.create_counter(
+    "chatbot.embeddings.cache.hits", description="Embeddings served from the cache"
+)
+cache_misses = meter.create_counter(
+    "chatbot.embeddings.cache.misses",
+    description="Embeddings requested from the provider",
+)
+
+
+class EmbeddingStore:
+    """On disk store of embeddings keyed by text hash, backed by sqlite."""
+
+    LOOKUP_BATCH_SIZE = 500
+
+    def __init__(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB)"
+        )
+
+    def get_many(self, keys: list[str]) -> dict[str, list[float]]:
+        found = {}
+        with self.lock:
+            for start in range(0, len(keys), EmbeddingStore.LOOKUP_BATCH_SIZE):
+                batch = keys[start : start + EmbeddingStore.LOOKUP_BATCH_SIZE]
+                rows = self.connection.execute(
+                    "SELECT key, vector FROM embeddings WHERE key IN "
+                    f"({','.join('?' * len(batch))})",
+                    batch,
+                )
+                for key, vector in rows:
+                    found[key] = array("f", vector).tolist()
+        return found
+
+    def put_many(self, items: Iterable[tuple[str, list[float]]]):
+        with self.lock, self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO embeddings VALUES (?, ?)",
+                [(key, array("f", vector).tobytes()) for key, vector in items],
+            )
+
+    def close(self):
+        self.connection.close()
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wraps an embeddings provider with an in memory LRU cache in front of an
+    optional on disk store, which keeps the ingester from paying again for chunks
+    an earlier run embedded. Texts are keyed by a hash of the model name and the
+    normalised text, only texts missing from both are sent to the provider and
+    they are sent together in a single request. Safe to call from several threads.
+    """
+
+    def __init__(
+        self,
+        underlying: Embeddings,
+        model: str,
+        max_entries: int = 10000,
+        cache_file: str | None = None,
+    ):
+        self.underlying = underlying
+        self.model = model
+        self.max_entries = max_entries
+        self.memory: OrderedDict[str, list[float]] = OrderedDict()
+        self.memory_lock = threading.Lock()
+        self.store = EmbeddingStore(Path(cache_file)) if cache_file else None
+
+    def key(self, text: str) -> str:
+        normalised = " ".join(unicodedata.normalize("NFC", text).split())
+        return sha256(f"{self.model}\0{normalised}".encode("utf-8")).hexdigest()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self.key(text) for text in texts]
+        found = self._from_memory(keys)
+        missing = self._missing(keys, found)
+        if missing:
+            found.update(self._from_disk(missing))
+        misses = self._misses(texts, keys, found)
+        if misses:
+            vectors = self.underlying.embed_documents(list(misses.values()))
+            self._to_disk(self._remember(zip(misses.keys(), vectors), found))
+        return [found[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        # The on disk store is only read and written from a thread, so a slow
+        # disk never holds up the event loop
+        keys = [self.key(text) for text in texts]
+        found = self._from_memory(keys)
+        missing = self._missing(keys, found)
+        if missing:
+            found.update(await asyncio.to_thread(self._from_disk, missing))
+        misses = self._misses(texts, keys, found)
+        if misses:
+            vectors = await self.underlying.aembed_documents(list(misses.values()))
+            remembered = self._remember(zip(misses.keys(), vectors), found)
+            if self.store is not None:
+                await asyncio.to_thread(self._to_disk, remembered)
+        return [found[key] for key in keys]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+    def _from_memory(self, keys: list[str]) -> dict[str, list[float]]:
+        found = {}
+        with self.memory_lock:
+            for key in keys:
+                if key in self.memory:
+                    self.memory.move_to_end(key)
+                    found[key] = self.memory[key]
+        cache_hits.add(len(found), {"chatbot.embeddings.cache.tier": "memory"})
+        return found
+
+    def _missing(self, keys: list[str], found: dict[str, list[float]]) -> list[str]:
+        """Keys to look for on disk, none if there is no store."""
+        if self.store is None:
+            return []
+        return [key for key in dict.fromkeys(keys) if key not in found]
+
+    def _from_disk(self, keys: list[str]) -> dict[str, list[float]]:
+        on_disk = self.store.get_many(keys)
+        for key, vector in on_disk.items():
+            self._add_to_memory(key, vector)
+        cache_hits.add(len(on_disk), {"chatbot.embeddings.cache.tier": "disk"})
+        return on_disk
+
+    def _misses(
+        self, texts: List[str], keys: list[str], found: dict[str, list[float]]
+    ) -> dict[str, str]:
+        misses = {key: text for key, text in zip(keys, texts) if key not in found}
+        cache_misses.add(len(misses))
+        return misses
+
+    def _remember(
+        self,
+        vectors: Iterable[tuple[str, list[float]]],
+        found: dict[str, list[float]],
+    ) -> list[tuple[str, list[float]]]:
+        # Round to float32 so vectors are identical whether read from memory or disk
+        vectors = [(key, array("f", vector).tolist()) for key, vector in vectors]
+        for key, vector in vectors:
+            self._add_to_memory(key, vector)
+            found[key] = vector
+        return vectors
+
+    def _to_disk(self, vectors: list[tuple[str, list[float]]]):
+        if self.store is not None:
+            self.store.put_many(vectors)
+
+    def _add_to_memory(self, key: str, vector: list[float]):
+        with self.memory_lock:
+            self.memory[key] = vector
+            self.memory.move_to_end(key)
+            while len(self.memory) > self.max_entries:
+                self.memory.popitem(last=False)
@@ -0,0 +1,19 @@
+from hashlib import file_digest
+from pathlib import Path
+
+
+def hash_file(path: Path) -> str:
+    with open(path, "rb") as file:
+        return file_digest(file, "sha256").hexdigest()
+
+
+def build_manifest(directory: Path) -> dict:
+    """Size and content hash of every file in the store, keyed by relative path."""
+    files = {}
+    for path in sorted(directory.rglob("*")):
+        if path.is_file():
+            files[path.relative_to(directory).as_posix()] = {
+                "size": path.stat().st_size,
+                "sha256": hash_file(path),
+            }
+    return {"files": files}
@@ -0,0 +1,109 @@
+"""
+The read only vector index the ingester exports alongside the Chroma store,
+which the backend's MmapVectorStore memory maps and serves from.
+"""
+import json
+import os
+import shutil
+from pathlib import Path
+
+import numpy as np
+
+VECTOR_INDEX_DIRECTORY = "vector_index"
+INDEX_FILE = "index.json"
+VECTORS_FILE = "vectors.npy"
+OFFSETS_FILE = "offsets.npy"
+DOCUMENTS_FILE = "documents.bin"
+IDS_FILE = "ids.json"
+
+
+def normalise(vectors: np.ndarray) -> np.ndarray:
+    """Scale each row, or a single vector, to unit length leaving zeros alone."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def start_partial(directory: Path) -> Path:
+    """Empty directory alongside an index to build it in."""
+    partial = directory.with_name(f".{directory.name}.partial")
+    shutil.rmtree(partial, ignore_errors=True)
+    partial.mkdir(parents=True)
+    return partial
+
+
+def move_into_place(partial: Path, directory: Path):
+    shutil.rmtree(directory, ignore_errors=True)
+    os.replace(partial, directory)
+
+
+def export_vector_index(
+    collection, directory: Path, dtype: str = "float32", page_size: int = 5000
+):
+    """
+    Write every embedding in a Chroma collection to a read only index made for
+    memory mapping. Vectors are L2 normalised and stored as one `dtype` matrix,
+    documents and metadata are stored as JSON records back to back with their
+    offsets held in a separate array so any row can be read without parsing the
+    others. The index is built alongside and moved into place once complete.
+
+    float16 halves the size of the index but every query then pays to convert the
+    matrix back to float32, so it only suits stores too large to keep in memory.
+    """
+    count = collection.count()
+    partial = start_partial(directory)
+
+    vectors = None
+    ids = []
+    offsets = np.zeros(count + 1, dtype=np.uint64)
+    with open(partial / DOCUMENTS_FILE, "wb") as documents_file:
+        for start in range(0, count, page_size):
+            page = collection.get(
+                include=["embeddings", "documents", "metadatas"],
+                limit=page_size,
+                offset=start,
+            )
+            embeddings = np.asarray(page["embeddings"], dtype=np.float32)
+            if vectors is None:
+                vectors = np.lib.format.open_memmap(
+                    partial / VECTORS_FILE,
+                    mode="w+",
+                    dtype=dtype,
+                    shape=(count, embeddings.shape[1]),
+                )
+            vectors[start : start + len(embeddings)] = normalise(embeddings)
+            write_records(documents_file, page, offsets, start)
+            ids.extend(page["ids"])
+
+    dimensions = 0
+    if vectors is not None:
+        dimensions = vectors.shape[1]
+        vectors.flush()
+        del vectors
+    else:
+        np.save(partial / VECTORS_FILE, np.zeros((0, 0), dtype=dtype))
+    np.save(partial / OFFSETS_FILE, offsets)
+    (partial / IDS_FILE).write_text(json.dumps(ids))
+    (partial / INDEX_FILE).write_text(
+        json.dumps(
+            {
+                "collection": collection.name,
+                "count": count,
+                "dimensions": dimensions,
+                "dtype": dtype,
+            }
+        )
+    )
+    move_into_place(partial, directory)
+
+
+def write_records(documents_file, page: dict, offsets: np.ndarray, start: int):
+    """Append a page of documents as JSON records, noting where each one ends."""
+    for row, (chunk_id, text, metadata) in enumerate(
+        zip(page["ids"], page["documents"], page["metadatas"]), start
+    ):
+        record = json.dumps(
+            {"id": chunk_id, "page_content": text, "metadata": metadata}
+        ).encode("utf-8")
+        documents_file.write(record)
+        offsets[row + 1] = offsets[row] + len(record)
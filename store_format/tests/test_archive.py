@@ -0,0 +1,113 @@
+import io
+import tarfile
+
+from store_format.archive import StoreArchive
+
+
+class FakeS3Client:
+    """In memory stand in for the parts of the S3 client StoreArchive uses."""
+
+    class exceptions:  # pylint: disable=invalid-name
+        class NoSuchKey(Exception):
+            pass
+
+    def __init__(self):
+        self.objects = {}
+        self.uploads = []
+        self.configs = []
+
+    def get_object(self, Bucket, Key):  # pylint: disable=invalid-name
+        if Key not in self.objects:
+            raise self.exceptions.NoSuchKey()
+        return {"Body": io.BytesIO(self.objects[Key])}
+
+    def put_object(self, Bucket, Key, Body, **kwargs):  # pylint: disable=invalid-name
+        self.objects[Key] = Body
+
+    def upload_file(self, filename, bucket, key, Config=None):
+        self.uploads.append(key)
+        self.configs.append(Config)
+        with open(filename, "rb") as file:
+            self.objects[key] = file.read()
+
+    def delete_objects(self, Bucket, Delete):  # pylint: disable=invalid-name
+        for item in Delete["Objects"]:
+            del self.objects[item["Key"]]
+
+    def get_paginator(self, operation):
+        assert operation == "list_objects_v2"
+        return self
+
+    def paginate(self, Bucket, Prefix):  # pylint: disable=invalid-name
+        keys = sorted(key for key in self.objects if key.startswith(Prefix))
+        yield {"Contents": [{"Key": key} for key in keys]}
+
+
+def write_store(directory, files):
+    for name, content in files.items():
+        path = directory / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(content)
+
+
+def test_store_is_published_as_one_archive(tmp_path):
+    client = FakeS3Client()
+    files = {"chroma.sqlite3": b"sqlite", "index/data_level0.bin": b"x" * 4000}
+    write_store(tmp_path / "store", files)
+
+    version = StoreArchive(client, "bucket").publish(tmp_path / "store")
+
+    manifest = StoreArchive(client, "bucket").read_manifest()
+    assert manifest["version"] == version
+    assert manifest["files"]["chroma.sqlite3"]["size"] == len(b"sqlite")
+    with tarfile.open(fileobj=io.BytesIO(client.objects[manifest["archive"]])) as tar:
+        assert sorted(tar.getnames()) == sorted(files)
+
+
+def test_unchanged_store_is_not_published_again(tmp_path):
+    client = FakeS3Client()
+    write_store(tmp_path / "store", {"chroma.sqlite3": b"sqlite"})
+    archive = StoreArchive(client, "bucket")
+
+    assert archive.publish(tmp_path / "store") == archive.publish(tmp_path / "store")
+    assert len(client.uploads) == 1
+
+
+def test_superseded_archives_are_deleted_once_published(tmp_path):
+    client = FakeS3Client()
+    archive = StoreArchive(client, "bucket")
+    # Left by the file by file sync, and by uploading the store's files as they are
+    client.objects["manifest.json"] = b"{}"
+    client.objects["versions/1/chroma.sqlite3"] = b"sqlite"
+    client.objects["chroma.sqlite3"] = b"sqlite"
+    client.objects["index/data_level0.bin"] = b"index"
+    published = []
+    for content in (b"first", b"second", b"third"):
+        write_store(tmp_path / "store", {"chroma.sqlite3": content})
+        archive.publish(tmp_path / "store")
+        published.append(archive.read_manifest()["archive"])
+
+    assert set(client.objects) == {"store.json", *published[1:]}
+
+
+def test_published_archive_extracts_to_the_store(tmp_path):
+    client = FakeS3Client()
+    files = {"chroma.sqlite3": b"sqlite", "index/data_level0.bin": b"x" * 4000}
+    write_store(tmp_path / "store", files)
+    archive = StoreArchive(client, "bucket")
+    archive.publish(tmp_path / "store")
+
+    archive.extract(archive.read_manifest(), tmp_path / "extracted")
+
+    for name, content in files.items():
+        assert (tmp_path / "extracted" / name).read_bytes() == content
+
+
+def test_archive_is_uploaded_in_concurrent_parts(tmp_path):
+    client = FakeS3Client()
+    write_store(tmp_path / "store", {"chroma.sqlite3": b"sqlite"})
+
+    StoreArchive(client, "bucket", max_workers=3).publish(tmp_path / "store")
+
+    assert client.configs[0].max_concurrency == 3
+    assert client.configs[0].use_threads
@@ -0,0 +1,74 @@
+import asyncio
+import threading
+
+from langchain.embeddings import DeterministicFakeEmbedding
+
+from store_format.cached_embeddings import CachedEmbeddings
+
+
+class CountingEmbeddings(DeterministicFakeEmbedding):
+    requests: list = []
+
+    def embed_documents(self, texts):
+        self.requests.append(list(texts))
+        return super().embed_documents(texts)
+
+
+def test_only_misses_are_requested_in_one_batch():
+    underlying = CountingEmbeddings(size=4, requests=[])
+    embeddings = CachedEmbeddings(underlying, "fake")
+
+    first = embeddings.embed_documents(["a", "b"])
+    second = embeddings.embed_documents(["b", " a ", "c", "c"])
+
+    assert underlying.requests == [["a", "b"], ["c"]]
+    assert second[0] == first[1]
+    assert second[1] == first[0]
+    assert second[2] == second[3]
+
+
+def test_async_query_uses_cache():
+    underlying = CountingEmbeddings(size=4, requests=[])
+    embeddings = CachedEmbeddings(underlying, "fake")
+
+    embeddings.embed_query("question")
+    asyncio.run(embeddings.aembed_query("question"))
+
+    assert underlying.requests == [["question"]]
+
+
+def test_disk_store_survives_restart(tmp_path):
+    cache_file = str(tmp_path / "embeddings.sqlite")
+    underlying = CountingEmbeddings(size=4, requests=[])
+    vector = CachedEmbeddings(underlying, "fake", cache_file=cache_file).embed_query(
+        "question"
+    )
+
+    restarted = CachedEmbeddings(underlying, "fake", cache_file=cache_file)
+
+    assert restarted.embed_query("question") == vector
+    assert underlying.requests == [["question"]]
+    assert restarted.key("question") != CachedEmbeddings(underlying, "other").key(
+        "question"
+    )
+
+
+def test_async_calls_use_the_disk_store_off_the_event_loop(tmp_path):
+    underlying = CountingEmbeddings(size=4, requests=[])
+    embeddings = CachedEmbeddings(
+        underlying, "fake", cache_file=str(tmp_path / "embeddings.sqlite")
+    )
+    threads = []
+    for name in ("get_many", "put_many"):
+        method = getattr(embeddings.store, name)
+
+        def record(*args, method=method):
+            threads.append(threading.get_ident())
+            return method(*args)
+
+        setattr(embeddings.store, name, record)
+
+    asyncio.run(embeddings.aembed_query("question"))
+
+    assert len(threads) == 2
+    assert threading.get_ident() not in threads